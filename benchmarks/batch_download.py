@@ -0,0 +1,137 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compare the latency and the peak memory allocations of fetching the zip file of a TEK Chunk by
+loading the whole mongoengine document (BatchFile.from_index) against the lean projection query
+(fetch_batch_content), for TEK Chunks of different sizes.
+
+The benchmark seeds and then drops a dedicated database, e.g.:
+
+    BENCHMARK_MONGO_URL=mongodb://localhost:27017/immuni-exposure-reporting-benchmark \
+        python -m benchmarks.batch_download --sizes 1000,10000,100000 --iterations 20
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from mongoengine import connect, get_db
+
+from immuni_common.models.enums import TransmissionRiskLevel
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.temporary_exposure_key import TemporaryExposureKey
+from immuni_exposure_reporting.helpers.batches import fetch_batch_content
+from tests.fixtures.batch_file import generate_random_key_data
+
+# Base64-encoded 16-byte keys, as in production.
+_KEY_DATA_LENGTH = 24
+# Rough size of a serialized TEK within the zip file.
+_ZIP_BYTES_PER_KEY = 28
+
+
+def seed_batch(index: int, num_keys: int) -> None:
+    """
+    Create a TEK Chunk with the given number of keys and a zip file of a realistic size.
+    :param index: the index of the TEK Chunk.
+    :param num_keys: the number of keys of the TEK Chunk.
+    """
+    now = datetime.utcnow()
+    rsn = int(now.timestamp() / 600)
+    BatchFile(
+        index=index,
+        keys=[
+            TemporaryExposureKey(
+                key_data=generate_random_key_data(_KEY_DATA_LENGTH),
+                transmission_risk_level=random.choice(list(TransmissionRiskLevel)),
+                rolling_start_number=rsn,
+            )
+            for _ in range(num_keys)
+        ],
+        period_start=now - timedelta(hours=2),
+        period_end=now,
+        origin="IT",
+        client_content=os.urandom(num_keys * _ZIP_BYTES_PER_KEY),
+    ).save()
+
+
+def measure(function: Callable[[], bytes], iterations: int) -> Dict[str, float]:
+    """
+    Measure the mean latency and the peak memory allocations of the given function.
+    :param function: the function to measure.
+    :param iterations: the number of times to run the function.
+    :return: the mean latency (milliseconds) and the peak allocations (bytes).
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(mean_ms=elapsed / iterations * 1000, peak_allocations_bytes=peak)
+
+
+def run(sizes: List[int], iterations: int) -> Dict[int, Dict[str, Dict[str, float]]]:
+    """
+    Seed a TEK Chunk for each of the given sizes and measure both download paths.
+    :param sizes: the numbers of keys of the TEK Chunks to measure.
+    :param iterations: the number of downloads to measure for each TEK Chunk.
+    :return: the measurements, by number of keys and download path.
+    """
+    results = dict()
+    for index, num_keys in enumerate(sizes, start=1):
+        seed_batch(index, num_keys)
+        results[num_keys] = dict(
+            from_index=measure(
+                lambda: BatchFile.from_index(index).client_content,  # pylint: disable=W0640
+                iterations,
+            ),
+            projection=measure(
+                lambda: fetch_batch_content(None, index), iterations  # pylint: disable=W0640
+            ),
+        )
+    return results
+
+
+def main() -> None:
+    """
+    Run the benchmark and print its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[1000]
+    )
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    client = connect(
+        host=os.environ.get(
+            "BENCHMARK_MONGO_URL", "mongodb://localhost:27017/immuni-exposure-reporting-benchmark"
+        )
+    )
+    try:
+        print(json.dumps(run(args.sizes, args.iterations), indent=2))
+    finally:
+        client.drop_database(get_db().name)
+
+
+if __name__ == "__main__":
+    main()
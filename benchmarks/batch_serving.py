@@ -0,0 +1,112 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compare the latency and the peak memory allocations of producing the body of a TEK Chunk download
+from the database (raw(client_content), as served without the mirror) against reading it from the
+on-disk mirror in chunks (as streamed by stream_file), for TEK Chunks of different sizes.
+
+The benchmark seeds and then drops a dedicated database and a temporary mirror directory, e.g.:
+
+    BENCHMARK_MONGO_URL=mongodb://localhost:27017/immuni-exposure-reporting-benchmark \
+        python -m benchmarks.batch_serving --sizes 1000,10000,100000 --iterations 20
+
+For an end-to-end comparison, run benchmarks.concurrent_downloads against the service started with
+and without BATCH_MIRROR_DIRECTORY.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from typing import Dict, List
+
+from mongoengine import connect, get_db
+from sanic.response import raw
+
+from benchmarks.batch_download import measure, seed_batch
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.helpers.batch_mirror import BatchMirror
+from immuni_exposure_reporting.helpers.batches import fetch_batch_content, fetch_batch_source
+
+
+def read_chunks(path: str) -> int:
+    """
+    Read the given file chunk by chunk, as stream_file does.
+    :param path: the path of the file to read.
+    :return: the number of bytes read.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        position = 0
+        while True:
+            chunk = os.pread(fd, config.STREAM_CHUNK_SIZE_IN_BYTES, position)
+            if not chunk:
+                return position
+            position += len(chunk)
+    finally:
+        os.close(fd)
+
+
+def run(
+    sizes: List[int], iterations: int, directory: str
+) -> Dict[int, Dict[str, Dict[str, float]]]:
+    """
+    Seed and mirror a TEK Chunk for each of the given sizes and measure both serving paths.
+    :param sizes: the numbers of keys of the TEK Chunks to measure.
+    :param iterations: the number of downloads to measure for each TEK Chunk.
+    :param directory: the directory of the mirror.
+    :return: the measurements, by number of keys and serving path.
+    """
+    mirror = BatchMirror(directory)
+    results = dict()
+    for index, num_keys in enumerate(sizes, start=1):
+        seed_batch(index, num_keys)
+        _, _, period_end = fetch_batch_source(None, index)
+        mirror.write((None, index), fetch_batch_content(None, index), period_end)
+        path = mirror.path((None, index))
+        results[num_keys] = dict(
+            raw=measure(
+                lambda: raw(fetch_batch_content(None, index)).body,  # pylint: disable=W0640
+                iterations,
+            ),
+            mirror=measure(lambda: read_chunks(path), iterations),  # pylint: disable=W0640
+        )
+    return results
+
+
+def main() -> None:
+    """
+    Run the benchmark and print its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[1000]
+    )
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    client = connect(
+        host=os.environ.get(
+            "BENCHMARK_MONGO_URL", "mongodb://localhost:27017/immuni-exposure-reporting-benchmark"
+        )
+    )
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            print(json.dumps(run(args.sizes, args.iterations, directory), indent=2))
+    finally:
+        client.drop_database(get_db().name)
+
+
+if __name__ == "__main__":
+    main()
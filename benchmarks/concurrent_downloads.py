@@ -0,0 +1,136 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measure the latency of TEK Chunk downloads under concurrency, against a running instance of the
+Exposure Reporting Service (e.g., the one started by docker-compose).
+
+Run it against the service before and after a change to compare the latency percentiles, e.g.:
+
+    python -m benchmarks.concurrent_downloads --base-url http://localhost:5000 \
+        --indexes 1-14 --concurrency 200 --requests 5000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List, Optional, Tuple
+
+from aiohttp import ClientSession, TCPConnector
+
+from benchmarks.stats import summarize_latencies
+
+
+def parse_indexes(value: str) -> List[int]:
+    """
+    Parse an inclusive range of indexes in the "<first>-<last>" format.
+    :param value: the range to parse.
+    :return: the list of indexes in the range.
+    """
+    first, _, last = value.partition("-")
+    return list(range(int(first), int(last or first) + 1))
+
+
+def batch_url(base_url: str, index: int, country: Optional[str]) -> str:
+    """
+    Build the URL of the TEK Chunk with the given index.
+    :param base_url: the base URL of the service.
+    :param index: the index of the TEK Chunk.
+    :param country: the country of the TEK Chunk, if an EU one.
+    :return: the URL of the TEK Chunk.
+    """
+    if country is None:
+        return f"{base_url}/v1/keys/{index}"
+    return f"{base_url}/v1/keys/eu/{country}/{index}"
+
+
+async def _worker(
+    session: ClientSession, urls: "asyncio.Queue[str]", latencies: List[float], errors: List[int]
+) -> None:
+    while True:
+        try:
+            url = urls.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        start = time.perf_counter()
+        async with session.get(url) as response:
+            await response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def download(
+    urls: List[str], concurrency: int, requests: int
+) -> Tuple[List[float], List[int], float]:
+    """
+    Download the given URLs in a round-robin fashion, with the given concurrency.
+    :param urls: the URLs to download.
+    :param concurrency: the number of concurrent clients.
+    :param requests: the total number of requests to perform.
+    :return: the latencies of the successful requests, the status codes of the failed ones and
+      the wall-clock duration of the run.
+    """
+    queue: "asyncio.Queue[str]" = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(urls[i % len(urls)])
+    latencies: List[float] = []
+    errors: List[int] = []
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(_worker(session, queue, latencies, errors) for _ in range(concurrency))
+        )
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+async def run(
+    base_url: str, indexes: List[int], country: Optional[str], concurrency: int, requests: int
+) -> Tuple[List[float], List[int], float]:
+    """
+    Download the given TEK Chunks in a round-robin fashion, with the given concurrency.
+    :param base_url: the base URL of the service.
+    :param indexes: the indexes of the TEK Chunks to download.
+    :param country: the country of the TEK Chunks, if EU ones.
+    :param concurrency: the number of concurrent clients.
+    :param requests: the total number of requests to perform.
+    :return: the latencies of the successful requests, the status codes of the failed ones and
+      the wall-clock duration of the run.
+    """
+    urls = [batch_url(base_url, index, country) for index in indexes]
+    return await download(urls, concurrency, requests)
+
+
+def main() -> None:
+    """
+    Run the benchmark and print its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--indexes", type=parse_indexes, default=parse_indexes("1-14"))
+    parser.add_argument("--country", default=None)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    latencies, errors, elapsed = asyncio.run(
+        run(args.base_url, args.indexes, args.country, args.concurrency, args.requests)
+    )
+    print(json.dumps(dict(errors=len(errors), **summarize_latencies(latencies, elapsed)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
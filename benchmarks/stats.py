@@ -0,0 +1,46 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import math
+from typing import Dict, List
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Compute the given percentile of the given values, using the nearest-rank method.
+    :param values: the values to compute the percentile of.
+    :param percent: the percentile to compute, between 0 and 100.
+    :return: the computed percentile, or 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize_latencies(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """
+    Summarize the given request latencies.
+    :param latencies: the latencies of the completed requests, in seconds.
+    :param elapsed: the wall-clock duration of the whole run, in seconds.
+    :return: the throughput (requests per second) and the latency percentiles (milliseconds).
+    """
+    return dict(
+        requests=len(latencies),
+        throughput=len(latencies) / elapsed if elapsed else 0.0,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p90_ms=percentile(latencies, 90) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        max_ms=max(latencies, default=0.0) * 1000,
+    )
@@ -5,17 +5,25 @@ API_HOST=0.0.0.0
 API_PORT=${API_PORT:-5000}
 API_WORKERS=${API_WORKERS:-3}
 API_WORKER_MAX_REQUESTS=${API_WORKER_MAX_REQUESTS:-10000}
+API_PRELOAD=""
+if [ "${WARMUP_MODE:-disabled}" = "preload" ]; then
+    API_PRELOAD="--preload"  # Import the app once in the master, shared by the workers.
+fi
 
 case "$1" in
     api) poetry run gunicorn immuni_exposure_reporting.sanic:sanic_app \
             --access-logfile='-' \
             --bind=${API_HOST}:${API_PORT} \
+            --config=python:immuni_exposure_reporting.gunicorn_config \
             --logger-class=immuni_common.helpers.logging.CustomGunicornLogger \
             --max-requests=${API_WORKER_MAX_REQUESTS} \
+            ${API_PRELOAD} \
             --workers=${API_WORKERS} \
             --worker-class=immuni_common.uvicorn.ImmuniUvicornWorker ;;
+    export) poetry run export --output="${EXPORT_OUTPUT_DIRECTORY}" \
+            --interval="${EXPORT_INTERVAL_IN_SECONDS:-60}" ;;
     debug) echo "Running in debug mode ..." \
             && tail -f /dev/null ;;  # Allow entering the container to inspect the environment.
-    *) echo "Received unknown command $1 (allowed: api)"
+    *) echo "Received unknown command $1 (allowed: api, export)"
        exit 2 ;;
 esac
@@ -11,14 +11,17 @@
 #    You should have received a copy of the GNU Affero General Public License
 #    along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
+import os
 from datetime import timedelta
+from functools import partial
 from http import HTTPStatus
+from typing import Dict, Optional
 
 from mongoengine import DoesNotExist
 from sanic import Blueprint
 from sanic.request import Request
-from sanic.response import HTTPResponse, raw
-from sanic_openapi import doc
+from sanic.response import HTTPResponse, StreamingHTTPResponse, raw
 
 from immuni_common.core.exceptions import (
     BatchNotFoundException,
@@ -26,20 +29,215 @@ from immuni_common.core.exceptions import (
     SchemaValidationException,
 )
 from immuni_common.helpers.cache import cache
-from immuni_common.helpers.sanic import json_response
-from immuni_common.helpers.swagger import doc_exception
-from immuni_common.models.mongoengine.batch_file import BatchFile
-from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
 from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.exceptions import RangeNotSatisfiableException
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers.batches import (
+    BATCH_FRAME_HEADER,
+    BatchSource,
+    get_batch_content,
+)
+from immuni_exposure_reporting.helpers.chunked_content import ChunkedContent, open_chunked_content
+from immuni_exposure_reporting.helpers.http import etag_matches, parse_range
+from immuni_exposure_reporting.helpers.openapi import doc, doc_exception
+from immuni_exposure_reporting.helpers.responses import (
+    stream_content,
+    stream_file,
+    stream_reader,
+    stream_response,
+    write_content,
+    write_reader,
+)
 from immuni_exposure_reporting.helpers.validation import (
     validate_batch_country,
     validate_batch_index,
+    validate_batch_range,
 )
-from immuni_exposure_reporting.models.swagger import Index
+from immuni_exposure_reporting.models.swagger import DeltaIndex, EuIndex, GroupedIndex, Index
+from immuni_exposure_reporting.monitoring.api import BATCH_LOOKUPS_SHORT_CIRCUITED
 
 bp = Blueprint("keys", url_prefix="keys")
 
 
+async def _batch_response(request: Request, country: Optional[str], index: int) -> HTTPResponse:
+    """
+    Build the response serving the given TEK Chunk, honoring the If-None-Match, Range and If-Range
+    headers.
+    Conditional requests for TEK Chunks whose digest is already known are answered without
+    loading their zip file. TEK Chunks available in the on-disk mirror or stored in GridFS are
+    streamed from there, while the others are served from memory, with partial content as a view
+    over the zip file, either in one piece or streamed if BATCH_RESPONSE_STREAMING is enabled.
+    :param request: the HTTP request object.
+    :param country: the country of the TEK Chunk, or None for the national ones.
+    :param index: the index of the TEK Chunk.
+    :return: the TEK Chunk's zip file (or the requested range of it), or an empty response if the
+      client already holds it or requested a range that cannot be satisfied.
+    :raises: BatchNotFoundException if the TEK Chunk is known not to be available.
+    :raises: DoesNotExist if the TEK Chunk does not exist.
+    """
+    if managers.manifest_store.is_missing(country, index):
+        BATCH_LOOKUPS_SHORT_CIRCUITED.inc()
+        raise BatchNotFoundException()
+    key = (country, index)
+    content = None
+    digest = managers.batch_cache.get_digest(key)
+    if digest is None:
+        content = await get_batch_content(country, index)
+        digest = managers.batch_cache.get_digest(key)
+    headers = {"Accept-Ranges": "bytes", "ETag": f'"{digest}"'}
+    if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return HTTPResponse(status=HTTPStatus.NOT_MODIFIED.value, headers=headers)
+
+    mirror = managers.batch_mirror
+    # Opened before committing the response, so that a zip file removed by a concurrent cleanup
+    # falls back to the database rather than failing the response midway.
+    file = None if content is not None or mirror is None else mirror.open(key)
+    if file is not None:
+        size = os.fstat(file.fileno()).st_size
+    else:
+        source = content if content is not None else await get_batch_content(country, index)
+        size = source.length if isinstance(source, ChunkedContent) else len(source)
+
+    start, end, status = 0, size - 1, HTTPStatus.OK.value
+    if request.headers.get("If-Range", headers["ETag"]) == headers["ETag"]:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except RangeNotSatisfiableException:
+            if file is not None:
+                file.close()
+            headers["Content-Range"] = f"bytes */{size}"
+            return HTTPResponse(
+                status=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.value, headers=headers
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            status = HTTPStatus.PARTIAL_CONTENT.value
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    if file is not None:
+        return stream_file(
+            request,
+            file,
+            start,
+            end,
+            content_type="application/zip",
+            headers=headers,
+            status=status,
+        )
+    if isinstance(source, ChunkedContent):
+        return stream_reader(
+            request,
+            partial(open_chunked_content, source.file_id),
+            start,
+            end,
+            content_type="application/zip",
+            headers=headers,
+            status=status,
+        )
+    if config.BATCH_RESPONSE_STREAMING:
+        return stream_content(
+            request,
+            source,
+            start,
+            end,
+            content_type="application/zip",
+            headers=headers,
+            status=status,
+        )
+    if status == HTTPStatus.PARTIAL_CONTENT.value:
+        source = memoryview(source)[start : end + 1]
+    return raw(source, status=status, headers=headers, content_type="application/zip")
+
+
+async def _batches_response(
+    request: Request, country: Optional[str], first: int, last: int
+) -> HTTPResponse:
+    """
+    Build the response streaming the given range of TEK Chunks, one frame at a time.
+    Each frame is made of the header described by BATCH_FRAME_HEADER, followed by the TEK Chunk's
+    zip file, itself written in chunks.
+    All the TEK Chunks within the range must be available. The ones listed by the index of the
+    manifest snapshot are only loaded as they are written, while the others (e.g., created since
+    the snapshot) are loaded before committing the response, as for single TEK Chunk downloads.
+    The Content-Length header is set from their sizes, so that a response cut short (e.g., if a
+    TEK Chunk fails to load midway) is never taken for a complete one, nor cached.
+    :param request: the HTTP request object.
+    :param country: the country of the TEK Chunks, or None for the national ones.
+    :param first: the index of the first TEK Chunk to stream.
+    :param last: the index of the last TEK Chunk to stream, inclusive.
+    :return: the streaming response.
+    :raises: NoBatchesException if there are no relevant TEK Chunks for the given country.
+    :raises: BatchNotFoundException if any TEK Chunk within the range is not available.
+    """
+    store = managers.manifest_store
+    await store.get(country)
+    sizes = store.get_sizes(country, first, last)
+    unlisted = [index for index in range(first, last + 1) if index not in sizes]
+    if any(store.is_missing(country, index) for index in unlisted):
+        BATCH_LOOKUPS_SHORT_CIRCUITED.inc()
+        raise BatchNotFoundException()
+    try:
+        loaded = await asyncio.gather(*(get_batch_content(country, index) for index in unlisted))
+    except DoesNotExist as error:
+        raise BatchNotFoundException() from error
+    sources: Dict[int, BatchSource] = dict(zip(unlisted, loaded))
+    for index, source in sources.items():
+        sizes[index] = source.length if isinstance(source, ChunkedContent) else len(source)
+
+    async def _write_batches(response: StreamingHTTPResponse) -> None:
+        for index in range(first, last + 1):
+            source = sources.pop(index, None)
+            if source is None:
+                source = await get_batch_content(country, index)
+            if isinstance(source, ChunkedContent):
+                await response.write(BATCH_FRAME_HEADER.pack(index, source.length))
+                await write_reader(
+                    response,
+                    partial(open_chunked_content, source.file_id),
+                    start=0,
+                    end=source.length - 1,
+                )
+                continue
+            await response.write(BATCH_FRAME_HEADER.pack(index, len(source)))
+            await write_content(response, source, start=0, end=len(source) - 1)
+
+    length = sum(BATCH_FRAME_HEADER.size + size for size in sizes.values())
+    return stream_response(
+        request,
+        _write_batches,
+        content_type="application/octet-stream",
+        headers={"Content-Length": str(length)},
+    )
+
+
+_RANGE_DESCRIPTION = (
+    "The indexes of the first and last TEK Chunks to download are passed through the `from` and "
+    "`to` query parameters, and at most {max_batches} TEK Chunks can be requested at once. "
+    "The response body is the sequence of all the TEK Chunks in the range, by increasing index, "
+    "and no response body is returned if any of them is not available. Each TEK Chunk is preceded "
+    "by its index (unsigned, 8 bytes) and by the size of its zip file (unsigned, 4 bytes), both "
+    "big-endian."
+).format(max_batches=config.MAX_BATCHES_PER_RANGE_REQUEST)
+
+
+_SINCE_DESCRIPTION = (
+    "The Mobile Client can then download the listed TEK Chunks in parallel, skipping the ones it "
+    "already holds (as identified by their digest, which is also their ETag)."
+)
+_SINCE_RESPONSE_DESCRIPTION = (
+    "The indexes of the oldest relevant and newest available TEK Chunks, and the metadata of the "
+    "relevant TEK Chunks following the provided index."
+)
+_GROUPED_DESCRIPTION = (
+    "Batches split into sub-batches share their period and sub-batch count, so that the Mobile "
+    "Client can download the TEK Chunks of a batch in parallel and know when it is complete."
+)
+_GROUPED_RESPONSE_DESCRIPTION = (
+    "The indexes of the oldest relevant and newest available TEK Chunks, and the relevant TEK "
+    "Chunks grouped by logical batch."
+)
+
+
 @bp.route("/index", version=1, methods=["GET"])
 @doc.summary("Fetch TEK Chunk indexes (caller: Mobile Client).")
 @doc.description(
@@ -62,8 +260,79 @@ async def index(request: Request) -> HTTPResponse:
     :param request: the HTTP request object.
     :return: the indexes of the oldest relevant and newest available TEK Chunks.
     """
-    indexes = BatchFile.get_oldest_and_newest_indexes(days=config.MANIFEST_LENGTH_IN_DAYS)
-    return json_response(indexes)
+    manifest = await managers.manifest_store.get(None)
+    return raw(manifest.body, content_type="application/json")
+
+
+@bp.route("/index", version=2, methods=["GET"])
+@doc.summary("Fetch TEK Chunk indexes grouped by batch (caller: Mobile Client).")
+@doc.description(
+    "Return the index of the oldest relevant TEK Chunk (no older than 14 days) and the index of "
+    "the newest available TEK Chunk, together with the relevant TEK Chunks grouped by logical "
+    "batch. " + _GROUPED_DESCRIPTION
+)
+@doc_exception(NoBatchesException)
+@doc.response(HTTPStatus.OK.value, GroupedIndex, description=_GROUPED_RESPONSE_DESCRIPTION)
+@cache(max_age=timedelta(minutes=config.MANIFEST_CACHE_TIME_IN_MINUTES))
+async def index_grouped(request: Request) -> HTTPResponse:
+    """
+    Return the relevant TEK Chunks grouped by logical batch.
+    :param request: the HTTP request object.
+    :return: the grouped manifest listing the relevant TEK Chunks.
+    """
+    body = await managers.manifest_store.get_grouped(None)
+    return raw(body, content_type="application/json")
+
+
+@bp.route("/range", version=1, methods=["GET"])
+@doc.summary("Download a range of TEK Chunks (caller: Mobile Client).")
+@doc.description(
+    "Given a range of TEK Chunk indexes, the Mobile Client downloads the associated TEK Chunks "
+    "from the Exposure Reporting Service with a single request. " + _RANGE_DESCRIPTION
+)
+@doc_exception(SchemaValidationException)
+@doc_exception(NoBatchesException)
+@doc_exception(BatchNotFoundException)
+@doc.produces(None, content_type="application/octet-stream")
+@doc.response(
+    HTTPStatus.OK.value,
+    None,
+    description="The TEK Chunks' zip files associated with the provided range of indexes.",
+)
+@cache(max_age=timedelta(days=config.SINGLE_BATCH_CACHE_TIME_IN_DAYS))
+async def get_batches(request: Request) -> HTTPResponse:
+    """
+    Fetch a range of TEK Chunks, streamed one after the other within the same response.
+    :param request: the HTTP request object.
+    :return: the TEK Chunks' zip files associated with the provided range of indexes.
+    :raises: BatchNotFoundException if any TEK Chunk within the range is not available.
+    """
+    first, last = validate_batch_range(request.args.get("from"), request.args.get("to"))
+    return await _batches_response(request, None, first, last)
+
+
+@bp.route("/since/<batch_index>", version=1, methods=["GET"])
+@doc.summary("Fetch the TEK Chunks created since a known one (caller: Mobile Client).")
+@doc.description(
+    "Given the index of the last TEK Chunk known by the Mobile Client (0 if none), return the "
+    "relevant TEK Chunks following it with their size, digest and sub-batch information, together "
+    "with the indexes of the oldest relevant and newest available TEK Chunks. " + _SINCE_DESCRIPTION
+)
+@doc_exception(SchemaValidationException)
+@doc_exception(NoBatchesException)
+@doc.response(HTTPStatus.OK.value, DeltaIndex, description=_SINCE_RESPONSE_DESCRIPTION)
+@cache(max_age=timedelta(minutes=config.MANIFEST_CACHE_TIME_IN_MINUTES))
+async def index_since(request: Request, batch_index: str) -> HTTPResponse:
+    """
+    Return the relevant TEK Chunks following the given one, with their metadata.
+    :param request: the HTTP request object.
+    :param batch_index: the index of the last TEK Chunk known by the Mobile Client.
+    :return: the delta manifest listing the relevant TEK Chunks following the given one.
+    """
+    body = await managers.manifest_store.get_since(
+        None, validate_batch_index(batch_index, minimum=0)
+    )
+    return raw(body, content_type="application/json")
 
 
 @bp.route("/<batch_index>", version=1, methods=["GET"])
@@ -80,6 +349,21 @@ async def index(request: Request) -> HTTPResponse:
     None,
     description="The TEK Chunk's zip file associated with the provided index.",
 )
+@doc.response(
+    HTTPStatus.PARTIAL_CONTENT.value,
+    None,
+    description="The range of the TEK Chunk's zip file requested through the Range header.",
+)
+@doc.response(
+    HTTPStatus.NOT_MODIFIED.value,
+    None,
+    description="The TEK Chunk matches the ETag provided in the If-None-Match header.",
+)
+@doc.response(
+    HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.value,
+    None,
+    description="The range requested through the Range header is beyond the TEK Chunk's zip file.",
+)
 @cache(max_age=timedelta(days=config.SINGLE_BATCH_CACHE_TIME_IN_DAYS))
 async def get_batch(request: Request, batch_index: str) -> HTTPResponse:
     """
@@ -90,10 +374,34 @@ async def get_batch(request: Request, batch_index: str) -> HTTPResponse:
     :raises: BatchNotFoundException if the index is not associated with any TEK Chunk.
     """
     try:
-        batch = BatchFile.from_index(validate_batch_index(batch_index))
+        return await _batch_response(request, None, validate_batch_index(batch_index))
     except DoesNotExist as error:
         raise BatchNotFoundException() from error
-    return raw(batch.client_content, content_type="application/zip")
+
+
+@bp.route("/eu/index", version=1, methods=["GET"])
+@doc.summary("Fetch TEK Chunk indexes for all the countries (caller: Mobile Client).")
+@doc.description(
+    "For each country with relevant TEK Chunks, return the index of the oldest relevant TEK Chunk "
+    "(no older than 14 days) and the index of the newest available TEK Chunk. "
+    "It is up to the Mobile Client not to download the same TEK Chunk more than once."
+)
+@doc_exception(NoBatchesException)
+@doc.response(
+    HTTPStatus.OK.value,
+    EuIndex,
+    description="For each country, the index of the oldest relevant TEK Chunk (no older than 14 "
+    "days) and the index of the newest available TEK Chunk.",
+)
+@cache(max_age=timedelta(minutes=config.MANIFEST_CACHE_TIME_IN_MINUTES))
+async def index_eu_all(request: Request) -> HTTPResponse:
+    """
+    For each country with relevant TEK Chunks, return the index of the oldest relevant TEK Chunk
+    (no older than 14 days) and the index of the newest available TEK Chunk.
+    :param request: the HTTP request object.
+    :return: the indexes of the oldest relevant and newest available TEK Chunks, by country.
+    """
+    return raw(await managers.manifest_store.get_eu(), content_type="application/json")
 
 
 @bp.route("/eu/<batch_country>/index", version=1, methods=["GET"])
@@ -120,10 +428,93 @@ async def index_eu(request: Request, batch_country: str) -> HTTPResponse:
     :param batch_country: the country of interest.
     :return: the indexes of the oldest relevant and newest available TEK Chunks.
     """
-    indexes = BatchFileEu.get_oldest_and_newest_indexes(
-        country=validate_batch_country(batch_country), days=config.MANIFEST_LENGTH_IN_DAYS
+    manifest = await managers.manifest_store.get(validate_batch_country(batch_country))
+    return raw(manifest.body, content_type="application/json")
+
+
+@bp.route("/eu/<batch_country>/index", version=2, methods=["GET"])
+@doc.summary(
+    "Fetch TEK Chunk indexes grouped by batch for the selected country (caller: Mobile Client)."
+)
+@doc.description(
+    "For the requested country, return the index of the oldest relevant TEK Chunk "
+    "(no older than 14 days) and the index of the newest available TEK Chunk, together with the "
+    "relevant TEK Chunks grouped by logical batch. " + _GROUPED_DESCRIPTION
+)
+@doc_exception(SchemaValidationException)
+@doc_exception(NoBatchesException)
+@doc.response(HTTPStatus.OK.value, GroupedIndex, description=_GROUPED_RESPONSE_DESCRIPTION)
+@cache(max_age=timedelta(minutes=config.MANIFEST_CACHE_TIME_IN_MINUTES))
+async def index_grouped_eu(request: Request, batch_country: str) -> HTTPResponse:
+    """
+    Return the relevant TEK Chunks of the requested country grouped by logical batch.
+    :param request: the HTTP request object.
+    :param batch_country: the country of interest.
+    :return: the grouped manifest listing the relevant TEK Chunks.
+    """
+    body = await managers.manifest_store.get_grouped(validate_batch_country(batch_country))
+    return raw(body, content_type="application/json")
+
+
+@bp.route("/eu/<batch_country>/range", version=1, methods=["GET"])
+@doc.summary("Download a range of TEK Chunks for the requested country (caller: Mobile Client).")
+@doc.description(
+    "Given a TEK Chunk country and a range of TEK Chunk indexes, the Mobile Client downloads the "
+    "associated TEK Chunks from the Exposure Reporting Service with a single request. "
+    + _RANGE_DESCRIPTION
+)
+@doc_exception(SchemaValidationException)
+@doc_exception(NoBatchesException)
+@doc_exception(BatchNotFoundException)
+@doc.produces(None, content_type="application/octet-stream")
+@doc.response(
+    HTTPStatus.OK.value,
+    None,
+    description="The TEK Chunks' zip files associated with the provided range of indexes.",
+)
+@cache(max_age=timedelta(days=config.SINGLE_BATCH_CACHE_TIME_IN_DAYS))
+async def get_batches_eu(request: Request, batch_country: str) -> HTTPResponse:
+    """
+    Fetch a range of TEK Chunks for the requested country, streamed one after the other within the
+    same response.
+    :param request: the HTTP request object.
+    :param batch_country: the country of interest.
+    :return: the TEK Chunks' zip files associated with the provided range of indexes.
+    :raises: BatchNotFoundException if any TEK Chunk within the range is not available.
+    """
+    country = validate_batch_country(batch_country)
+    first, last = validate_batch_range(request.args.get("from"), request.args.get("to"))
+    return await _batches_response(request, country, first, last)
+
+
+@bp.route("/eu/<batch_country>/since/<batch_index>", version=1, methods=["GET"])
+@doc.summary(
+    "Fetch the TEK Chunks created since a known one for the requested country "
+    "(caller: Mobile Client)."
+)
+@doc.description(
+    "Given a TEK Chunk country and the index of the last TEK Chunk of that country known by the "
+    "Mobile Client (0 if none), return the relevant TEK Chunks following it with their size, "
+    "digest and sub-batch information, together with the indexes of the oldest relevant and "
+    "newest available TEK Chunks. " + _SINCE_DESCRIPTION
+)
+@doc_exception(SchemaValidationException)
+@doc_exception(NoBatchesException)
+@doc.response(HTTPStatus.OK.value, DeltaIndex, description=_SINCE_RESPONSE_DESCRIPTION)
+@cache(max_age=timedelta(minutes=config.MANIFEST_CACHE_TIME_IN_MINUTES))
+async def index_since_eu(request: Request, batch_country: str, batch_index: str) -> HTTPResponse:
+    """
+    Return the relevant TEK Chunks of the requested country following the given one, with their
+    metadata.
+    :param request: the HTTP request object.
+    :param batch_country: the country of interest.
+    :param batch_index: the index of the last TEK Chunk known by the Mobile Client.
+    :return: the delta manifest listing the relevant TEK Chunks following the given one.
+    """
+    body = await managers.manifest_store.get_since(
+        validate_batch_country(batch_country), validate_batch_index(batch_index, minimum=0)
     )
-    return json_response(indexes)
+    return raw(body, content_type="application/json")
 
 
 @bp.route("/eu/<batch_country>/<batch_index>", version=1, methods=["GET"])
@@ -140,6 +531,21 @@ async def index_eu(request: Request, batch_country: str) -> HTTPResponse:
     None,
     description="The TEK Chunk's zip file associated with the provided index.",
 )
+@doc.response(
+    HTTPStatus.PARTIAL_CONTENT.value,
+    None,
+    description="The range of the TEK Chunk's zip file requested through the Range header.",
+)
+@doc.response(
+    HTTPStatus.NOT_MODIFIED.value,
+    None,
+    description="The TEK Chunk matches the ETag provided in the If-None-Match header.",
+)
+@doc.response(
+    HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.value,
+    None,
+    description="The range requested through the Range header is beyond the TEK Chunk's zip file.",
+)
 @cache(max_age=timedelta(days=config.SINGLE_BATCH_CACHE_TIME_IN_DAYS))
 async def get_batch_eu(request: Request, batch_country: str, batch_index: str) -> HTTPResponse:
     """
@@ -151,9 +557,8 @@ async def get_batch_eu(request: Request, batch_country: str, batch_index: str) -
     :raises: BatchNotFoundException if the index is not associated with any TEK Chunk.
     """
     try:
-        batch = BatchFileEu.from_index(
-            country=validate_batch_country(batch_country), index=validate_batch_index(batch_index)
+        return await _batch_response(
+            request, validate_batch_country(batch_country), validate_batch_index(batch_index)
         )
     except DoesNotExist as error:
         raise BatchNotFoundException() from error
-    return raw(batch.client_content, content_type="application/zip")
@@ -13,13 +13,88 @@
 
 from decouple import config
 
+from immuni_exposure_reporting.models.enums import WarmupMode
+
 EXPOSURE_MONGO_URL = config(
     "EXPOSURE_MONGO_URL", default="mongodb://localhost:27017/immuni-exposure-reporting-dev"
 )
 
 MANIFEST_LENGTH_IN_DAYS = config("MANIFEST_LENGTH_IN_DAYS", cast=int, default=14)
 MANIFEST_CACHE_TIME_IN_MINUTES = config("MANIFEST_CACHE_TIME_IN_MINUTES", cast=int, default=30)
+MANIFEST_REFRESH_INTERVAL_IN_SECONDS = config(
+    "MANIFEST_REFRESH_INTERVAL_IN_SECONDS", cast=int, default=60
+)
+# Refreshes only fetch the TEK Chunks following the newest known one. A full refresh, rebuilding
+# the manifests from scratch, periodically picks up the TEK Chunks committed out of index order.
+MANIFEST_FULL_REFRESH_INTERVAL_IN_SECONDS = config(
+    "MANIFEST_FULL_REFRESH_INTERVAL_IN_SECONDS", cast=int, default=10 * 60
+)
+BATCH_WATCH_POLL_INTERVAL_IN_SECONDS = config(
+    "BATCH_WATCH_POLL_INTERVAL_IN_SECONDS", cast=int, default=5
+)
 SINGLE_BATCH_CACHE_TIME_IN_DAYS = config("SINGLE_BATCH_CACHE_TIME_IN_DAYS", cast=int, default=15)
+MAX_BATCHES_PER_RANGE_REQUEST = config("MAX_BATCHES_PER_RANGE_REQUEST", cast=int, default=100)
+
+MONGO_EXECUTOR_MAX_WORKERS = config("MONGO_EXECUTOR_MAX_WORKERS", cast=int, default=10)
+MONGO_MAX_POOL_SIZE = config("MONGO_MAX_POOL_SIZE", cast=int, default=100)
+MONGO_MIN_POOL_SIZE = config("MONGO_MIN_POOL_SIZE", cast=int, default=0)
+# Zero means waiting for a pooled connection indefinitely.
+MONGO_WAIT_QUEUE_TIMEOUT_IN_MILLISECONDS = config(
+    "MONGO_WAIT_QUEUE_TIMEOUT_IN_MILLISECONDS", cast=int, default=0
+)
+MONGO_SERVER_SELECTION_TIMEOUT_IN_MILLISECONDS = config(
+    "MONGO_SERVER_SELECTION_TIMEOUT_IN_MILLISECONDS", cast=int, default=30000
+)
+# The service only reads TEK Chunks, which tolerate slight staleness, so they can be read from
+# secondaries (e.g., with "secondaryPreferred"). -1 means no maximum staleness.
+MONGO_READ_PREFERENCE = config("MONGO_READ_PREFERENCE", default="primary")
+MONGO_MAX_STALENESS_IN_SECONDS = config("MONGO_MAX_STALENESS_IN_SECONDS", cast=int, default=-1)
+
+BATCH_CACHE_MAX_SIZE_IN_BYTES = config(
+    "BATCH_CACHE_MAX_SIZE_IN_BYTES", cast=int, default=128 * 1024 * 1024
+)
+# Path of the file, in a memory-backed filesystem, of the TEK Chunk store shared by the workers of
+# the same host. If empty, each worker keeps its own in-memory cache instead.
+SHARED_BATCH_STORE_PATH = config("SHARED_BATCH_STORE_PATH", default="")
+SHARED_BATCH_STORE_SIZE_IN_BYTES = config(
+    "SHARED_BATCH_STORE_SIZE_IN_BYTES", cast=int, default=512 * 1024 * 1024
+)
+# Directory of the local on-disk mirror of the TEK Chunks' zip files. If empty, there is no mirror.
+BATCH_MIRROR_DIRECTORY = config("BATCH_MIRROR_DIRECTORY", default="")
+BATCH_MIRROR_CLEANUP_INTERVAL_IN_SECONDS = config(
+    "BATCH_MIRROR_CLEANUP_INTERVAL_IN_SECONDS", cast=int, default=60 * 60
+)
+# Name of the GridFS bucket holding the zip files of the TEK Chunks stored in chunks, i.e., whose
+# documents reference a GridFS file instead of embedding client_content. If empty, all the zip
+# files are expected to be embedded.
+BATCH_GRIDFS_BUCKET = config("BATCH_GRIDFS_BUCKET", default="")
+# Whether the TEK Chunks served from memory (i.e., fetched from MongoDB or cached) are streamed in
+# chunks, each written once the previous one has been sent, rather than written in one piece. The
+# TEK Chunks served from the on-disk mirror or from GridFS are always streamed.
+BATCH_RESPONSE_STREAMING = config("BATCH_RESPONSE_STREAMING", cast=bool, default=False)
+STREAM_CHUNK_SIZE_IN_BYTES = config("STREAM_CHUNK_SIZE_IN_BYTES", cast=int, default=64 * 1024)
+WARMUP_MODE = config("WARMUP_MODE", cast=WarmupMode, default=WarmupMode.DISABLED.value)
+# The TEK Chunks preloaded by the gunicorn master are only used by the workers forked within this
+# time, so that workers recycled later load the TEK Chunks of the current manifest window instead.
+WARMUP_PRELOAD_MAX_AGE_IN_SECONDS = config(
+    "WARMUP_PRELOAD_MAX_AGE_IN_SECONDS", cast=int, default=60 * 60
+)
+
+# Whether workers take a profile when receiving SIGUSR2, and whether they take one at startup.
+PROFILER_SIGNAL_ENABLED = config("PROFILER_SIGNAL_ENABLED", cast=bool, default=False)
+PROFILER_ON_STARTUP = config("PROFILER_ON_STARTUP", cast=bool, default=False)
+PROFILER_DURATION_IN_SECONDS = config("PROFILER_DURATION_IN_SECONDS", cast=int, default=30)
+PROFILER_INTERVAL_IN_MILLISECONDS = config(
+    "PROFILER_INTERVAL_IN_MILLISECONDS", cast=int, default=10
+)
+PROFILER_DIRECTORY = config("PROFILER_DIRECTORY", default="/tmp")
+
+# Whether the routes are documented through sanic_openapi. Production workers can disable it, so
+# that route specs are neither recorded nor built on each (re)start, and no Swagger UI is served.
+OPENAPI_ENABLED = config("OPENAPI_ENABLED", cast=bool, default=True)
+# The maximum time a worker may take to import the service, create the app and run its server start
+# listeners, as measured by immuni_exposure_reporting.startup.
+STARTUP_BUDGET_IN_SECONDS = config("STARTUP_BUDGET_IN_SECONDS", cast=float, default=5.0)
 
 APP_BUNDLE_ID = config("APP_BUNDLE_ID", default="it.ministerodellasalute.immuni")
 ANDROID_PACKAGE = config("ANDROID_PACKAGE", default="org.immuni.android")
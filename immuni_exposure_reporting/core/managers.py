@@ -11,14 +11,43 @@
 #    You should have received a copy of the GNU Affero General Public License
 #    along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Union
 
 from mongoengine import connect
 from pymongo import MongoClient
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
 
 from immuni_common.core.exceptions import ImmuniException
 from immuni_common.core.managers import BaseManagers
 from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.helpers.batch_cache import BatchCache
+from immuni_exposure_reporting.helpers.batch_mirror import BatchMirror
+from immuni_exposure_reporting.helpers.batch_watcher import BatchWatcher
+from immuni_exposure_reporting.helpers.manifest import ManifestStore
+from immuni_exposure_reporting.helpers.shared_batch_store import SharedBatchStore
+from immuni_exposure_reporting.monitoring.mongo import PoolCheckoutListener
+
+
+def mongo_client_options() -> Dict[str, Any]:
+    """
+    Build the options of the MongoDB client from the configuration: the connection pool bounds
+    and timeouts, the read preference and the pool listener measuring checkout wait times.
+    :return: the keyword arguments of the MongoDB client.
+    """
+    return dict(
+        maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+        minPoolSize=config.MONGO_MIN_POOL_SIZE,
+        waitQueueTimeoutMS=config.MONGO_WAIT_QUEUE_TIMEOUT_IN_MILLISECONDS or None,
+        serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_IN_MILLISECONDS,
+        read_preference=make_read_preference(
+            read_pref_mode_from_name(config.MONGO_READ_PREFERENCE),
+            tag_sets=None,
+            max_staleness=config.MONGO_MAX_STALENESS_IN_SECONDS,
+        ),
+        event_listeners=[PoolCheckoutListener()],
+    )
 
 
 class Managers(BaseManagers):
@@ -27,6 +56,13 @@ class Managers(BaseManagers):
     """
 
     _exposure_mongo: Optional[MongoClient] = None
+    _mongo_executor: Optional[ThreadPoolExecutor] = None
+    _batch_cache: Optional[Union[BatchCache, SharedBatchStore]] = None
+    _batch_mirror: Optional[BatchMirror] = None
+    _batch_mirror_cleanup: Optional[asyncio.Task] = None
+    _manifest_store: Optional[ManifestStore] = None
+    _manifest_refresh: Optional[asyncio.Task] = None
+    _batch_watch: Optional[asyncio.Task] = None
 
     @property
     def exposure_mongo(self) -> MongoClient:
@@ -39,18 +75,89 @@ class Managers(BaseManagers):
             raise ImmuniException("Cannot use the MongoDB manager before initializing it.")
         return self._exposure_mongo
 
+    @property
+    def mongo_executor(self) -> ThreadPoolExecutor:
+        """
+        Return the bounded executor running the blocking MongoDB queries off the event loop.
+        :return: the bounded executor running the blocking MongoDB queries.
+        :raise: ImmuniException if the manager is not initialized.
+        """
+        if self._mongo_executor is None:
+            raise ImmuniException("Cannot use the MongoDB executor before initializing it.")
+        return self._mongo_executor
+
+    @property
+    def batch_cache(self) -> Union[BatchCache, SharedBatchStore]:
+        """
+        Return the cache of the TEK Chunks' zip files, either private or shared across workers.
+        :return: the cache of the TEK Chunks' zip files.
+        :raise: ImmuniException if the manager is not initialized.
+        """
+        if self._batch_cache is None:
+            raise ImmuniException("Cannot use the TEK Chunk cache before initializing it.")
+        return self._batch_cache
+
+    @property
+    def batch_mirror(self) -> Optional[BatchMirror]:
+        """
+        Return the local on-disk mirror of the TEK Chunks' zip files, if enabled.
+        :return: the local on-disk mirror of the TEK Chunks' zip files, or None if disabled.
+        """
+        return self._batch_mirror
+
+    @property
+    def manifest_store(self) -> ManifestStore:
+        """
+        Return the store of the manifest snapshots, refreshed in background.
+        :return: the store of the manifest snapshots.
+        :raise: ImmuniException if the manager is not initialized.
+        """
+        if self._manifest_store is None:
+            raise ImmuniException("Cannot use the manifest store before initializing it.")
+        return self._manifest_store
+
     async def initialize(self) -> None:
         """
         Initialize managers on demand.
         """
         await super().initialize()
-        self._exposure_mongo = connect(host=config.EXPOSURE_MONGO_URL)
+        self._exposure_mongo = connect(host=config.EXPOSURE_MONGO_URL, **mongo_client_options())
+        self._mongo_executor = ThreadPoolExecutor(
+            max_workers=config.MONGO_EXECUTOR_MAX_WORKERS, thread_name_prefix="mongo"
+        )
+        if config.SHARED_BATCH_STORE_PATH:
+            self._batch_cache = SharedBatchStore(
+                path=config.SHARED_BATCH_STORE_PATH,
+                max_size=config.SHARED_BATCH_STORE_SIZE_IN_BYTES,
+            )
+        else:
+            self._batch_cache = BatchCache(max_size=config.BATCH_CACHE_MAX_SIZE_IN_BYTES)
+        if config.BATCH_MIRROR_DIRECTORY:
+            self._batch_mirror = BatchMirror(directory=config.BATCH_MIRROR_DIRECTORY)
+            self._batch_mirror_cleanup = asyncio.create_task(self._batch_mirror.run())
+        self._manifest_store = ManifestStore(executor=self._mongo_executor)
+        self._manifest_refresh = asyncio.create_task(self._manifest_store.run())
+        self._batch_watch = asyncio.create_task(
+            BatchWatcher(store=self._manifest_store, executor=self._mongo_executor).run()
+        )
 
     async def teardown(self) -> None:
         """
         Perform teardown actions (e.g., close open connections.)
         """
         await super().teardown()
+        for task in (self._batch_watch, self._manifest_refresh):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self._batch_mirror_cleanup is not None:
+            self._batch_mirror_cleanup.cancel()
+            await asyncio.gather(self._batch_mirror_cleanup, return_exceptions=True)
+        if self._mongo_executor is not None:
+            # Wait for the running queries before closing the client, without blocking the loop.
+            await asyncio.get_running_loop().run_in_executor(None, self._mongo_executor.shutdown)
+        if isinstance(self._batch_cache, SharedBatchStore):
+            self._batch_cache.close()
         if self._exposure_mongo is not None:
             self._exposure_mongo.close()
 
@@ -0,0 +1,300 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Static export of the API tree served by the Exposure Reporting Service, so that its immutable TEK
+Chunks and small manifests can be served by a CDN or a plain web server (e.g., nginx).
+
+The manifests and TEK Chunks are written to the output directory at the same paths as the API
+serves them (e.g., v1/keys/index, v2/keys/index, v1/keys/since/<index>, v1/keys/<index>,
+v1/keys/eu/<country>/<index>), each together with a "<path>.headers.json" sidecar holding the
+response headers to serve it with, all from the same manifest snapshots the service serves.
+Range downloads take their bounds as query parameters, so they are written in aligned blocks of
+MAX_BATCHES_PER_RANGE_REQUEST TEK Chunks at v1/keys/range/<from>-<to> instead, for the web server
+to serve the matching "range?from=<from>&to=<to>" requests from (e.g., through a rewrite).
+Exports are incremental: only new TEK Chunks are written, the TEK Chunks leaving the manifest
+window and the EU countries with no relevant TEK Chunks left are removed, and files are atomically
+replaced, so that the tree can be served while being updated, e.g.:
+
+    python -m immuni_exposure_reporting.export --output /var/www/exposure --interval 60
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from mongoengine import DoesNotExist, connect
+
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import mongo_client_options
+from immuni_exposure_reporting.helpers.batches import BATCH_FRAME_HEADER, fetch_batch_content
+from immuni_exposure_reporting.helpers.http import compute_digest
+from immuni_exposure_reporting.helpers.manifest import (
+    Manifest,
+    ManifestStore,
+    serialize_eu_manifests,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+HEADERS_SUFFIX = ".headers.json"
+
+_MANIFEST_MAX_AGE = timedelta(minutes=config.MANIFEST_CACHE_TIME_IN_MINUTES)
+_BATCH_MAX_AGE = timedelta(days=config.SINGLE_BATCH_CACHE_TIME_IN_DAYS)
+
+_SINCE_DIRECTORY = "since"
+_RANGE_DIRECTORY = "range"
+
+
+def _cache_control(max_age: timedelta) -> str:
+    return f"public, max-age={int(max_age.total_seconds())}"
+
+
+def write_file(path: str, content: bytes, headers: Dict[str, str]) -> None:
+    """
+    Atomically write the given file and its headers sidecar. The sidecar is written first, so that
+    the file is never served without it.
+    :param path: the path of the file.
+    :param content: the content of the file.
+    :param headers: the response headers to serve the file with.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for target, data in (
+        (f"{path}{HEADERS_SUFFIX}", json.dumps(headers, sort_keys=True).encode()),
+        (path, content),
+    ):
+        temporary_path = f"{target}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, target)
+
+
+def _write_manifest(path: str, body: bytes) -> None:
+    write_file(
+        path,
+        body,
+        {"Content-Type": "application/json", "Cache-Control": _cache_control(_MANIFEST_MAX_AGE)},
+    )
+
+
+def _keys_directory(output: str, version: str, country: Optional[str]) -> str:
+    return os.path.join(output, version, "keys", *(() if country is None else ("eu", country)))
+
+
+def _prune(directory: str, keep: Callable[[str], bool]) -> None:
+    """
+    Remove the files of the given directory, together with their headers sidecars, whose name is
+    not to be kept. Subdirectories are left untouched.
+    :param directory: the directory to prune, if it exists.
+    :param keep: the function telling whether the file with the given name is to be kept.
+    """
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        name = filename[: -len(HEADERS_SUFFIX)] if filename.endswith(HEADERS_SUFFIX) else filename
+        if not os.path.isdir(path) and not keep(name):
+            os.remove(path)
+
+
+async def _export_since(directory: str, country: Optional[str], store: ManifestStore) -> None:
+    """
+    Export the delta manifests of the given country following each TEK Chunk of the manifest
+    window, removing the ones of the TEK Chunks that left it.
+    Since any index preceding the oldest relevant TEK Chunk yields the same delta manifest, only
+    the one following index 0 (i.e., no known TEK Chunk) and the one right before the window are
+    exported among them.
+    :param directory: the directory of the API tree of the country.
+    :param country: the country of interest, or None for the national TEK Chunks.
+    :param store: the manifest store.
+    """
+    manifest = await store.get(country)
+    indexes = {0, *range(max(manifest.oldest - 1, 0), manifest.newest + 1)}
+    since_directory = os.path.join(directory, _SINCE_DIRECTORY)
+    for index in indexes:
+        _write_manifest(
+            os.path.join(since_directory, str(index)), await store.get_since(country, index)
+        )
+    _prune(since_directory, lambda name: name.isdigit() and int(name) in indexes)
+
+
+def _export_ranges(directory: str, manifest: Manifest, written: Set[int]) -> None:
+    """
+    Export the range downloads of the TEK Chunks of the manifest window, in aligned blocks of
+    MAX_BATCHES_PER_RANGE_REQUEST TEK Chunks, written at "range/<from>-<to>" and built from the
+    exported TEK Chunks. The last block ends at the newest TEK Chunk.
+    Blocks are only rewritten if new, if any of their TEK Chunks was just written, or if at either
+    end of the window. The blocks that left the window, or were superseded by a longer one, are
+    removed.
+    :param directory: the directory of the API tree of the country.
+    :param manifest: the manifest of the country.
+    :param written: the indexes of the TEK Chunks just written.
+    """
+    size = config.MAX_BATCHES_PER_RANGE_REQUEST
+    range_directory = os.path.join(directory, _RANGE_DIRECTORY)
+    first_block, last_block = manifest.oldest // size, manifest.newest // size
+    updated_blocks = {index // size for index in written} | {first_block, last_block}
+    names = set()
+    for block in range(first_block, last_block + 1):
+        first, last = block * size, min((block + 1) * size - 1, manifest.newest)
+        name = f"{first}-{last}"
+        names.add(name)
+        path = os.path.join(range_directory, name)
+        if block not in updated_blocks and os.path.exists(path):
+            continue
+        frames = []
+        for index in range(max(first, manifest.oldest), last + 1):
+            try:
+                with open(os.path.join(directory, str(index)), "rb") as file:
+                    content = file.read()
+            except FileNotFoundError:
+                continue
+            frames.append(BATCH_FRAME_HEADER.pack(index, len(content)) + content)
+        write_file(
+            path,
+            b"".join(frames),
+            {
+                "Content-Type": "application/octet-stream",
+                "Cache-Control": _cache_control(_BATCH_MAX_AGE),
+            },
+        )
+    _prune(range_directory, lambda name: name in names)
+
+
+async def export_country(output: str, country: Optional[str], store: ManifestStore) -> int:
+    """
+    Export the manifests and the new TEK Chunks of the given country, from the snapshot of the
+    given manifest store, removing the TEK Chunks that left the manifest window.
+    :param output: the output directory.
+    :param country: the country of interest, or None for the national TEK Chunks.
+    :param store: the manifest store, holding a snapshot of the country.
+    :return: the number of written TEK Chunks.
+    """
+    manifest = await store.get(country)
+    directory = _keys_directory(output, "v1", country)
+    written = set()
+    for index in range(manifest.oldest, manifest.newest + 1):
+        path = os.path.join(directory, str(index))
+        if os.path.exists(path):
+            continue
+        try:
+            content = fetch_batch_content(country, index)
+        except DoesNotExist:
+            continue
+        write_file(
+            path,
+            content,
+            {
+                "Content-Type": "application/zip",
+                "Cache-Control": _cache_control(_BATCH_MAX_AGE),
+                "ETag": f'"{compute_digest(content)}"',
+            },
+        )
+        written.add(index)
+    _write_manifest(os.path.join(directory, "index"), manifest.body)
+    _write_manifest(
+        os.path.join(_keys_directory(output, "v2", country), "index"),
+        await store.get_grouped(country),
+    )
+    await _export_since(directory, country, store)
+    _export_ranges(directory, manifest, written)
+
+    _prune(directory, lambda name: not name.isdigit() or int(name) >= manifest.oldest)
+    return len(written)
+
+
+def _prune_eu(output: str, countries: Iterable[str]) -> None:
+    """
+    Remove the API trees of the EU countries no longer having relevant TEK Chunks, and the EU
+    manifest if none has any.
+    :param output: the output directory.
+    :param countries: the EU countries having relevant TEK Chunks.
+    """
+    countries = set(countries)
+    for version in ("v1", "v2"):
+        eu_directory = os.path.join(output, version, "keys", "eu")
+        if not os.path.isdir(eu_directory):
+            continue
+        for country in os.listdir(eu_directory):
+            path = os.path.join(eu_directory, country)
+            if os.path.isdir(path) and country not in countries:
+                shutil.rmtree(path)
+    if not countries:
+        _prune(os.path.join(output, "v1", "keys", "eu"), lambda name: name != "index")
+
+
+async def export(output: str, store: ManifestStore) -> Dict[str, int]:
+    """
+    Refresh the given manifest store, the same way the service refreshes its snapshots, and export
+    the manifests and the new TEK Chunks of all countries to the given directory, removing the ones
+    of the EU countries no longer having relevant TEK Chunks.
+    :param output: the output directory.
+    :param store: the manifest store, kept across exports so that they refresh it incrementally.
+    :return: the number of written TEK Chunks, by country ("national" for the national ones).
+    """
+    await store.refresh(full=store.full_refresh_due)
+    written = dict()
+    if store.get_snapshot(None) is None:
+        _LOGGER.warning("No national TEK Chunks to export.")
+    else:
+        written["national"] = await export_country(output, None, store)
+
+    eu_manifests = store.eu_manifests
+    for country in eu_manifests:
+        written[country] = await export_country(output, country, store)
+    if eu_manifests:
+        _write_manifest(
+            os.path.join(output, "v1", "keys", "eu", "index"), serialize_eu_manifests(eu_manifests)
+        )
+    _prune_eu(output, eu_manifests)
+    return written
+
+
+def main() -> None:
+    """
+    Export the API tree once, or periodically if an interval is given.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--output", required=True, help="the output directory")
+    parser.add_argument(
+        "--interval", type=int, default=None, help="export every given number of seconds"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    connect(host=config.EXPOSURE_MONGO_URL, **mongo_client_options())
+    store = ManifestStore(executor=ThreadPoolExecutor(max_workers=1))
+    loop = asyncio.new_event_loop()
+    while True:
+        start = time.monotonic()
+        written = loop.run_until_complete(export(args.output, store))
+        _LOGGER.info(
+            "Export completed.",
+            extra=dict(written=written, duration_in_seconds=round(time.monotonic() - start, 3)),
+        )
+        if args.interval is None:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Hooks of the gunicorn master running the Exposure Reporting Service, loaded with:
+
+    gunicorn --config=python:immuni_exposure_reporting.gunicorn_config ...
+
+Gunicorn reads the module-level names matching its settings, so the service's configuration is
+imported under another name than "config".
+"""
+
+import threading
+from typing import Any
+
+from immuni_exposure_reporting.core import config as service_config
+from immuni_exposure_reporting.helpers.warmup import preload_batches, release_preloaded_batches
+from immuni_exposure_reporting.models.enums import WarmupMode
+
+
+def when_ready(server: Any) -> None:  # pylint: disable=unused-argument
+    """
+    Preload the TEK Chunks in the gunicorn master if WARMUP_MODE is "preload", once the master is
+    ready and before it forks the workers, so that the workers share them copy-on-write.
+    Loading them here rather than when importing the app keeps them out of any other process
+    importing it (e.g., tests and tools), and makes them available even without --preload.
+    The master releases its copy after WARMUP_PRELOAD_MAX_AGE_IN_SECONDS, since the workers forked
+    later (e.g., recycled after max requests) load the TEK Chunks themselves instead, so that its
+    memory is not held for the whole life of the master. The forked workers do not inherit the
+    timer thread, and keep their copy until warmed up.
+    :param server: the gunicorn arbiter.
+    """
+    if service_config.WARMUP_MODE == WarmupMode.PRELOAD:
+        preload_batches()
+        timer = threading.Timer(
+            service_config.WARMUP_PRELOAD_MAX_AGE_IN_SECONDS, release_preloaded_batches
+        )
+        timer.daemon = True
+        timer.start()
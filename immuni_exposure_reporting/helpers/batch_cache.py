@@ -0,0 +1,192 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+from immuni_exposure_reporting.helpers.chunked_content import ChunkedContent
+from immuni_exposure_reporting.monitoring.api import (
+    BATCH_CACHE_EVICTIONS,
+    BATCH_CACHE_HITS,
+    BATCH_CACHE_MISSES,
+)
+
+# A TEK Chunk is identified by its country (None for the national ones) and its index.
+BatchKey = Tuple[Optional[str], int]
+# The zip file of a TEK Chunk, possibly as a view over memory shared with other processes.
+BatchContent = Union[bytes, memoryview]
+
+# The maximum number of digests kept, far more than the TEK Chunks within the manifest window.
+MAX_DIGESTS = 64 * 1024
+
+
+class DigestCache:
+    """
+    LRU cache of the digests of the TEK Chunks' zip files, bounded by number of entries, together
+    with the description of the GridFS file of the ones stored in chunks.
+    """
+
+    def __init__(self, max_entries: int = MAX_DIGESTS) -> None:
+        """
+        :param max_entries: the maximum number of cached digests.
+        """
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[BatchKey, Tuple[str, Optional[ChunkedContent]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, key: BatchKey) -> Optional[Tuple[str, Optional[ChunkedContent]]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: BatchKey) -> Optional[str]:
+        """
+        Retrieve the digest of the zip file of the given TEK Chunk, marking it as the most recently
+        used.
+        :param key: the country and index of the TEK Chunk.
+        :return: the digest of the zip file of the TEK Chunk, or None if not cached.
+        """
+        entry = self._get(key)
+        return None if entry is None else entry[0]
+
+    def get_chunked(self, key: BatchKey) -> Optional[ChunkedContent]:
+        """
+        Retrieve the description of the GridFS file of the given TEK Chunk, marking it as the most
+        recently used.
+        :param key: the country and index of the TEK Chunk.
+        :return: the description of the GridFS file, or None if not cached or not stored in chunks.
+        """
+        entry = self._get(key)
+        return None if entry is None else entry[1]
+
+    def put(self, key: BatchKey, digest: str, chunked: Optional[ChunkedContent] = None) -> None:
+        """
+        Cache the digest of the zip file of the given TEK Chunk, and the description of its GridFS
+        file if stored in chunks, evicting the least recently used one if needed.
+        :param key: the country and index of the TEK Chunk.
+        :param digest: the digest of the zip file of the TEK Chunk.
+        :param chunked: the description of the GridFS file of the TEK Chunk, if stored in chunks.
+        """
+        self._entries[key] = (digest, chunked)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+
+class BatchCache:
+    """
+    Memory-bounded LRU cache of the TEK Chunks' zip files.
+    TEK Chunks never change once created, so cached entries never need to be invalidated. They are
+    only evicted, least recently used first, whenever the overall size exceeds the limit.
+    The digests of the zip files are tiny, so they are kept even after their zip files have been
+    evicted, to answer conditional requests without loading the zip files again, up to MAX_DIGESTS.
+    So are the descriptions of the GridFS files of the zip files stored in chunks, which are never
+    cached themselves.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        :param max_size: the maximum overall size of the cached zip files, in bytes.
+        """
+        self._max_size = max_size
+        self._size = 0
+        self._entries: "OrderedDict[BatchKey, bytes]" = OrderedDict()
+        self._digests = DigestCache()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """
+        Return the overall size of the cached zip files.
+        :return: the overall size of the cached zip files, in bytes.
+        """
+        return self._size
+
+    def get(self, key: BatchKey) -> Optional[bytes]:
+        """
+        Retrieve the zip file of the given TEK Chunk, marking it as the most recently used.
+        :param key: the country and index of the TEK Chunk.
+        :return: the zip file of the TEK Chunk, or None if not cached.
+        """
+        content = self._entries.get(key)
+        if content is None:
+            self.misses += 1
+            BATCH_CACHE_MISSES.inc()
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        BATCH_CACHE_HITS.inc()
+        return content
+
+    def get_digest(self, key: BatchKey) -> Optional[str]:
+        """
+        Retrieve the digest of the zip file of the given TEK Chunk.
+        :param key: the country and index of the TEK Chunk.
+        :return: the digest of the zip file of the TEK Chunk, or None if unknown.
+        """
+        return self._digests.get(key)
+
+    def put_digest(self, key: BatchKey, digest: str) -> None:
+        """
+        Store the digest of the zip file of the given TEK Chunk, without its zip file.
+        :param key: the country and index of the TEK Chunk.
+        :param digest: the digest of the zip file of the TEK Chunk.
+        """
+        self._digests.put(key, digest)
+
+    def get_chunked(self, key: BatchKey) -> Optional[ChunkedContent]:
+        """
+        Retrieve the description of the GridFS file of the given TEK Chunk stored in chunks.
+        :param key: the country and index of the TEK Chunk.
+        :return: the description of the GridFS file, or None if unknown.
+        """
+        return self._digests.get_chunked(key)
+
+    def put_chunked(self, key: BatchKey, chunked: ChunkedContent) -> None:
+        """
+        Store the description of the GridFS file of the given TEK Chunk stored in chunks, together
+        with its digest, so that it is streamed without querying the database again.
+        :param key: the country and index of the TEK Chunk.
+        :param chunked: the description of the GridFS file of the TEK Chunk.
+        """
+        self._digests.put(key, chunked.digest, chunked)
+
+    def put(self, key: BatchKey, content: bytes, digest: str) -> None:
+        """
+        Cache the zip file of the given TEK Chunk, evicting the least recently used ones if needed.
+        Zip files larger than the whole cache are not cached, but their digest is.
+        :param key: the country and index of the TEK Chunk.
+        :param content: the zip file of the TEK Chunk.
+        :param digest: the digest of the zip file of the TEK Chunk.
+        """
+        self._digests.put(key, digest)
+        if len(content) > self._max_size:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = content
+        self._size += len(content)
+        while self._size > self._max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+            BATCH_CACHE_EVICTIONS.inc()
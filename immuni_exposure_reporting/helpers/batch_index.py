@@ -0,0 +1,100 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from immuni_exposure_reporting.helpers.catalog import BatchEntry
+
+
+def _timestamp(moment: datetime) -> float:
+    # Datetimes are stored by MongoDB as naive UTC ones.
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class BatchIndex:
+    """
+    A compact index of the relevant TEK Chunks of a country, sorted by index, updated incrementally
+    as TEK Chunks are created and leave the manifest window.
+    Only the index, the end of the period and the size of each TEK Chunk are kept, in parallel
+    arrays, so that the oldest relevant TEK Chunk, the newest one and whether a TEK Chunk exists
+    are all found with a binary search, as are the TEK Chunks within a range and their size.
+    The end of the period is stored as the running maximum over the preceding TEK Chunks, so that
+    it is sorted even if periods are not, and the first TEK Chunk whose period ends within the
+    window can be found with a binary search as well.
+    """
+
+    def __init__(self) -> None:
+        self._indexes: "array[int]" = array("q")
+        self._period_ends: "array[float]" = array("d")
+        self._sizes: "array[int]" = array("Q")
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __contains__(self, index: int) -> bool:
+        position = bisect_left(self._indexes, index)
+        return position < len(self._indexes) and self._indexes[position] == index
+
+    @property
+    def newest(self) -> Optional[int]:
+        """
+        Return the index of the newest TEK Chunk in the index.
+        :return: the index of the newest TEK Chunk, or None if the index is empty.
+        """
+        return self._indexes[-1] if self._indexes else None
+
+    def oldest(self, since: datetime) -> Optional[int]:
+        """
+        Return the index of the oldest TEK Chunk whose period ends at or after the given time.
+        :param since: the start of the window of interest, as a naive UTC datetime.
+        :return: the index of the oldest TEK Chunk within the window, or None if there is none.
+        """
+        position = bisect_left(self._period_ends, _timestamp(since))
+        return self._indexes[position] if position < len(self._indexes) else None
+
+    def between(self, first: int, last: int) -> Dict[int, int]:
+        """
+        Return the sizes of the zip files of the TEK Chunks within the given range.
+        :param first: the index of the first TEK Chunk of the range.
+        :param last: the index of the last TEK Chunk of the range, inclusive.
+        :return: the sizes of the zip files of the TEK Chunks within the range, by index.
+        """
+        start = bisect_left(self._indexes, first)
+        end = bisect_left(self._indexes, last + 1)
+        return dict(zip(self._indexes[start:end], self._sizes[start:end]))
+
+    def update(self, entries: Iterable[BatchEntry], since: datetime) -> None:
+        """
+        Add the given entries of new TEK Chunks and drop the ones preceding the oldest TEK Chunk
+        whose period ends at or after the given time, which can never be relevant again.
+        Entries already in the index (e.g., fetched by a concurrent refresh) are ignored.
+        :param entries: the entries of the new TEK Chunks, sorted by index.
+        :param since: the start of the manifest window, as a naive UTC datetime.
+        """
+        newest = self.newest
+        period_end = self._period_ends[-1] if self._period_ends else float("-inf")
+        for entry in entries:
+            if newest is None or entry.index > newest:
+                period_end = max(period_end, _timestamp(entry.period_end))
+                self._indexes.append(entry.index)
+                self._period_ends.append(period_end)
+                self._sizes.append(entry.size)
+                newest = entry.index
+        start = bisect_left(self._period_ends, _timestamp(since))
+        if start:
+            del self._indexes[:start]
+            del self._period_ends[:start]
+            del self._sizes[:start]
@@ -0,0 +1,138 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import BinaryIO, Optional
+
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.helpers.batch_cache import BatchContent, BatchKey
+from immuni_exposure_reporting.helpers.manifest import window_start
+
+_LOGGER = logging.getLogger(__name__)
+
+_NATIONAL_DIRECTORY = "national"
+_TEMPORARY_SUFFIX = ".tmp"
+
+
+def _timestamp(moment: datetime) -> float:
+    # Datetimes are stored by MongoDB as naive UTC ones.
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class BatchMirror:
+    """
+    Local on-disk mirror of the TEK Chunks' zip files, written the first time each of them is
+    fetched from the database.
+    Serving the zip files from disk leaves them in the page cache of the operating system rather
+    than in the memory of the workers, shared by all of them.
+    Each zip file is stamped with the end of the period of its TEK Chunk as modification time, so
+    that it is removed once the TEK Chunk leaves the manifest window (i.e., once its period ends
+    before the start of the window), regardless of when it was mirrored.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        :param directory: the directory of the mirror.
+        """
+        self._directory = directory
+
+    def path(self, key: BatchKey) -> str:
+        """
+        Return the path of the zip file of the given TEK Chunk, i.e.,
+        "<directory>/<country>/<index>.zip", with "national" as the country of the national ones.
+        :param key: the country and index of the TEK Chunk.
+        :return: the path of the zip file of the TEK Chunk.
+        """
+        country, index = key
+        return os.path.join(self._directory, country or _NATIONAL_DIRECTORY, f"{index}.zip")
+
+    def open(self, key: BatchKey) -> Optional[BinaryIO]:
+        """
+        Open the mirrored zip file of the given TEK Chunk for reading. Once open, the zip file can
+        be read in full even if removed by a concurrent cleanup.
+        :param key: the country and index of the TEK Chunk.
+        :return: the unbuffered zip file of the TEK Chunk, or None if not mirrored.
+        """
+        try:
+            return open(self.path(key), "rb", buffering=0)
+        except FileNotFoundError:
+            return None
+
+    def read(self, key: BatchKey) -> Optional[bytes]:
+        """
+        Read the mirrored zip file of the given TEK Chunk.
+        :param key: the country and index of the TEK Chunk.
+        :return: the zip file of the TEK Chunk, or None if not mirrored.
+        """
+        file = self.open(key)
+        if file is None:
+            return None
+        with file:
+            return file.read()
+
+    def write(self, key: BatchKey, content: BatchContent, period_end: datetime) -> None:
+        """
+        Mirror the zip file of the given TEK Chunk. The file is written under a temporary name and
+        then renamed, so that it is never read partially written.
+        :param key: the country and index of the TEK Chunk.
+        :param content: the zip file of the TEK Chunk.
+        :param period_end: the end of the period of the TEK Chunk, as a naive UTC datetime.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}{_TEMPORARY_SUFFIX}"
+        with open(temporary_path, "wb") as file:
+            file.write(content)
+        timestamp = _timestamp(period_end)
+        os.utime(temporary_path, (timestamp, timestamp))
+        os.replace(temporary_path, path)
+
+    def cleanup(self, since: datetime) -> int:
+        """
+        Remove the zip files of the TEK Chunks whose period ends before the given time. The
+        temporary files of the zip files being written are left alone.
+        :param since: the start of the manifest window, as a naive UTC datetime.
+        :return: the number of removed zip files.
+        """
+        threshold = _timestamp(since)
+        removed = 0
+        for directory, _, filenames in os.walk(self._directory):
+            for filename in filenames:
+                if filename.endswith(_TEMPORARY_SUFFIX):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    if os.stat(path).st_mtime < threshold:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        return removed
+
+    async def run(self) -> None:
+        """
+        Remove the zip files of the TEK Chunks outside the manifest window every
+        BATCH_MIRROR_CLEANUP_INTERVAL_IN_SECONDS seconds, until cancelled.
+        """
+        while True:
+            try:
+                removed = await asyncio.get_running_loop().run_in_executor(
+                    None, self.cleanup, window_start()
+                )
+                _LOGGER.info("Cleaned up the TEK Chunk mirror.", extra=dict(removed=removed))
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Failed to clean up the TEK Chunk mirror.")
+            await asyncio.sleep(config.BATCH_MIRROR_CLEANUP_INTERVAL_IN_SECONDS)
@@ -0,0 +1,153 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Dict, List, Optional, Type, Union
+
+from pymongo.change_stream import CollectionChangeStream
+from pymongo.errors import OperationFailure, PyMongoError
+
+from immuni_common.core.exceptions import NoBatchesException
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.helpers.manifest import ManifestStore
+from immuni_exposure_reporting.monitoring.api import MONGO_QUERY_LATENCY
+
+_LOGGER = logging.getLogger(__name__)
+
+_FETCH_NEWEST_INDEXES_LATENCY = MONGO_QUERY_LATENCY.labels(operation="fetch_newest_indexes")
+
+# Maximum time each wait for changes blocks its thread, bounding the time needed to stop watching.
+_MAX_AWAIT_TIME_IN_MILLISECONDS = 1000
+# Only insertions are relevant, and only the origin of the inserted TEK Chunks is needed.
+_PIPELINE = [
+    {"$match": {"operationType": "insert"}},
+    {"$project": {"fullDocument.origin": 1}},
+]
+
+
+@_FETCH_NEWEST_INDEXES_LATENCY.time()
+def fetch_newest_indexes(countries: List[str]) -> Dict[Optional[str], int]:
+    """
+    Fetch the index of the newest TEK Chunk of the national ones and of the given EU countries,
+    each with a query on the (possibly compound) index of the TEK Chunks.
+    :param countries: the EU countries of interest.
+    :return: the index of the newest TEK Chunk, by country (None for the national ones), for the
+      countries having TEK Chunks.
+    """
+    querysets: Dict[Optional[str], Any] = {None: BatchFile.objects}
+    querysets.update({country: BatchFileEu.objects(origin=country) for country in countries})
+    newest = dict()
+    for country, queryset in querysets.items():
+        document = queryset.order_by("-index").only("index").as_pymongo().first()
+        if document is not None:
+            newest[country] = document["index"]
+    return newest
+
+
+class BatchWatcher:
+    """
+    Watcher of the newly inserted TEK Chunks, refreshing the manifest snapshot of the affected
+    country as soon as one is inserted, rather than at the next periodic refresh.
+    MongoDB change streams are used where available (i.e., on replica sets), and a poll of the
+    newest indexes otherwise.
+    """
+
+    def __init__(self, store: ManifestStore, executor: Executor) -> None:
+        """
+        :param store: the store of the manifest snapshots to refresh.
+        :param executor: the executor to run the blocking polling queries in.
+        """
+        self._store = store
+        self._executor = executor
+
+    async def run(self) -> None:
+        """
+        Watch the newly inserted TEK Chunks until cancelled, falling back to polling if change
+        streams are not supported.
+        """
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure:
+                _LOGGER.info("Change streams not available, polling the newest indexes instead.")
+                break
+            except PyMongoError:
+                _LOGGER.exception("Failed to watch the TEK Chunks, retrying.")
+                await asyncio.sleep(config.BATCH_WATCH_POLL_INTERVAL_IN_SECONDS)
+        await self._poll()
+
+    async def _refresh(self, country: Optional[str]) -> None:
+        try:
+            await self._store.refresh_country(country)
+        except NoBatchesException:
+            pass
+
+    async def _watch(self) -> None:
+        loop = asyncio.get_running_loop()
+        streams: List[CollectionChangeStream] = []
+        consumers: List[asyncio.Future] = []
+        try:
+            for document_class in (BatchFile, BatchFileEu):
+                streams.append(await loop.run_in_executor(None, self._open, document_class))
+            consumers = [
+                asyncio.ensure_future(self._consume(stream, eu=stream_index == 1))
+                for stream_index, stream in enumerate(streams)
+            ]
+            done, _ = await asyncio.wait(consumers, return_when=asyncio.FIRST_EXCEPTION)
+            for consumer in done:
+                consumer.result()
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+            for stream in streams:
+                stream.close()
+
+    @staticmethod
+    def _open(document_class: Union[Type[BatchFile], Type[BatchFileEu]]) -> CollectionChangeStream:
+        return document_class._get_collection().watch(  # pylint: disable=protected-access
+            _PIPELINE, max_await_time_ms=_MAX_AWAIT_TIME_IN_MILLISECONDS
+        )
+
+    async def _consume(self, stream: CollectionChangeStream, eu: bool) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Shielded, so that the stream is not closed while the thread is still waiting on it.
+            waiting = loop.run_in_executor(None, stream.try_next)
+            try:
+                change = await asyncio.shield(waiting)
+            except asyncio.CancelledError:
+                await asyncio.wait({waiting})
+                raise
+            if change is not None:
+                await self._refresh(change["fullDocument"]["origin"] if eu else None)
+
+    async def _poll(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                newest_indexes = await loop.run_in_executor(
+                    self._executor, partial(fetch_newest_indexes, self._store.eu_countries)
+                )
+                for country, newest in newest_indexes.items():
+                    snapshot = self._store.get_snapshot(country)
+                    if snapshot is None or snapshot.newest < newest:
+                        await self._refresh(country)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Failed to poll the newest indexes.")
+            await asyncio.sleep(config.BATCH_WATCH_POLL_INTERVAL_IN_SECONDS)
@@ -0,0 +1,172 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import struct
+from datetime import datetime
+from functools import partial
+from typing import Any, Dict, Optional, Tuple, Union
+
+from mongoengine import DoesNotExist
+
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers.batch_cache import BatchContent, BatchKey
+from immuni_exposure_reporting.helpers.chunked_content import (
+    ChunkedContent,
+    describe_chunked_content,
+    get_chunked_file_id,
+    only_with_content,
+    read_document_content,
+)
+from immuni_exposure_reporting.helpers.executor import run_in_executor
+from immuni_exposure_reporting.helpers.http import compute_digest
+from immuni_exposure_reporting.helpers.shared_batch_store import SharedBatchStore
+from immuni_exposure_reporting.helpers.single_flight import SingleFlight
+from immuni_exposure_reporting.monitoring.api import MONGO_QUERY_LATENCY
+
+_FETCH_BATCH_CONTENT_LATENCY = MONGO_QUERY_LATENCY.labels(operation="fetch_batch_content")
+
+# Header of each frame of a multi-batch download: the index of the TEK Chunk (unsigned, 8 bytes)
+# and the size of its zip file (unsigned, 4 bytes), both big-endian. The zip file follows.
+BATCH_FRAME_HEADER = struct.Struct(">QI")
+
+# The zip file of a TEK Chunk, or the GridFS file to stream it from if stored in chunks.
+BatchSource = Union[BatchContent, ChunkedContent]
+
+# The loads of TEK Chunks missing from the cache, shared by concurrent lookups of the same one.
+_batch_loads: SingleFlight[BatchKey, BatchSource] = SingleFlight()
+
+
+@_FETCH_BATCH_CONTENT_LATENCY.time()
+def _fetch_batch_document(country: Optional[str], index: int) -> Dict[str, Any]:
+    if country is None:
+        queryset = BatchFile.objects(index=index)
+    else:
+        queryset = BatchFileEu.objects(origin=country, index=index)
+    document = only_with_content(queryset, "period_end").as_pymongo().first()
+    if document is None:
+        raise DoesNotExist(f"No TEK Chunk with index {index} for country {country}.")
+    return document
+
+
+def fetch_batch_content(country: Optional[str], index: int) -> bytes:
+    """
+    Fetch the zip file of the given TEK Chunk from the database, either embedded in its document or
+    stored in GridFS.
+    The TEKs are not projected and the raw document is not converted into a mongoengine one, so
+    that the (potentially many) TEKs embedded in the TEK Chunk are neither transferred nor decoded.
+    :param country: the country of the TEK Chunk, or None for the national ones.
+    :param index: the index of the TEK Chunk.
+    :return: the zip file of the TEK Chunk.
+    :raises: DoesNotExist if the TEK Chunk does not exist.
+    """
+    return read_document_content(_fetch_batch_document(country, index))
+
+
+def fetch_batch_source(
+    country: Optional[str], index: int, digest: Optional[str] = None
+) -> Tuple[BatchSource, str, datetime]:
+    """
+    Fetch the zip file of the given TEK Chunk from the database if embedded in its document, or the
+    description of the GridFS file to stream it from otherwise, together with its digest and the
+    end of its period.
+    :param country: the country of the TEK Chunk, or None for the national ones.
+    :param index: the index of the TEK Chunk.
+    :param digest: the digest of the zip file, if already known.
+    :return: the zip file or its GridFS file, its digest and the end of its period.
+    :raises: DoesNotExist if the TEK Chunk does not exist.
+    """
+    document = _fetch_batch_document(country, index)
+    file_id = get_chunked_file_id(document)
+    if file_id is None:
+        content = document["client_content"]
+        return content, digest or compute_digest(content), document["period_end"]
+    chunked = describe_chunked_content(file_id, digest)
+    return chunked, chunked.digest, document["period_end"]
+
+
+def _read_batch(
+    country: Optional[str], index: int, digest: Optional[str]
+) -> Tuple[BatchSource, str]:
+    """
+    Read the zip file of the given TEK Chunk from the on-disk mirror (if enabled), or fetch it from
+    the database otherwise, mirroring it unless stored in chunks.
+    :param country: the country of the TEK Chunk, or None for the national ones.
+    :param index: the index of the TEK Chunk.
+    :param digest: the digest of the zip file, if already known.
+    :return: the zip file or its GridFS file, and its digest.
+    :raises: DoesNotExist if the TEK Chunk does not exist.
+    """
+    key = (country, index)
+    mirror = managers.batch_mirror
+    mirrored = None if mirror is None else mirror.read(key)
+    if mirrored is not None:
+        return mirrored, compute_digest(mirrored)
+    source, digest, period_end = fetch_batch_source(country, index, digest)
+    if mirror is not None and not isinstance(source, ChunkedContent):
+        mirror.write(key, source, period_end)
+    return source, digest
+
+
+async def _load_batch(country: Optional[str], index: int) -> BatchSource:
+    key = (country, index)
+    store = managers.batch_cache
+    loop = asyncio.get_running_loop()
+    if isinstance(store, SharedBatchStore):
+        # Waiting for the other workers' loads, rather than for the bounded MongoDB executor.
+        return await loop.run_in_executor(
+            None, store.load, key, partial(_read_batch, country, index, store.get_digest(key))
+        )
+    mirror = managers.batch_mirror
+    mirrored = None if mirror is None else await loop.run_in_executor(None, mirror.read, key)
+    if mirrored is not None:
+        store.put(key, mirrored, compute_digest(mirrored))
+        return mirrored
+    source, digest, period_end = await run_in_executor(
+        fetch_batch_source, country, index, store.get_digest(key)
+    )
+    if isinstance(source, ChunkedContent):
+        # Streamed from GridFS by each request rather than loaded as a whole.
+        store.put_chunked(key, source)
+        return source
+    if mirror is not None:
+        await loop.run_in_executor(None, mirror.write, key, source, period_end)
+    store.put(key, source, digest)
+    return source
+
+
+async def get_batch_content(country: Optional[str], index: int) -> BatchSource:
+    """
+    Retrieve the zip file of the given TEK Chunk, from the cache if available, or from the on-disk
+    mirror (if enabled) or the database otherwise. If not cached, its digest is computed and cached
+    too, and if fetched from the database, the zip file is mirrored.
+    Zip files stored in GridFS are neither cached nor mirrored: the GridFS file to stream them
+    from is returned instead, and only its description (with the digest) is cached.
+    Concurrent lookups of the same TEK Chunk missing from the cache share a single load, and if the
+    cache is shared across workers, the loads of the workers of the same host are serialized, so
+    that each one waits for the others' and only loads the TEK Chunks they did not.
+    :param country: the country of the TEK Chunk, or None for the national ones.
+    :param index: the index of the TEK Chunk.
+    :return: the zip file of the TEK Chunk, or the GridFS file to stream it from.
+    :raises: DoesNotExist if the TEK Chunk does not exist.
+    """
+    key = (country, index)
+    chunked = managers.batch_cache.get_chunked(key)
+    if chunked is not None:
+        return chunked
+    content = managers.batch_cache.get(key)
+    if content is not None:
+        return content
+    return await _batch_loads.run(key, lambda: _load_batch(country, index))
@@ -0,0 +1,299 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mongoengine import QuerySet
+
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
+from immuni_exposure_reporting.helpers.chunked_content import (
+    describe_chunked_content,
+    get_chunked_file_id,
+    only_with_content,
+)
+from immuni_exposure_reporting.helpers.http import compute_digest
+from immuni_exposure_reporting.monitoring.api import MONGO_QUERY_LATENCY
+
+_FETCH_BATCH_ENTRIES_LATENCY = MONGO_QUERY_LATENCY.labels(operation="fetch_batch_entries")
+_FETCH_EU_BATCH_ENTRIES_LATENCY = MONGO_QUERY_LATENCY.labels(operation="fetch_eu_batch_entries")
+
+
+@dataclass(frozen=True)
+class BatchEntry:
+    """
+    The metadata of a TEK Chunk listed by the delta manifest, together with its already serialized
+    JSON representation.
+    """
+
+    index: int
+    size: int
+    digest: str
+    sub_batch_index: Optional[int]
+    sub_batch_count: Optional[int]
+    period_start: datetime
+    period_end: datetime
+    serialized: bytes
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "BatchEntry":
+        """
+        Create the entry of the given raw TEK Chunk document.
+        :param document: the raw TEK Chunk document, with its zip file or its GridFS file.
+        :return: the entry of the TEK Chunk.
+        """
+        file_id = get_chunked_file_id(document)
+        if file_id is None:
+            content = document["client_content"]
+            size, digest = len(content), compute_digest(content)
+        else:
+            chunked = describe_chunked_content(file_id)
+            size, digest = chunked.length, chunked.digest
+        attributes: Dict[str, Any] = dict(
+            index=document["index"],
+            size=size,
+            digest=digest,
+            sub_batch_index=document.get("sub_batch_index"),
+            sub_batch_count=document.get("sub_batch_count"),
+        )
+        return cls(
+            index=attributes["index"],
+            size=size,
+            digest=digest,
+            sub_batch_index=attributes["sub_batch_index"],
+            sub_batch_count=attributes["sub_batch_count"],
+            period_start=document["period_start"],
+            period_end=document["period_end"],
+            serialized=json.dumps(attributes, separators=(",", ":")).encode(),
+        )
+
+    @property
+    def batch_key(self) -> Tuple[datetime, datetime, int]:
+        """
+        Return the key identifying the logical batch of the TEK Chunk, i.e., its period and the
+        number of TEK Chunks the batch is split into, which all its sub-batches share.
+        :return: the key identifying the logical batch of the TEK Chunk.
+        """
+        return self.period_start, self.period_end, self.sub_batch_count or 1
+
+
+def serialize_groups(entries: List[BatchEntry]) -> bytes:
+    """
+    Serialize the given entries grouped by logical batch, each group listing the indexes of the
+    sub-batches of the batch and whether all of them are available.
+    :param entries: the entries of the TEK Chunks, sorted by index.
+    :return: the serialized groups, as the comma-separated items of a JSON list.
+    """
+    groups = []
+    for (period_start, period_end, sub_batch_count), group in groupby(
+        entries, key=lambda entry: entry.batch_key
+    ):
+        indexes = [entry.index for entry in group]
+        groups.append(
+            dict(
+                period_start=period_start.isoformat(),
+                period_end=period_end.isoformat(),
+                sub_batch_count=sub_batch_count,
+                indexes=indexes,
+                complete=len(indexes) == sub_batch_count,
+            )
+        )
+    return b",".join(json.dumps(group, separators=(",", ":")).encode() for group in groups)
+
+
+_ENTRY_FIELDS = ("index", "sub_batch_index", "sub_batch_count", "period_start", "period_end")
+
+# The function returning the already known entry of a raw TEK Chunk document, if any.
+KnownEntry = Callable[[Dict[str, Any]], Optional[BatchEntry]]
+
+
+def _fetch_entries(
+    queryset: QuerySet, fields: Tuple[str, ...], known: Optional[KnownEntry] = None
+) -> List[Tuple[Dict[str, Any], BatchEntry]]:
+    """
+    Fetch the TEK Chunk documents matched by the given queryset, sorted by index, together with
+    their entries.
+    Since TEK Chunks never change once created, the entries already known are reused as they are:
+    if any may be known, only the given fields are fetched at first, and the zip files of the new
+    TEK Chunks alone are then fetched (and hashed) with a second query.
+    :param queryset: the queryset of the TEK Chunk documents.
+    :param fields: the fields to project, in addition to the zip file when needed.
+    :param known: the function returning the already known entry of a TEK Chunk document, if any.
+    :return: the documents, projected on the given fields, together with their entries.
+    """
+    queryset = queryset.order_by("index")
+    if known is None:
+        documents = only_with_content(queryset, *fields).as_pymongo()
+        return [(document, BatchEntry.from_document(document)) for document in documents]
+
+    documents = list(queryset.only("id", *fields).as_pymongo())
+    entries = {document["_id"]: known(document) for document in documents}
+    new_ids = [document_id for document_id, entry in entries.items() if entry is None]
+    if new_ids:
+        new_documents = only_with_content(queryset.filter(id__in=new_ids), *fields).as_pymongo()
+        for document in new_documents:
+            entries[document["_id"]] = BatchEntry.from_document(document)
+    # A TEK Chunk fetched at first but not with its zip file can only be missing from the second
+    # query if deleted in between, in which case it is dropped.
+    fetched = [(document, entries[document["_id"]]) for document in documents]
+    return [(document, entry) for document, entry in fetched if entry is not None]
+
+
+@_FETCH_BATCH_ENTRIES_LATENCY.time()
+def fetch_batch_entries(
+    country: Optional[str],
+    after: int,
+    since: Optional[datetime] = None,
+    known: Optional[Dict[int, BatchEntry]] = None,
+) -> List[BatchEntry]:
+    """
+    Fetch the entries of the TEK Chunks of the given country following the given index.
+    Since TEK Chunks never change once created, only the new ones ever need to be fetched.
+    :param country: the country of interest, or None for the national TEK Chunks.
+    :param after: the index after which to fetch the TEK Chunks.
+    :param since: if given, only fetch the TEK Chunks whose period ends at or after it.
+    :param known: if given, the already known entries by index, reused rather than fetching the zip
+      files of their TEK Chunks again.
+    :return: the entries of the TEK Chunks following the given index, sorted by index.
+    """
+    filters: Dict[str, Any] = dict(index__gt=after)
+    if since is not None:
+        filters.update(period_end__gte=since)
+    if country is None:
+        queryset = BatchFile.objects(**filters)
+    else:
+        queryset = BatchFileEu.objects(origin=country, **filters)
+    known_entry = None if known is None else lambda document: known.get(document["index"])
+    return [entry for _, entry in _fetch_entries(queryset, _ENTRY_FIELDS, known_entry)]
+
+
+@_FETCH_EU_BATCH_ENTRIES_LATENCY.time()
+def fetch_eu_batch_entries(
+    newest: Dict[str, int],
+    since: datetime,
+    known: Optional[Dict[str, Dict[int, BatchEntry]]] = None,
+) -> Dict[str, List[BatchEntry]]:
+    """
+    Fetch the entries of the EU TEK Chunks following the given newest indexes, with a single query
+    for all countries. All the relevant TEK Chunks of countries with no newest index are fetched.
+    :param newest: the index after which to fetch the TEK Chunks, by country.
+    :param since: only fetch the TEK Chunks whose period ends at or after it.
+    :param known: if given, the already known entries by index, by country, reused rather than
+      fetching the zip files of their TEK Chunks again.
+    :return: the entries of the new TEK Chunks sorted by index, by country having any.
+    """
+    conditions: List[Dict[str, Any]] = [
+        {"origin": country, "index": {"$gt": index}} for country, index in newest.items()
+    ]
+    conditions.append({"origin": {"$nin": list(newest)}})
+    queryset = BatchFileEu.objects(__raw__={"$or": conditions, "period_end": {"$gte": since}})
+    known_entry = (
+        None
+        if known is None
+        else lambda document: known.get(document["origin"], {}).get(document["index"])
+    )
+    entries: Dict[str, List[BatchEntry]] = dict()
+    for document, entry in _fetch_entries(queryset, ("origin", *_ENTRY_FIELDS), known_entry):
+        entries.setdefault(document["origin"], []).append(entry)
+    return entries
+
+
+class BatchCatalog:
+    """
+    The entries of the relevant TEK Chunks of a country, sorted by index, updated incrementally as
+    TEK Chunks are created and leave the manifest window.
+    The entries grouped by logical batch are serialized on every update, so that serving them
+    requires no further processing.
+    """
+
+    def __init__(self) -> None:
+        self._entries: List[BatchEntry] = []
+        self._indexes: List[int] = []
+        self._serialized_groups = b""
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def newest(self) -> Optional[int]:
+        """
+        Return the index of the newest TEK Chunk in the catalog.
+        :return: the index of the newest TEK Chunk, or None if the catalog is empty.
+        """
+        return self._indexes[-1] if self._indexes else None
+
+    @property
+    def by_index(self) -> Dict[int, BatchEntry]:
+        """
+        Return the entries in the catalog by index.
+        :return: the entries in the catalog, by index.
+        """
+        return dict(zip(self._indexes, self._entries))
+
+    def update(self, entries: List[BatchEntry], oldest: int) -> None:
+        """
+        Add the given entries of new TEK Chunks and drop the ones older than the given index.
+        Entries already in the catalog (e.g., fetched by a concurrent refresh) are ignored.
+        :param entries: the entries of the new TEK Chunks, sorted by index.
+        :param oldest: the index of the oldest relevant TEK Chunk.
+        """
+        newest = self.newest
+        for entry in entries:
+            if newest is None or entry.index > newest:
+                self._entries.append(entry)
+                self._indexes.append(entry.index)
+                newest = entry.index
+        start = bisect_right(self._indexes, oldest - 1)
+        if start:
+            del self._entries[:start]
+            del self._indexes[:start]
+        self._serialized_groups = serialize_groups(self._entries)
+
+    def since(self, index: int) -> List[BatchEntry]:
+        """
+        Return the entries of the TEK Chunks following the given index.
+        :param index: the index of the last TEK Chunk known by the client.
+        :return: the entries of the TEK Chunks following the given index, sorted by index.
+        """
+        return self._entries[bisect_right(self._indexes, index) :]
+
+    def serialize_since(self, index: int, oldest: int, newest: int) -> bytes:
+        """
+        Serialize the delta manifest listing the TEK Chunks following the given index, from the
+        already serialized entries.
+        :param index: the index of the last TEK Chunk known by the client.
+        :param oldest: the index of the oldest relevant TEK Chunk.
+        :param newest: the index of the newest available TEK Chunk.
+        :return: the serialized delta manifest.
+        """
+        batches = b",".join(entry.serialized for entry in self.since(index))
+        return b'{"oldest":%d,"newest":%d,"batches":[%b]}' % (oldest, newest, batches)
+
+    def serialize_grouped(self, oldest: int, newest: int) -> bytes:
+        """
+        Serialize the grouped manifest listing the relevant TEK Chunks grouped by logical batch,
+        from the groups serialized on the last update.
+        :param oldest: the index of the oldest relevant TEK Chunk.
+        :param newest: the index of the newest available TEK Chunk.
+        :return: the serialized grouped manifest.
+        """
+        return b'{"oldest":%d,"newest":%d,"batches":[%b]}' % (
+            oldest,
+            newest,
+            self._serialized_groups,
+        )
@@ -0,0 +1,119 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from gridfs import GridFSBucket, GridOut
+from mongoengine import QuerySet
+from mongoengine.queryset.field_list import QueryFieldList
+
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_exposure_reporting.core import config
+
+# The field of the TEK Chunk documents referencing the GridFS file holding their zip file, in place
+# of the embedded client_content.
+CHUNKED_CONTENT_FIELD = "client_content_file_id"
+
+
+@dataclass(frozen=True)
+class ChunkedContent:
+    """
+    The zip file of a TEK Chunk stored in GridFS, to be streamed chunk by chunk rather than loaded
+    in memory as a whole.
+    """
+
+    file_id: Any
+    length: int
+    digest: str
+
+
+def get_chunked_file_id(document: Dict[str, Any]) -> Optional[Any]:
+    """
+    Retrieve the GridFS file holding the zip file of the given TEK Chunk document, if any.
+    :param document: the raw TEK Chunk document.
+    :return: the identifier of the GridFS file, or None if the zip file is embedded in the document
+      or the GridFS storage is disabled.
+    """
+    if not config.BATCH_GRIDFS_BUCKET:
+        return None
+    return document.get(CHUNKED_CONTENT_FIELD)
+
+
+def only_with_content(queryset: QuerySet, *fields: str) -> QuerySet:
+    """
+    Project the given fields of the TEK Chunk documents, together with their zip file, either
+    embedded or referenced in GridFS.
+    :param queryset: the queryset of the TEK Chunk documents.
+    :param fields: the fields to project, in addition to the zip file.
+    :return: the projected queryset.
+    """
+    queryset = queryset.only(*fields, "client_content")
+    if config.BATCH_GRIDFS_BUCKET:
+        # The field referencing the GridFS file is not declared in the model, so only() rejects it.
+        queryset._loaded_fields += QueryFieldList(  # pylint: disable=protected-access
+            [CHUNKED_CONTENT_FIELD], value=QueryFieldList.ONLY, _only_called=True
+        )
+    return queryset
+
+
+def open_chunked_content(file_id: Any) -> GridOut:
+    """
+    Open the given GridFS file for reading. The national and EU TEK Chunks share the same bucket.
+    :param file_id: the identifier of the GridFS file.
+    :return: the GridFS file, read chunk by chunk.
+    :raises: NoFile if the GridFS file does not exist.
+    """
+    database = BatchFile._get_db()  # pylint: disable=protected-access
+    return GridFSBucket(database, bucket_name=config.BATCH_GRIDFS_BUCKET).open_download_stream(
+        file_id
+    )
+
+
+def describe_chunked_content(file_id: Any, digest: Optional[str] = None) -> ChunkedContent:
+    """
+    Describe the given GridFS file, computing its digest chunk by chunk if not known yet, so that
+    the zip file is never loaded in memory as a whole.
+    :param file_id: the identifier of the GridFS file.
+    :param digest: the digest of the zip file, if already known.
+    :return: the description of the zip file stored in the GridFS file.
+    :raises: NoFile if the GridFS file does not exist.
+    """
+    stream = open_chunked_content(file_id)
+    try:
+        if digest is None:
+            hasher = hashlib.sha256()
+            for chunk in iter(stream.readchunk, b""):
+                hasher.update(chunk)
+            digest = hasher.hexdigest()
+        return ChunkedContent(file_id=file_id, length=stream.length, digest=digest)
+    finally:
+        stream.close()
+
+
+def read_document_content(document: Dict[str, Any]) -> bytes:
+    """
+    Read the whole zip file of the given TEK Chunk document, either embedded or stored in GridFS.
+    :param document: the raw TEK Chunk document.
+    :return: the zip file of the TEK Chunk.
+    :raises: NoFile if the zip file is stored in a GridFS file that does not exist.
+    """
+    file_id = get_chunked_file_id(document)
+    if file_id is None:
+        return document["client_content"]
+    stream = open_chunked_content(file_id)
+    try:
+        return stream.read()
+    finally:
+        stream.close()
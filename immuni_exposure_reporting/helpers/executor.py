@@ -0,0 +1,35 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+from immuni_exposure_reporting.core.managers import managers
+
+T = TypeVar("T")
+
+
+async def run_in_executor(function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run the given blocking function (e.g., a mongoengine query) in the bounded MongoDB executor,
+    so that the event loop keeps serving other requests while waiting for the database.
+    The number of concurrent queries is bounded by MONGO_EXECUTOR_MAX_WORKERS.
+    :param function: the blocking function to run.
+    :param args: the positional arguments to pass to the function.
+    :param kwargs: the keyword arguments to pass to the function.
+    :return: the value returned by the function.
+    :raises: any exception raised by the function.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(managers.mongo_executor, partial(function, *args, **kwargs))
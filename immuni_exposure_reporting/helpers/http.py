@@ -0,0 +1,83 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import re
+from typing import Optional, Tuple
+
+from immuni_exposure_reporting.core.exceptions import RangeNotSatisfiableException
+
+_BYTE_RANGE_REGEX = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def compute_digest(content: bytes) -> str:
+    """
+    Compute the digest of the given zip file, used as strong ETag of the TEK Chunk.
+    :param content: the zip file of the TEK Chunk.
+    :return: the hex-encoded SHA-256 digest of the zip file.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check whether the given If-None-Match header matches the given entity tag, using the weak
+    comparison function mandated by RFC 7232 for this header.
+    :param if_none_match: the value of the If-None-Match header, if any.
+    :param etag: the (quoted) entity tag of the current representation.
+    :return: True if the header matches the entity tag, False otherwise.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse the given Range header (RFC 7233) against content of the given size.
+    Only a single byte range is supported: headers with other units, multiple ranges or invalid
+    syntax are ignored, as allowed by the RFC, so that the whole content is served.
+    :param range_header: the value of the Range header, if any.
+    :param size: the size of the content, in bytes.
+    :return: the first and last (inclusive) positions of the requested range, or None if the
+      whole content is to be served.
+    :raises: RangeNotSatisfiableException if the requested range does not overlap the content.
+    """
+    if not range_header:
+        return None
+    match = _BYTE_RANGE_REGEX.match(range_header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        suffix_length = int(last)
+        if suffix_length == 0 or size == 0:
+            raise RangeNotSatisfiableException()
+        return max(size - suffix_length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiableException()
+    return start, min(end, size - 1)
@@ -0,0 +1,350 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from immuni_common.core.exceptions import NoBatchesException
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.helpers.batch_index import BatchIndex
+from immuni_exposure_reporting.helpers.catalog import (
+    BatchCatalog,
+    BatchEntry,
+    fetch_batch_entries,
+    fetch_eu_batch_entries,
+)
+from immuni_exposure_reporting.helpers.single_flight import SingleFlight
+
+_LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Manifest:
+    """
+    The indexes of the oldest relevant and newest available TEK Chunks of a country, together with
+    the already serialized response body and the (monotonic) time it was computed at.
+    """
+
+    oldest: int
+    newest: int
+    body: bytes
+    computed_at: float = field(default_factory=time.monotonic, compare=False)
+
+    @classmethod
+    def from_indexes(cls, oldest: int, newest: int) -> "Manifest":
+        """
+        Create a manifest from the given indexes, serializing its response body.
+        :param oldest: the index of the oldest relevant TEK Chunk.
+        :param newest: the index of the newest available TEK Chunk.
+        :return: the manifest.
+        """
+        body = json.dumps(dict(oldest=oldest, newest=newest), separators=(",", ":"))
+        return cls(oldest=oldest, newest=newest, body=body.encode())
+
+
+def window_start() -> datetime:
+    """
+    Return the start of the manifest window, i.e., the time the period of the oldest relevant TEK
+    Chunk ends at or after.
+    :return: the start of the manifest window, as a naive UTC datetime.
+    """
+    return datetime.utcnow() - timedelta(days=config.MANIFEST_LENGTH_IN_DAYS)
+
+
+def serialize_eu_manifests(manifests: Dict[str, Manifest]) -> bytes:
+    """
+    Serialize the response body listing the manifests of all the given EU countries.
+    :param manifests: the manifests of the EU countries, by country.
+    :return: the serialized response body.
+    """
+    body = json.dumps(
+        {
+            country: dict(oldest=manifest.oldest, newest=manifest.newest)
+            for country, manifest in sorted(manifests.items())
+        },
+        separators=(",", ":"),
+    )
+    return body.encode()
+
+
+class ManifestStore:
+    """
+    Snapshots of the manifests of every country, recomputed in background on a fixed interval so
+    that serving a manifest requires neither database access nor serialization.
+    The manifests are computed from the compact index of the relevant TEK Chunks of each country,
+    which also answers whether a TEK Chunk exists. Periodic refreshes only fetch the TEK Chunks
+    following the newest known one, and add them to the index, to the catalog of the country and to
+    the grouped manifest listing them by logical batch. Every few refreshes, all of them are rebuilt
+    from scratch instead, so that the TEK Chunks committed out of index order are picked up too.
+    Since TEK Chunks never change once created, rebuilds reuse the entries already in the catalogs,
+    only fetching (and hashing) the zip files of the TEK Chunks not known yet.
+    Concurrent refreshes of the same country (e.g., by requests finding no snapshot) share a single
+    one.
+    """
+
+    def __init__(self, executor: Executor) -> None:
+        """
+        :param executor: the executor to run the blocking database queries in.
+        """
+        self._executor = executor
+        self._manifests: Dict[Optional[str], Manifest] = dict()
+        self._batch_indexes: Dict[Optional[str], BatchIndex] = dict()
+        self._catalogs: Dict[Optional[str], BatchCatalog] = dict()
+        self._grouped_bodies: Dict[Optional[str], bytes] = dict()
+        self._eu_body: Optional[bytes] = None
+        self._full_refreshed_at = float("-inf")
+        self._refreshes: SingleFlight[Tuple[Optional[str], bool], Manifest] = SingleFlight(
+            record_metrics=False
+        )
+
+    async def _run_in_executor(self, function: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(function, *args)
+        )
+
+    async def get(self, country: Optional[str]) -> Manifest:
+        """
+        Retrieve the manifest of the given country, computing it if no snapshot is available yet.
+        :param country: the country of interest, or None for the national TEK Chunks.
+        :return: the manifest of the given country.
+        :raises: NoBatchesException if there are no relevant TEK Chunks for the given country.
+        """
+        manifest = self._manifests.get(country)
+        if manifest is None:
+            manifest = await self.refresh_country(country)
+        return manifest
+
+    async def get_since(self, country: Optional[str], index: int) -> bytes:
+        """
+        Retrieve the serialized delta manifest of the given country, listing the relevant TEK Chunks
+        following the given index, computing it if no snapshot is available yet.
+        :param country: the country of interest, or None for the national TEK Chunks.
+        :param index: the index of the last TEK Chunk known by the client.
+        :return: the serialized delta manifest.
+        :raises: NoBatchesException if there are no relevant TEK Chunks for the given country.
+        """
+        manifest = await self.get(country)
+        return self._catalogs[country].serialize_since(
+            index, oldest=manifest.oldest, newest=manifest.newest
+        )
+
+    async def get_grouped(self, country: Optional[str]) -> bytes:
+        """
+        Retrieve the serialized grouped manifest of the given country, listing the relevant TEK
+        Chunks grouped by logical batch, computing it if no snapshot is available yet.
+        :param country: the country of interest, or None for the national TEK Chunks.
+        :return: the serialized grouped manifest.
+        :raises: NoBatchesException if there are no relevant TEK Chunks for the given country.
+        """
+        await self.get(country)
+        return self._grouped_bodies[country]
+
+    def get_snapshot(self, country: Optional[str]) -> Optional[Manifest]:
+        """
+        Retrieve the current manifest snapshot of the given country, without computing it.
+        :param country: the country of interest, or None for the national TEK Chunks.
+        :return: the manifest snapshot of the given country, or None if not available.
+        """
+        return self._manifests.get(country)
+
+    @property
+    def eu_countries(self) -> List[str]:
+        """
+        Return the EU countries having a manifest snapshot.
+        :return: the EU countries having a manifest snapshot.
+        """
+        return [country for country in self._manifests if country is not None]
+
+    @property
+    def eu_manifests(self) -> Dict[str, Manifest]:
+        """
+        Return the manifest snapshots of the EU countries.
+        :return: the manifest snapshots of the EU countries, by country.
+        """
+        return {
+            country: manifest
+            for country, manifest in self._manifests.items()
+            if country is not None
+        }
+
+    def is_missing(self, country: Optional[str], index: int) -> bool:
+        """
+        Check whether the given TEK Chunk is known not to be available, without querying the
+        database. This is the case if it is not in the index of the relevant TEK Chunks of a recent
+        enough snapshot, i.e., one computed at most two refresh intervals ago, and precedes the
+        newest TEK Chunk in it. TEK Chunks following it may have been created since, and already be
+        listed by the manifests of the other workers, which are refreshed independently.
+        :param country: the country of the TEK Chunk, or None for the national ones.
+        :param index: the index of the TEK Chunk.
+        :return: True if the TEK Chunk is known not to be available, False if it may be available.
+        """
+        manifest = self._manifests.get(country)
+        max_age = 2 * config.MANIFEST_REFRESH_INTERVAL_IN_SECONDS
+        if manifest is None or time.monotonic() - manifest.computed_at > max_age:
+            return False
+        if index > manifest.newest:
+            return False
+        return index not in self._batch_indexes[country]
+
+    def get_sizes(self, country: Optional[str], first: int, last: int) -> Dict[int, int]:
+        """
+        Retrieve the sizes of the zip files of the TEK Chunks within the given range listed by the
+        index of the relevant TEK Chunks, without querying the database. Since TEK Chunks never
+        change once created, the listed ones are available however old the snapshot is.
+        :param country: the country of the TEK Chunks, or None for the national ones.
+        :param first: the index of the first TEK Chunk of the range.
+        :param last: the index of the last TEK Chunk of the range, inclusive.
+        :return: the sizes of the zip files of the listed TEK Chunks within the range, by index.
+        """
+        batch_index = self._batch_indexes.get(country)
+        return dict() if batch_index is None else batch_index.between(first, last)
+
+    async def get_eu(self) -> bytes:
+        """
+        Retrieve the serialized manifests of all the EU countries, computing them if no snapshot
+        is available yet.
+        :return: the serialized manifests of all the EU countries.
+        :raises: NoBatchesException if there are no relevant EU TEK Chunks.
+        """
+        if self._eu_body is None:
+            await self.refresh_eu()
+            if self._eu_body is None:
+                raise NoBatchesException()
+        return self._eu_body
+
+    def _update_eu_body(self) -> None:
+        eu_manifests = self.eu_manifests
+        self._eu_body = serialize_eu_manifests(eu_manifests) if eu_manifests else None
+
+    def _update(
+        self, country: Optional[str], entries: List[BatchEntry], since: datetime, full: bool
+    ) -> Manifest:
+        batch_index = (None if full else self._batch_indexes.get(country)) or BatchIndex()
+        batch_index.update(entries, since=since)
+        oldest, newest = batch_index.oldest(since), batch_index.newest
+        if oldest is None or newest is None:
+            self._manifests.pop(country, None)
+            self._batch_indexes.pop(country, None)
+            self._catalogs.pop(country, None)
+            self._grouped_bodies.pop(country, None)
+            raise NoBatchesException()
+
+        manifest = Manifest.from_indexes(oldest=oldest, newest=newest)
+        catalog = (None if full else self._catalogs.get(country)) or BatchCatalog()
+        catalog.update(entries, oldest=oldest)
+        self._batch_indexes[country] = batch_index
+        self._catalogs[country] = catalog
+        self._grouped_bodies[country] = catalog.serialize_grouped(
+            oldest=manifest.oldest, newest=manifest.newest
+        )
+        self._manifests[country] = manifest
+        return manifest
+
+    def _after(self, country: Optional[str]) -> int:
+        batch_index = self._batch_indexes.get(country)
+        newest = None if batch_index is None else batch_index.newest
+        return -1 if newest is None else newest
+
+    async def _refresh_country(self, country: Optional[str], full: bool) -> Manifest:
+        since = window_start()
+        after = -1 if full else self._after(country)
+        catalog = self._catalogs.get(country) if full else None
+        known = None if catalog is None else catalog.by_index
+        entries = await self._run_in_executor(fetch_batch_entries, country, after, since, known)
+        try:
+            return self._update(country, entries, since, full)
+        finally:
+            if country is not None:
+                self._update_eu_body()
+
+    async def refresh_country(self, country: Optional[str], full: bool = False) -> Manifest:
+        """
+        Fetch the TEK Chunks of the given country following the newest known one, and update its
+        manifest snapshot. Concurrent refreshes of the same country share a single one.
+        :param country: the country of interest, or None for the national TEK Chunks.
+        :param full: whether to fetch all the relevant TEK Chunks and rebuild the snapshot instead.
+        :return: the updated manifest of the given country.
+        :raises: NoBatchesException if there are no relevant TEK Chunks for the given country.
+        """
+        return await self._refreshes.run(
+            (country, full), lambda: self._refresh_country(country, full)
+        )
+
+    async def refresh_eu(self, full: bool = False) -> None:
+        """
+        Fetch the TEK Chunks of all the EU countries following the newest known ones, and update
+        their manifest snapshots. The snapshots of the countries left with no relevant TEK Chunks
+        are dropped.
+        :param full: whether to fetch all the relevant TEK Chunks and rebuild the snapshots instead.
+        """
+        since = window_start()
+        countries = self.eu_countries
+        if full:
+            newest: Dict[str, int] = dict()
+            known: Optional[Dict[str, Dict[int, BatchEntry]]] = {
+                country: self._catalogs[country].by_index for country in countries
+            }
+        else:
+            newest = {country: self._after(country) for country in countries}
+            known = None
+        entries = await self._run_in_executor(fetch_eu_batch_entries, newest, since, known)
+        for country in set(countries) | set(entries):
+            try:
+                self._update(country, entries.get(country, []), since, full)
+            except NoBatchesException:
+                pass
+        self._update_eu_body()
+
+    @property
+    def full_refresh_due(self) -> bool:
+        """
+        Return whether the snapshots are due to be rebuilt from scratch on the next refresh.
+        :return: True if the full refresh interval elapsed since the last one, False otherwise.
+        """
+        elapsed = time.monotonic() - self._full_refreshed_at
+        return elapsed >= config.MANIFEST_FULL_REFRESH_INTERVAL_IN_SECONDS
+
+    async def refresh(self, full: bool = True) -> None:
+        """
+        Refresh the manifest snapshots of all countries.
+        :param full: whether to rebuild them, rather than only fetching the new TEK Chunks.
+        """
+        try:
+            await self.refresh_country(None, full)
+        except NoBatchesException:
+            pass
+        await self.refresh_eu(full)
+        if full:
+            self._full_refreshed_at = time.monotonic()
+
+    async def run(self) -> None:
+        """
+        Refresh the manifest snapshots of all countries every MANIFEST_REFRESH_INTERVAL_IN_SECONDS
+        seconds, rebuilding them from scratch every MANIFEST_FULL_REFRESH_INTERVAL_IN_SECONDS
+        seconds, until cancelled.
+        """
+        while True:
+            try:
+                await self.refresh(full=self.full_refresh_due)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Failed to refresh the manifests.")
+            await asyncio.sleep(config.MANIFEST_REFRESH_INTERVAL_IN_SECONDS)
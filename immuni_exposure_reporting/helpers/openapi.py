@@ -0,0 +1,70 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Any, Callable, TypeVar
+
+from sanic import Sanic
+
+from immuni_exposure_reporting.core import config
+
+T = TypeVar("T")
+
+# The name of the sanic_openapi blueprint serving the Swagger UI and building the spec.
+_SWAGGER_BLUEPRINT = "swagger"
+
+
+def _keep(handler: T) -> T:
+    return handler
+
+
+def _disabled(*args: Any, **kwargs: Any) -> Callable[[T], T]:  # pylint: disable=unused-argument
+    return _keep
+
+
+class _DisabledDoc:
+    """
+    Stand-in for the sanic_openapi doc module when OPENAPI_ENABLED is false: its decorators leave
+    the handlers untouched, and its fields are placeholders that are never rendered.
+    """
+
+    def __getattr__(self, name: str) -> Callable[..., Callable[[T], T]]:
+        return _disabled
+
+
+# The documentation decorators and fields of the routes, from sanic_openapi only if enabled, so
+# that production workers neither import it through this service nor record the route specs.
+if config.OPENAPI_ENABLED:
+    from sanic_openapi import doc  # pylint: disable=unused-import
+
+    from immuni_common.helpers.swagger import doc_exception  # pylint: disable=unused-import
+else:
+    doc = _DisabledDoc()  # type: ignore
+    doc_exception = _disabled  # type: ignore
+
+
+def remove_openapi(app: Sanic) -> None:
+    """
+    Unregister the sanic_openapi blueprint from the given app, i.e., its routes serving the Swagger
+    UI and its before_server_start listener building the spec on each worker (re)start.
+    Meant to be called when OPENAPI_ENABLED is false, on the app created by create_app.
+    :param app: the Sanic application.
+    """
+    blueprint = app.blueprints.pop(_SWAGGER_BLUEPRINT, None)
+    if blueprint is None:
+        return
+    for event, listeners in blueprint.listeners.items():
+        app.listeners[event] = [
+            listener for listener in app.listeners[event] if listener not in listeners
+        ]
+    for uri in [uri for uri in app.router.routes_all if uri.startswith(blueprint.url_prefix)]:
+        app.remove_route(uri)
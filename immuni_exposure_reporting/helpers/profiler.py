@@ -0,0 +1,136 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from asyncio import AbstractEventLoop
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+from sanic import Sanic
+
+from immuni_exposure_reporting.core import config
+
+_LOGGER = logging.getLogger(__name__)
+
+PROFILER_SIGNAL = signal.SIGUSR2
+
+
+def collapse_stack(thread_name: str, frame: Optional[FrameType]) -> str:
+    """
+    Collapse the stack ending in the given frame into a single line, from the outermost frame to
+    the innermost one, as in the collapsed-stack format (also importable by speedscope).
+    :param thread_name: the name of the thread, used as root of the stack.
+    :param frame: the innermost frame of the stack.
+    :return: the collapsed stack.
+    """
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the stacks of all the threads of the process (i.e., the event
+    loop and the executors) at a fixed interval for a given duration, from a background thread.
+    Nothing runs until a profile is started, so it has no overhead when not in use.
+    """
+
+    def __init__(self, interval: float, duration: float, directory: str) -> None:
+        """
+        :param interval: the sampling interval, in seconds.
+        :param duration: the duration of each profile, in seconds.
+        :param directory: the directory to write the profiles to.
+        """
+        self._interval = interval
+        self._duration = duration
+        self._directory = directory
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        """
+        Return whether a profile is being taken.
+        :return: True if a profile is being taken, False otherwise.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """
+        Start taking a profile in background, unless one is already being taken.
+        :return: True if the profile was started, False if one is already being taken.
+        """
+        if self.running:
+            return False
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def sample(self) -> Counter:
+        """
+        Sample the stacks of all the threads for the duration of the profile.
+        :return: the number of samples of each collapsed stack.
+        """
+        stacks: Counter = Counter()
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self._duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident != own_ident:
+                    stacks[collapse_stack(names.get(ident, str(ident)), frame)] += 1
+            time.sleep(self._interval)
+        return stacks
+
+    def _run(self) -> None:
+        try:
+            stacks = self.sample()
+            path = os.path.join(
+                self._directory, f"profile-{os.getpid()}-{int(time.time())}.collapsed"
+            )
+            with open(path, "w") as file:
+                for stack, count in stacks.most_common():
+                    file.write(f"{stack} {count}\n")
+            _LOGGER.info("Profile written.", extra=dict(path=path, samples=sum(stacks.values())))
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Failed to take the profile.")
+
+
+async def setup_profiler(app: Sanic, loop: AbstractEventLoop) -> None:  # pylint: disable=W0613
+    """
+    Let the worker be profiled on demand, when it receives PROFILER_SIGNAL (if enabled), and
+    profile it right away (if enabled).
+    Meant to be registered as a before_server_start listener, so that it only affects workers.
+    :param app: the Sanic application.
+    :param loop: the event loop.
+    """
+    if not config.PROFILER_SIGNAL_ENABLED and not config.PROFILER_ON_STARTUP:
+        return
+    profiler = SamplingProfiler(
+        interval=config.PROFILER_INTERVAL_IN_MILLISECONDS / 1000,
+        duration=config.PROFILER_DURATION_IN_SECONDS,
+        directory=config.PROFILER_DIRECTORY,
+    )
+    if config.PROFILER_SIGNAL_ENABLED:
+        loop.add_signal_handler(PROFILER_SIGNAL, profiler.start)
+    if config.PROFILER_ON_STARTUP:
+        profiler.start()
@@ -0,0 +1,253 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+from functools import partial
+from http import HTTPStatus
+from typing import Awaitable, BinaryIO, Callable, Dict, Optional, Union
+
+from sanic.request import Request
+from sanic.response import StreamingHTTPResponse
+
+from immuni_exposure_reporting.core import config
+
+StreamingFunction = Callable[[StreamingHTTPResponse], Awaitable[None]]
+
+
+class _StreamingResponse(StreamingHTTPResponse):
+    """
+    Streaming response that can also be served through ASGI (i.e., by the uvicorn workers).
+    When served through ASGI, Sanic 19.9 sends the status line, the headers and the chunked
+    transfer-encoding framing as part of the body, while the ASGI server takes care of all of them.
+    If the Content-Length header is set, the body is not chunked.
+    """
+
+    def __init__(
+        self,
+        streaming_fn: StreamingFunction,
+        headers: Optional[Dict[str, str]],
+        content_type: str,
+        asgi: bool,
+        status: int,
+    ) -> None:
+        super().__init__(streaming_fn, status=status, headers=headers, content_type=content_type)
+        self._asgi = asgi
+        if "Content-Length" in self.headers:
+            self.chunked = False
+
+    async def stream(
+        self,
+        version: str = "1.1",
+        keep_alive: bool = False,
+        keep_alive_timeout: Optional[int] = None,
+    ) -> None:
+        if not self._asgi:
+            await super().stream(
+                version=version, keep_alive=keep_alive, keep_alive_timeout=keep_alive_timeout
+            )
+            return
+        self.chunked = False
+        await self.streaming_fn(self)
+
+
+def stream_response(
+    request: Request,
+    streaming_fn: StreamingFunction,
+    content_type: str,
+    headers: Optional[Dict[str, str]] = None,
+    status: int = HTTPStatus.OK.value,
+) -> StreamingHTTPResponse:
+    """
+    Create a response whose body is written chunk by chunk by the given coroutine.
+    Each write waits for the transport to drain, so that slow clients do not make the written
+    chunks pile up in memory.
+    :param request: the HTTP request object.
+    :param streaming_fn: the coroutine writing the body to the given response.
+    :param content_type: the content type of the response.
+    :param headers: the additional headers of the response.
+    :param status: the status code of the response.
+    :return: the streaming response.
+    """
+    return _StreamingResponse(
+        streaming_fn,
+        headers=headers,
+        content_type=content_type,
+        asgi=request.app.asgi,
+        status=status,
+    )
+
+
+def stream_file(
+    request: Request,
+    file: BinaryIO,
+    start: int,
+    end: int,
+    content_type: str,
+    headers: Dict[str, str],
+    status: int = HTTPStatus.OK.value,
+) -> StreamingHTTPResponse:
+    """
+    Create a response whose body is the given byte range of the given open file, closed once
+    written. The file is opened by the caller, before the response is committed, so that it can
+    fall back to another source if the file is not available.
+    When served by Sanic's own server, the file is sent with loop.sendfile, i.e., by the kernel
+    without going through the memory of the worker, where the event loop supports it. ASGI gives
+    no access to the transport, so when served through ASGI (or if sendfile is not supported) the
+    file is read chunk by chunk off the event loop instead.
+    :param request: the HTTP request object.
+    :param file: the open file to serve.
+    :param start: the position of the first byte to serve.
+    :param end: the position of the last byte to serve, inclusive.
+    :param content_type: the content type of the response.
+    :param headers: the additional headers of the response.
+    :param status: the status code of the response.
+    :return: the streaming response.
+    """
+
+    async def _write_file(response: StreamingHTTPResponse) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            if not request.app.asgi:
+                try:
+                    await loop.sendfile(response.protocol.transport, file, start, end + 1 - start)
+                    return
+                except NotImplementedError:
+                    pass
+            position = start
+            while position <= end:
+                size = min(config.STREAM_CHUNK_SIZE_IN_BYTES, end + 1 - position)
+                chunk = await loop.run_in_executor(None, os.pread, file.fileno(), size, position)
+                if not chunk:
+                    break
+                await response.write(chunk)
+                position += len(chunk)
+        finally:
+            file.close()
+
+    return stream_response(
+        request,
+        _write_file,
+        content_type=content_type,
+        headers={**headers, "Content-Length": str(end + 1 - start)},
+        status=status,
+    )
+
+
+async def write_reader(
+    response: StreamingHTTPResponse, open_reader: Callable[[], BinaryIO], start: int, end: int
+) -> None:
+    """
+    Write the given byte range of the file-like object opened by the given function (e.g., a
+    GridFS file) to the given response, reading it chunk by chunk off the event loop, so that it is
+    never loaded in memory as a whole.
+    :param response: the streaming response to write to.
+    :param open_reader: the blocking function opening the file-like object to write.
+    :param start: the position of the first byte to write.
+    :param end: the position of the last byte to write, inclusive.
+    """
+    loop = asyncio.get_running_loop()
+    reader = await loop.run_in_executor(None, open_reader)
+    try:
+        if start:
+            await loop.run_in_executor(None, reader.seek, start)
+        remaining = end + 1 - start
+        while remaining > 0:
+            chunk = await loop.run_in_executor(
+                None, reader.read, min(config.STREAM_CHUNK_SIZE_IN_BYTES, remaining)
+            )
+            if not chunk:
+                break
+            await response.write(chunk)
+            remaining -= len(chunk)
+    finally:
+        reader.close()
+
+
+def stream_reader(
+    request: Request,
+    open_reader: Callable[[], BinaryIO],
+    start: int,
+    end: int,
+    content_type: str,
+    headers: Dict[str, str],
+    status: int = HTTPStatus.OK.value,
+) -> StreamingHTTPResponse:
+    """
+    Create a response whose body is the given byte range of the file-like object opened by the
+    given function (e.g., a GridFS file), as written by write_reader.
+    :param request: the HTTP request object.
+    :param open_reader: the blocking function opening the file-like object to serve.
+    :param start: the position of the first byte to serve.
+    :param end: the position of the last byte to serve, inclusive.
+    :param content_type: the content type of the response.
+    :param headers: the additional headers of the response.
+    :param status: the status code of the response.
+    :return: the streaming response.
+    """
+    return stream_response(
+        request,
+        partial(write_reader, open_reader=open_reader, start=start, end=end),
+        content_type=content_type,
+        headers={**headers, "Content-Length": str(end + 1 - start)},
+        status=status,
+    )
+
+
+async def write_content(
+    response: StreamingHTTPResponse, content: Union[bytes, memoryview], start: int, end: int
+) -> None:
+    """
+    Write the given byte range of the given in-memory content to the given response, in chunks of
+    STREAM_CHUNK_SIZE_IN_BYTES bytes, so that only one chunk at a time is copied into the
+    transport's buffer.
+    :param response: the streaming response to write to.
+    :param content: the content to write.
+    :param start: the position of the first byte to write.
+    :param end: the position of the last byte to write, inclusive.
+    """
+    view = memoryview(content)
+    chunk_size = config.STREAM_CHUNK_SIZE_IN_BYTES
+    for position in range(start, end + 1, chunk_size):
+        # Sanic only writes bytes as they are, while the content may be a view.
+        await response.write(bytes(view[position : min(position + chunk_size, end + 1)]))
+
+
+def stream_content(
+    request: Request,
+    content: Union[bytes, memoryview],
+    start: int,
+    end: int,
+    content_type: str,
+    headers: Dict[str, str],
+    status: int = HTTPStatus.OK.value,
+) -> StreamingHTTPResponse:
+    """
+    Create a response whose body is the given byte range of the given in-memory content, as written
+    by write_content.
+    :param request: the HTTP request object.
+    :param content: the content to serve.
+    :param start: the position of the first byte to serve.
+    :param end: the position of the last byte to serve, inclusive.
+    :param content_type: the content type of the response.
+    :param headers: the additional headers of the response.
+    :param status: the status code of the response.
+    :return: the streaming response.
+    """
+    return stream_response(
+        request,
+        partial(write_content, content=content, start=start, end=end),
+        content_type=content_type,
+        headers={**headers, "Content-Length": str(end + 1 - start)},
+        status=status,
+    )
@@ -0,0 +1,359 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+from immuni_exposure_reporting.helpers.batch_cache import BatchContent, BatchKey, DigestCache
+from immuni_exposure_reporting.helpers.chunked_content import ChunkedContent
+from immuni_exposure_reporting.monitoring.api import (
+    BATCH_CACHE_HITS,
+    BATCH_CACHE_MISSES,
+    SHARED_BATCH_STORE_RESETS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+_MAGIC = b"IMMUNIB1"
+# Header of the store: the magic, whether the file has been replaced by a newer one, the end offset
+# of the last complete record, and whether the manifest window has been loaded.
+_HEADER = struct.Struct(">8sQQQ")
+_SUPERSEDED_OFFSET = 8
+_END_OFFSET = 16
+_FILLED_OFFSET = 24
+_FLAG = struct.Struct(">Q")
+# Header of each record: the country of the TEK Chunk (empty for the national ones), its index, the
+# digest of its zip file and the size of its zip file. The zip file follows.
+_RECORD_HEADER = struct.Struct(">8sQ64sI")
+
+
+class SharedBatchStore:
+    """
+    Store of the TEK Chunks' zip files shared by all the workers on the same host, so that each zip
+    file is held in memory once per host rather than once per worker.
+    The store is an append-only file, meant to live in a memory-backed filesystem (e.g., /dev/shm),
+    mapped by every worker. Since TEK Chunks never change once created, records are never updated:
+    each worker reads the records appended by the others without any locking, keeping a local index
+    of their offsets. Appends are serialized across workers by an exclusive lock on a sibling file,
+    and only become visible to readers once the end offset in the header is updated.
+    When the file is full, a new empty one replaces it and the old one is flagged as superseded, so
+    that the workers map the new one at their next lookup. Files are only ever created complete and
+    atomically renamed into place, holding the lock, and never resized, since other workers may
+    have them mapped.
+    The lock also serializes the loads of the TEK Chunks missing from the store, so that each one
+    is loaded from the database once per host rather than once per worker.
+    The interface is the same as the one of the in-memory BatchCache.
+    """
+
+    def __init__(self, path: str, max_size: int) -> None:
+        """
+        :param path: the path of the file backing the store.
+        :param max_size: the size of the file backing the store, in bytes.
+        """
+        self._path = path
+        self._max_size = max_size
+        self._lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        # File locks are held by the whole process, so appends from its threads are serialized too.
+        self._thread_lock = threading.Lock()
+        self._index: Dict[BatchKey, Tuple[int, int, str]] = dict()
+        self._scanned = _HEADER.size
+        # Digests of the zip files not stored (e.g., too large, or stored in chunks), or no longer
+        # stored, with the descriptions of the GridFS files of the ones stored in chunks.
+        self._digests = DigestCache()
+        self.hits = 0
+        self.misses = 0
+        with self._locked():
+            current = self._map_file()
+            if (
+                current is not None
+                and len(current) == max_size
+                and current[: len(_MAGIC)] == _MAGIC
+            ):
+                self._use(current)
+            else:
+                self._use(self._create())
+                if current is not None:
+                    # Other workers may still have the replaced file mapped.
+                    _FLAG.pack_into(current, _SUPERSEDED_OFFSET, 1)
+
+    def __len__(self) -> int:
+        self._sync()
+        return len(self._index)
+
+    @property
+    def size(self) -> int:
+        """
+        Return the overall size of the stored zip files and of their records' headers.
+        :return: the overall size of the stored records, in bytes.
+        """
+        self._sync()
+        return self._read_flag(_END_OFFSET) - _HEADER.size
+
+    def get(self, key: BatchKey) -> Optional[BatchContent]:
+        """
+        Retrieve the zip file of the given TEK Chunk, as a read-only view over the shared memory.
+        :param key: the country and index of the TEK Chunk.
+        :return: the zip file of the TEK Chunk, or None if not stored.
+        """
+        self._sync()
+        entry = self._index.get(key)
+        if entry is None:
+            self.misses += 1
+            BATCH_CACHE_MISSES.inc()
+            return None
+        self.hits += 1
+        BATCH_CACHE_HITS.inc()
+        return self._view(entry)
+
+    def get_digest(self, key: BatchKey) -> Optional[str]:
+        """
+        Retrieve the digest of the zip file of the given TEK Chunk.
+        :param key: the country and index of the TEK Chunk.
+        :return: the digest of the zip file of the TEK Chunk, or None if unknown.
+        """
+        self._sync()
+        entry = self._index.get(key)
+        if entry is None:
+            return self._digests.get(key)
+        return entry[2]
+
+    def put_digest(self, key: BatchKey, digest: str) -> None:
+        """
+        Store the digest of the zip file of the given TEK Chunk, without its zip file.
+        :param key: the country and index of the TEK Chunk.
+        :param digest: the digest of the zip file of the TEK Chunk.
+        """
+        self._digests.put(key, digest)
+
+    def get_chunked(self, key: BatchKey) -> Optional[ChunkedContent]:
+        """
+        Retrieve the description of the GridFS file of the given TEK Chunk stored in chunks.
+        :param key: the country and index of the TEK Chunk.
+        :return: the description of the GridFS file, or None if unknown.
+        """
+        return self._digests.get_chunked(key)
+
+    def put_chunked(self, key: BatchKey, chunked: ChunkedContent) -> None:
+        """
+        Store the description of the GridFS file of the given TEK Chunk stored in chunks, together
+        with its digest. Only the zip files are shared across workers.
+        :param key: the country and index of the TEK Chunk.
+        :param chunked: the description of the GridFS file of the TEK Chunk.
+        """
+        self._digests.put(key, chunked.digest, chunked)
+
+    def put(self, key: BatchKey, content: BatchContent, digest: str) -> None:
+        """
+        Store the zip file of the given TEK Chunk, on a best-effort basis: if another worker is
+        appending at the same time, the zip file is not stored, so as not to block the event loop.
+        :param key: the country and index of the TEK Chunk.
+        :param content: the zip file of the TEK Chunk.
+        :param digest: the digest of the zip file of the TEK Chunk.
+        """
+        self._digests.put(key, digest)
+        if not self._thread_lock.acquire(blocking=False):
+            return
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._thread_lock.release()
+            return
+        try:
+            self._append(key, content, digest)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            self._thread_lock.release()
+
+    def load(
+        self, key: BatchKey, load: Callable[[], Tuple[Union[BatchContent, ChunkedContent], str]],
+    ) -> Union[BatchContent, ChunkedContent]:
+        """
+        Retrieve the zip file of the given TEK Chunk, loading and storing it with the given function
+        unless another worker stored it meanwhile.
+        Meant to be run off the event loop: workers wait for the one loading the TEK Chunk, rather
+        than loading it from the database themselves. Loads are thus serialized across the workers
+        of the host, and across the threads of each worker.
+        Zip files stored in chunks are not stored, only the description of their GridFS file is.
+        :param key: the country and index of the TEK Chunk.
+        :param load: the function loading the zip file of the TEK Chunk, or the GridFS file to
+          stream it from, together with its digest.
+        :return: the zip file of the TEK Chunk, or the GridFS file to stream it from.
+        :raises: any exception raised by the given function.
+        """
+        with self._locked():
+            self._sync()
+            entry = self._index.get(key)
+            if entry is not None:
+                return self._view(entry)
+            source, digest = load()
+            if isinstance(source, ChunkedContent):
+                self._digests.put(key, digest, source)
+            else:
+                self._digests.put(key, digest)
+                self._append(key, source, digest)
+            return source
+
+    def fill(
+        self, load: Callable[[], Dict[BatchKey, Tuple[bytes, str]]]
+    ) -> Dict[BatchKey, Tuple[bytes, str]]:
+        """
+        Store the TEK Chunks returned by the given function, unless another worker already did.
+        Meant to be run off the event loop: workers wait for the one filling the store, rather than
+        loading the TEK Chunks from the database themselves.
+        The store is emptied first if the TEK Chunks do not fit in the remaining space, and the
+        ones not fitting in an empty store are not stored, rather than replacing the ones stored
+        earlier by the same fill.
+        :param load: the function loading the TEK Chunks to store.
+        :return: the loaded TEK Chunks, empty if the store was already filled.
+        """
+        with self._locked():
+            self._sync()
+            if self._read_flag(_FILLED_OFFSET):
+                return dict()
+            batches = load()
+            size = sum(_RECORD_HEADER.size + len(content) for content, _ in batches.values())
+            if self._read_flag(_END_OFFSET) + size > len(self._map):
+                self._reset()
+            for key, (content, digest) in batches.items():
+                self._digests.put(key, digest)
+                self._append(key, content, digest, reset=False)
+            _FLAG.pack_into(self._map, _FILLED_OFFSET, 1)
+            return batches
+
+    def close(self) -> None:
+        """
+        Release the lock file. The mapping is released once no views over it are referenced.
+        """
+        os.close(self._lock_fd)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._thread_lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _view(self, entry: Tuple[int, int, str]) -> BatchContent:
+        offset, length, _ = entry
+        return memoryview(self._map)[offset : offset + length].toreadonly()  # type: ignore
+
+    def _read_flag(self, offset: int) -> int:
+        return _FLAG.unpack_from(self._map, offset)[0]
+
+    def _map_file(self) -> Optional[mmap.mmap]:
+        """
+        Map the current file backing the store as it is, without ever resizing it.
+        :return: the mapping of the file, or None if it does not exist or is too small to be valid.
+        """
+        try:
+            fd = os.open(self._path, os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        try:
+            if os.fstat(fd).st_size < _HEADER.size:
+                return None
+            return mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+
+    def _create(self) -> mmap.mmap:
+        """
+        Create a new empty file and atomically replace the current one with it, so that no worker
+        ever maps a file being created. Must be called holding the lock.
+        :return: the mapping of the new file.
+        """
+        temporary_path = f"{self._path}.new"
+        fd = os.open(temporary_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, self._max_size)
+            os.pwrite(fd, _HEADER.pack(_MAGIC, 0, _HEADER.size, 0), 0)
+            new_map = mmap.mmap(fd, self._max_size)
+        finally:
+            os.close(fd)
+        os.replace(temporary_path, self._path)
+        return new_map
+
+    def _use(self, new_map: mmap.mmap) -> None:
+        self._map = new_map
+        self._index = dict()
+        self._scanned = _HEADER.size
+
+    def _sync(self) -> None:
+        """
+        Map the newer file if the current one has been superseded, and index the records appended
+        by the other workers since the last lookup.
+        """
+        if self._read_flag(_SUPERSEDED_OFFSET):
+            # The file replacing it is complete, since it is only renamed into place once created.
+            current = self._map_file()
+            if current is not None:
+                self._use(current)
+        end = self._read_flag(_END_OFFSET)
+        while self._scanned < end:
+            country, index, digest, length = _RECORD_HEADER.unpack_from(self._map, self._scanned)
+            offset = self._scanned + _RECORD_HEADER.size
+            key = (country.rstrip(b"\0").decode("ascii") or None, index)
+            self._index[key] = (offset, length, digest.decode("ascii"))
+            self._scanned = offset + length
+
+    def _append(
+        self, key: BatchKey, content: BatchContent, digest: str, reset: bool = True
+    ) -> None:
+        """
+        Append the given TEK Chunk to the store. Must be called holding the lock.
+        If the store is full, it is emptied first if reset is True, otherwise the TEK Chunk is not
+        stored.
+        """
+        self._sync()
+        if key in self._index:
+            return
+        record_size = _RECORD_HEADER.size + len(content)
+        if _HEADER.size + record_size > len(self._map):
+            return
+        end = self._read_flag(_END_OFFSET)
+        if end + record_size > len(self._map):
+            if not reset:
+                return
+            self._reset()
+            end = _HEADER.size
+        country, index = key
+        _RECORD_HEADER.pack_into(
+            self._map,
+            end,
+            (country or "").encode("ascii"),
+            index,
+            digest.encode("ascii"),
+            len(content),
+        )
+        self._map[end + _RECORD_HEADER.size : end + record_size] = content
+        # Publish the record only once it has been completely written.
+        _FLAG.pack_into(self._map, _END_OFFSET, end + record_size)
+        self._sync()
+
+    def _reset(self) -> None:
+        """
+        Replace the full file with a new empty one. Must be called holding the lock.
+        """
+        previous = self._map
+        self._use(self._create())
+        _FLAG.pack_into(previous, _SUPERSEDED_OFFSET, 1)
+        SHARED_BATCH_STORE_RESETS.inc()
+        _LOGGER.info("Shared TEK Chunk store full, replaced with an empty one.")
@@ -0,0 +1,72 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+from immuni_exposure_reporting.monitoring.api import (
+    BATCH_FETCH_PEAK_FAN_IN,
+    BATCH_FETCHES_COALESCED,
+)
+
+_K = TypeVar("_K", bound=Hashable)
+_V = TypeVar("_V")
+
+
+class SingleFlight(Generic[_K, _V]):
+    """
+    Deduplicator of concurrent calls with the same key: while a call is in flight, further calls
+    with its key wait for its result rather than performing the same work again.
+    The call runs in its own task, so that it completes even if the request that started it is
+    cancelled (e.g., because its client disconnected) while others are waiting for it.
+    """
+
+    def __init__(self, record_metrics: bool = True) -> None:
+        """
+        :param record_metrics: whether to record the coalesced calls and the peak fan-in in the
+          metrics of the TEK Chunk fetches.
+        """
+        self._record_metrics = record_metrics
+        self._flights: Dict[_K, "asyncio.Future[_V]"] = dict()
+        self._fan_in: Dict[_K, int] = dict()
+        self.coalesced = 0
+        self.peak_fan_in = 0
+
+    async def run(self, key: _K, function: Callable[[], Awaitable[_V]]) -> _V:
+        """
+        Run the given function, unless a call with the same key is in flight, whose result is
+        awaited instead.
+        :param key: the key identifying the call.
+        :param function: the function to run.
+        :return: the result of the call.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(function())
+            self._flights[key] = flight
+            self._fan_in[key] = 1
+            flight.add_done_callback(lambda _: self._land(key))
+        else:
+            self._fan_in[key] += 1
+            self.coalesced += 1
+            if self._record_metrics:
+                BATCH_FETCHES_COALESCED.inc()
+        return await asyncio.shield(flight)
+
+    def _land(self, key: _K) -> None:
+        del self._flights[key]
+        fan_in = self._fan_in.pop(key)
+        if fan_in > self.peak_fan_in:
+            self.peak_fan_in = fan_in
+            if self._record_metrics:
+                BATCH_FETCH_PEAK_FAN_IN.set(fan_in)
@@ -13,27 +13,46 @@
 
 import re
 import sys
+from typing import Optional, Tuple
 
 from immuni_common.core.exceptions import SchemaValidationException
 from immuni_common.models.marshmallow.fields import VALID_COUNTRY_REGEX
+from immuni_exposure_reporting.core import config
 
 
-def validate_batch_index(batch_index: str) -> int:
+def validate_batch_index(batch_index: str, minimum: int = 1) -> int:
     """
     Validate the given batch index.
     :param batch_index: the batch index to validate.
+    :param minimum: the minimum valid batch index.
     :return: the batch index, if valid.
     :raises: SchemaValidationException if the given batch index is invalid.
     """
     try:
         index = int(batch_index)
-        if index < 1 or index > sys.maxsize:
+        if index < minimum or index > sys.maxsize:
             raise ValueError()
     except ValueError as error:
         raise SchemaValidationException() from error
     return index
 
 
+def validate_batch_range(first: Optional[str], last: Optional[str]) -> Tuple[int, int]:
+    """
+    Validate the given range of batch indexes.
+    :param first: the first batch index of the range.
+    :param last: the last batch index of the range, inclusive.
+    :return: the first and last batch indexes, if valid.
+    :raises: SchemaValidationException if any of the given batch indexes is invalid, or if the
+      range is empty or longer than MAX_BATCHES_PER_RANGE_REQUEST.
+    """
+    first_index = validate_batch_index(first or "")
+    last_index = validate_batch_index(last or "")
+    if not 0 <= last_index - first_index < config.MAX_BATCHES_PER_RANGE_REQUEST:
+        raise SchemaValidationException()
+    return first_index, last_index
+
+
 def validate_batch_country(batch_country: str) -> str:
     """
     Validate the given batch country.
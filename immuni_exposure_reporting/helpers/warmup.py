@@ -0,0 +1,153 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import gc
+import logging
+import resource
+import time
+from asyncio import AbstractEventLoop
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+from mongoengine import connect, disconnect
+from sanic import Sanic
+
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import managers, mongo_client_options
+from immuni_exposure_reporting.helpers.batch_cache import BatchKey
+from immuni_exposure_reporting.helpers.chunked_content import (
+    only_with_content,
+    read_document_content,
+)
+from immuni_exposure_reporting.helpers.executor import run_in_executor
+from immuni_exposure_reporting.helpers.http import compute_digest
+from immuni_exposure_reporting.helpers.shared_batch_store import SharedBatchStore
+from immuni_exposure_reporting.models.enums import WarmupMode
+from immuni_exposure_reporting.monitoring.api import MONGO_QUERY_LATENCY
+
+_LOGGER = logging.getLogger(__name__)
+
+_LOAD_BATCHES_LATENCY = MONGO_QUERY_LATENCY.labels(operation="load_batches")
+
+# The TEK Chunks loaded by the gunicorn master in preload mode, shared copy-on-write by the workers,
+# and the (monotonic) time they were loaded at.
+_preloaded_batches: Dict[BatchKey, Tuple[bytes, str]] = dict()
+_preloaded_at = float("-inf")
+
+
+@_LOAD_BATCHES_LATENCY.time()
+def load_batches() -> Dict[BatchKey, Tuple[bytes, str]]:
+    """
+    Load the zip files of all the TEK Chunks within the manifest window, national and EU ones.
+    :return: the zip files and their digests, by country and index of the TEK Chunk.
+    """
+    threshold = datetime.utcnow() - timedelta(days=config.MANIFEST_LENGTH_IN_DAYS)
+    batches: Dict[BatchKey, Tuple[bytes, str]] = dict()
+    for document in only_with_content(
+        BatchFile.objects(period_end__gte=threshold), "index"
+    ).as_pymongo():
+        content = read_document_content(document)
+        batches[(None, document["index"])] = (content, compute_digest(content))
+    for document in only_with_content(
+        BatchFileEu.objects(period_end__gte=threshold), "origin", "index"
+    ).as_pymongo():
+        content = read_document_content(document)
+        batches[(document["origin"], document["index"])] = (content, compute_digest(content))
+    return batches
+
+
+def _log_warmup(mode: WarmupMode, start: float, batches: Dict[BatchKey, Tuple[bytes, str]]) -> None:
+    _LOGGER.info(
+        "Warm-up completed.",
+        extra=dict(
+            mode=mode.value,
+            duration_in_seconds=round(time.monotonic() - start, 3),
+            batches=len(batches),
+            size_in_bytes=sum(len(content) for content, _ in batches.values()),
+            max_rss_in_kilobytes=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        ),
+    )
+
+
+def preload_batches() -> None:
+    """
+    Load the TEK Chunks within the manifest window in the current process, meant to be the gunicorn
+    master right before forking the workers (see immuni_exposure_reporting.gunicorn_config), so
+    that the workers share them copy-on-write.
+    The MongoDB connection is closed afterwards, since it cannot be shared across forks.
+    """
+    global _preloaded_at  # pylint: disable=global-statement
+    start = time.monotonic()
+    connect(host=config.EXPOSURE_MONGO_URL, **mongo_client_options())
+    try:
+        _preloaded_batches.update(load_batches())
+    finally:
+        disconnect()
+    _preloaded_at = time.monotonic()
+    # Keep the garbage collector from touching (and thus copying) the preloaded objects' pages.
+    gc.freeze()  # type: ignore
+    _log_warmup(WarmupMode.PRELOAD, start, _preloaded_batches)
+
+
+def _get_preloaded_batches() -> Dict[BatchKey, Tuple[bytes, str]]:
+    """
+    Return the TEK Chunks preloaded by the gunicorn master, unless preloaded longer than
+    WARMUP_PRELOAD_MAX_AGE_IN_SECONDS ago: workers recycled after max requests are forked from the
+    same master, and would otherwise miss the TEK Chunks created since then and keep the ones that
+    left the manifest window.
+    :return: the preloaded zip files and their digests, or nothing if none or too old.
+    """
+    if time.monotonic() - _preloaded_at > config.WARMUP_PRELOAD_MAX_AGE_IN_SECONDS:
+        return dict()
+    return _preloaded_batches
+
+
+def release_preloaded_batches() -> None:
+    """
+    Release the TEK Chunks preloaded in the current process, so that the ones not referenced
+    elsewhere (e.g., by the TEK Chunk cache) are freed. Meant to be called by the gunicorn master
+    once they are too old for the workers it forks to use them, and by each worker once warmed up.
+    """
+    global _preloaded_at  # pylint: disable=global-statement
+    _preloaded_batches.clear()
+    _preloaded_at = float("-inf")
+
+
+async def warm_up(app: Sanic, loop: AbstractEventLoop) -> None:  # pylint: disable=unused-argument
+    """
+    Fill the manifest snapshots and the TEK Chunk cache of the current worker before it accepts
+    traffic, using the TEK Chunks preloaded by the gunicorn master if available and recent enough.
+    If the TEK Chunk store is shared across workers, it is only filled by the first one to start.
+    The worker's reference to the preloaded TEK Chunks is released afterwards, so that the ones
+    evicted from the cache are freed.
+    Meant to be registered as a before_server_start listener, after the managers initialization.
+    :param app: the Sanic application.
+    :param loop: the event loop.
+    """
+    if config.WARMUP_MODE == WarmupMode.DISABLED:
+        return
+    start = time.monotonic()
+    await managers.manifest_store.refresh()
+    preloaded = _get_preloaded_batches()
+    store = managers.batch_cache
+    if isinstance(store, SharedBatchStore):
+        # Only one worker per host loads the TEK Chunks, while the others wait for it.
+        batches = await run_in_executor(store.fill, lambda: preloaded or load_batches())
+    else:
+        batches = preloaded or await run_in_executor(load_batches)
+        for key, (content, digest) in batches.items():
+            store.put(key, content, digest)
+    _log_warmup(WarmupMode.PRELOAD if preloaded else WarmupMode.WORKER, start, batches)
+    release_preloaded_batches()
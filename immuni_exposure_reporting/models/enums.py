@@ -0,0 +1,28 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from enum import Enum
+
+
+class WarmupMode(Enum):
+    """
+    Enumeration of the ways the TEK Chunks of the manifest window are loaded at startup.
+    """
+
+    # TEK Chunks are only loaded as they are requested.
+    DISABLED = "disabled"
+    # Each worker loads the TEK Chunks before accepting traffic.
+    WORKER = "worker"
+    # The gunicorn master loads the TEK Chunks before forking (i.e., with --preload), so that the
+    # workers share them copy-on-write.
+    PRELOAD = "preload"
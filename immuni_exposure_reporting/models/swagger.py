@@ -11,7 +11,7 @@
 #    You should have received a copy of the GNU Affero General Public License
 #    along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-from sanic_openapi import doc
+from immuni_exposure_reporting.helpers.openapi import doc
 
 
 class Index:
@@ -21,3 +21,70 @@ class Index:
 
     oldest = doc.String("The index of the oldest relevant TEK Chunk (no older than 14 days).")
     newest = doc.String("The index of the newest available TEK Chunk.")
+
+
+class EuIndex:
+    """
+    Swagger documentation of a successful keys/eu/index endpoint response.
+    """
+
+    DK = doc.Object(
+        Index,
+        description="The indexes of the TEK Chunks of the given country (e.g., DK). "
+        "There is one such entry for each country with relevant TEK Chunks.",
+    )
+
+
+class BatchMetadata:
+    """
+    Swagger documentation of a TEK Chunk listed by the keys/since endpoint response.
+    """
+
+    index = doc.Integer("The index of the TEK Chunk.")
+    size = doc.Integer("The size of the TEK Chunk's zip file, in bytes.")
+    digest = doc.String(
+        "The hex-encoded SHA-256 digest of the TEK Chunk's zip file, also sent as its ETag."
+    )
+    sub_batch_index = doc.Integer("The index of the TEK Chunk within its batch, if split.")
+    sub_batch_count = doc.Integer("The number of TEK Chunks its batch is split into, if split.")
+
+
+class DeltaIndex:
+    """
+    Swagger documentation of a successful keys/since endpoint response.
+    """
+
+    oldest = doc.Integer("The index of the oldest relevant TEK Chunk (no older than 14 days).")
+    newest = doc.Integer("The index of the newest available TEK Chunk.")
+    batches = doc.List(
+        BatchMetadata,
+        description="The relevant TEK Chunks following the last one known by the Mobile Client, "
+        "sorted by index.",
+    )
+
+
+class BatchGroup:
+    """
+    Swagger documentation of a logical batch listed by the v2 keys/index endpoint response.
+    """
+
+    period_start = doc.String("The start of the period covered by the batch, in ISO 8601 format.")
+    period_end = doc.String("The end of the period covered by the batch, in ISO 8601 format.")
+    sub_batch_count = doc.Integer("The number of TEK Chunks the batch is split into.")
+    indexes = doc.List(
+        doc.Integer(), description="The indexes of the available TEK Chunks of the batch."
+    )
+    complete = doc.Boolean("Whether all the TEK Chunks of the batch are available.")
+
+
+class GroupedIndex:
+    """
+    Swagger documentation of a successful v2 keys/index endpoint response.
+    """
+
+    oldest = doc.Integer("The index of the oldest relevant TEK Chunk (no older than 14 days).")
+    newest = doc.Integer("The index of the newest available TEK Chunk.")
+    batches = doc.List(
+        BatchGroup,
+        description="The relevant TEK Chunks grouped by logical batch, sorted by index.",
+    )
@@ -0,0 +1,117 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from immuni_common.monitoring.core import NAMESPACE, Subsystem
+
+BATCH_CACHE_HITS = Counter(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="batch_cache_hits",
+    documentation="Number of TEK Chunk lookups served by the in-memory cache.",
+)
+
+BATCH_CACHE_MISSES = Counter(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="batch_cache_misses",
+    documentation="Number of TEK Chunk lookups not served by the in-memory cache.",
+)
+
+BATCH_CACHE_EVICTIONS = Counter(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="batch_cache_evictions",
+    documentation="Number of TEK Chunks evicted from the in-memory cache to free memory.",
+)
+
+BATCH_LOOKUPS_SHORT_CIRCUITED = Counter(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="batch_lookups_short_circuited",
+    documentation="Number of TEK Chunk lookups answered as not found without database queries.",
+)
+
+SHARED_BATCH_STORE_RESETS = Counter(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="shared_batch_store_resets",
+    documentation="Number of times the full shared TEK Chunk store was replaced with an empty one.",
+)
+
+BATCH_FETCHES_COALESCED = Counter(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="batch_fetches_coalesced",
+    documentation="Number of TEK Chunk lookups that waited for an identical one already in flight.",
+)
+
+BATCH_FETCH_PEAK_FAN_IN = Gauge(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="batch_fetch_peak_fan_in",
+    documentation="Highest number of TEK Chunk lookups served by a single fetch.",
+    multiprocess_mode="max",
+)
+
+ROUTE_LATENCY = Histogram(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="route_latency_seconds",
+    documentation="Time spent handling requests, by route and status code.",
+    labelnames=("route", "status"),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+ROUTE_RESPONSE_SIZE = Histogram(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="route_response_size_bytes",
+    documentation="Size of the response bodies, by route.",
+    labelnames=("route",),
+    buckets=(64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="requests_in_flight",
+    documentation="Number of requests being handled.",
+    multiprocess_mode="livesum",
+)
+
+MONGO_QUERY_LATENCY = Histogram(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="mongo_query_latency_seconds",
+    documentation="Time spent running MongoDB queries, by operation.",
+    labelnames=("operation",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+MONGO_POOL_CHECKOUT_WAIT = Histogram(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="mongo_pool_checkout_wait_seconds",
+    documentation="Time spent waiting for a connection from the MongoDB connection pool.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    namespace=NAMESPACE,
+    subsystem=Subsystem.API.value,
+    name="mongo_pool_checkout_failures",
+    documentation="Number of failed checkouts from the MongoDB connection pool, by reason.",
+    labelnames=("reason",),
+)
@@ -0,0 +1,78 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+from sanic import Sanic
+from sanic.request import Request
+from sanic.response import HTTPResponse, raw
+
+from immuni_exposure_reporting.helpers.openapi import doc
+from immuni_exposure_reporting.monitoring.api import (
+    REQUESTS_IN_FLIGHT,
+    ROUTE_LATENCY,
+    ROUTE_RESPONSE_SIZE,
+)
+
+METRICS_ROUTE = "/metrics"
+# Label of the requests not matching any route, so that arbitrary paths do not create new series.
+_UNMATCHED_ROUTE = "unmatched"
+_START_KEY = "monitoring_start"
+
+
+async def _on_request(request: Request) -> None:
+    request[_START_KEY] = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+
+async def _on_response(request: Request, response: HTTPResponse) -> None:
+    start = request.get(_START_KEY)
+    if start is None:
+        return
+    REQUESTS_IN_FLIGHT.dec()
+    route = request.uri_template or _UNMATCHED_ROUTE
+    ROUTE_LATENCY.labels(route=route, status=response.status).observe(time.perf_counter() - start)
+    body = getattr(response, "body", None)
+    size = len(body) if body is not None else response.headers.get("Content-Length")
+    if size is not None:
+        ROUTE_RESPONSE_SIZE.labels(route=route).observe(int(size))
+
+
+@doc.exclude(True)
+async def metrics(request: Request) -> HTTPResponse:  # pylint: disable=unused-argument
+    """
+    Expose the metrics, aggregated across all the worker processes if running multi-process.
+    :param request: the HTTP request object.
+    :return: the metrics in the Prometheus text format.
+    """
+    registry = REGISTRY
+    if "prometheus_multiproc_dir" in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    return raw(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def register_route_metrics(app: Sanic) -> None:
+    """
+    Record the latency, status code and response size of every request by route, and the number
+    of requests in flight, exposing them on the metrics route unless the app already does.
+    Recording only takes a couple of timer reads and label lookups per request.
+    :param app: the Sanic application.
+    """
+    app.register_middleware(_on_request, "request")
+    app.register_middleware(_on_response, "response")
+    if METRICS_ROUTE not in app.router.routes_all:
+        app.add_route(metrics, METRICS_ROUTE, methods=["GET"])
@@ -0,0 +1,73 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# pylint: disable=unused-argument
+
+import threading
+import time
+
+from pymongo import monitoring
+
+from immuni_exposure_reporting.monitoring.api import (
+    MONGO_POOL_CHECKOUT_FAILURES,
+    MONGO_POOL_CHECKOUT_WAIT,
+)
+
+
+class PoolCheckoutListener(monitoring.ConnectionPoolListener):
+    """
+    Listener of the MongoDB connection pool events, measuring how long threads wait to check out
+    a connection. Checkout events are published synchronously by the thread checking out, so the
+    start of each checkout is kept in thread-local storage.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def connection_check_out_started(
+        self, event: monitoring.ConnectionCheckOutStartedEvent
+    ) -> None:
+        self._local.start = time.perf_counter()
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        start = getattr(self._local, "start", None)
+        if start is not None:
+            MONGO_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+            self._local.start = None
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        self._local.start = None
+        MONGO_POOL_CHECKOUT_FAILURES.labels(reason=event.reason).inc()
+
+    # The remaining events are not of interest.
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        pass
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        pass
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        pass
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        pass
@@ -13,7 +13,12 @@
 
 from immuni_common.sanic import create_app, run_app
 from immuni_exposure_reporting.apis import keys
+from immuni_exposure_reporting.core import config
 from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers.openapi import remove_openapi
+from immuni_exposure_reporting.helpers.profiler import setup_profiler
+from immuni_exposure_reporting.helpers.warmup import warm_up
+from immuni_exposure_reporting.monitoring.middleware import register_route_metrics
 
 sanic_app = create_app(
     api_title="Exposure Reporting Service",
@@ -28,6 +33,11 @@ sanic_app = create_app(
     blueprints=(keys.bp,),
     managers=managers,
 )
+if not config.OPENAPI_ENABLED:
+    remove_openapi(sanic_app)
+sanic_app.register_listener(warm_up, "before_server_start")
+sanic_app.register_listener(setup_profiler, "before_server_start")
+register_route_metrics(sanic_app)
 
 if __name__ == "__main__":  # pragma: no cover
     run_app(sanic_app)
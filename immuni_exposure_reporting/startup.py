@@ -0,0 +1,111 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Startup-time report of the Exposure Reporting Service, breaking down the time a worker spends
+importing the service's modules, creating the Sanic app and running its server start listeners
+(e.g., the managers initialization, the warm-up and, if enabled, the OpenAPI spec building), i.e.,
+the cost paid again whenever a worker is recycled after API_WORKER_MAX_REQUESTS requests.
+
+Imports are only measured faithfully by a fresh interpreter, so the report is meant to be run as a
+standalone process, e.g. (with OPENAPI_ENABLED=false, to measure a production worker):
+
+    python -m immuni_exposure_reporting.startup
+
+The report is printed as JSON on the last line of the output, and the exit status is non-zero if
+the total exceeds STARTUP_BUDGET_IN_SECONDS.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from asyncio import AbstractEventLoop
+from importlib import import_module
+from inspect import isawaitable
+from typing import Any, Dict
+
+# The modules the app module imports, measured before creating the app.
+_APP_DEPENDENCIES = (
+    "immuni_common.sanic",
+    "immuni_exposure_reporting.apis.keys",
+    "immuni_exposure_reporting.core.config",
+    "immuni_exposure_reporting.core.managers",
+    "immuni_exposure_reporting.helpers.profiler",
+    "immuni_exposure_reporting.helpers.warmup",
+    "immuni_exposure_reporting.models.enums",
+    "immuni_exposure_reporting.monitoring.middleware",
+)
+_APP_MODULE = "immuni_exposure_reporting.sanic"
+
+
+async def _trigger_listeners(app: Any, loop: AbstractEventLoop, *events: str) -> None:
+    # The same listeners, in the same order, as the ones of the ASGI lifespan events.
+    for event in events:
+        for listener in app.listeners.get(event, []):
+            result = listener(app, loop)
+            if isawaitable(result):
+                await result
+
+
+def measure_startup() -> Dict[str, float]:
+    """
+    Measure the startup phases of a worker in the current interpreter, which must not have
+    imported the service yet.
+    :return: the duration of each phase and their total, in seconds.
+    """
+    start = time.perf_counter()
+    for module in _APP_DEPENDENCIES:
+        import_module(module)
+    imported = time.perf_counter()
+    import_module(_APP_MODULE)
+    created = time.perf_counter()
+
+    # Already imported, hence not measured.
+    from immuni_exposure_reporting.sanic import sanic_app  # pylint: disable=import-outside-toplevel
+
+    loop = asyncio.new_event_loop()
+    try:
+        starting = time.perf_counter()
+        loop.run_until_complete(
+            _trigger_listeners(sanic_app, loop, "before_server_start", "after_server_start")
+        )
+        started = time.perf_counter()
+        loop.run_until_complete(
+            _trigger_listeners(sanic_app, loop, "before_server_stop", "after_server_stop")
+        )
+    finally:
+        loop.close()
+
+    durations = dict(
+        imports=imported - start, app_creation=created - imported, server_start=started - starting,
+    )
+    durations["total"] = sum(durations.values())
+    return {phase: round(duration, 4) for phase, duration in durations.items()}
+
+
+def main() -> None:
+    """
+    Print the startup-time report, exiting with a non-zero status if over budget.
+    """
+    report = measure_startup()
+    from immuni_exposure_reporting.core import config  # pylint: disable=import-outside-toplevel
+
+    budget = config.STARTUP_BUDGET_IN_SECONDS
+    print(json.dumps(dict(**report, budget=budget)))
+    if report["total"] > budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
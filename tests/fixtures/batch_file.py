@@ -15,13 +15,14 @@ import base64
 import random
 import string
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 
 import pytest
 
 from immuni_common.models.enums import TransmissionRiskLevel
 from immuni_common.models.mongoengine.batch_file import BatchFile
 from immuni_common.models.mongoengine.temporary_exposure_key import TemporaryExposureKey
+from immuni_exposure_reporting.helpers.batches import BATCH_FRAME_HEADER
 
 
 def generate_random_key_data(length: int = 128) -> str:
@@ -43,7 +44,12 @@ def generate_random_batch(
         for _ in range(num_keys)
     ]
     BatchFile(
-        index=index, keys=keys, period_start=period_start, period_end=period_end, origin="IT"
+        index=index,
+        keys=keys,
+        period_start=period_start,
+        period_end=period_end,
+        origin="IT",
+        client_content=generate_random_key_data().encode("utf-8"),
     ).save()
 
 
@@ -92,3 +98,13 @@ def batch_file() -> BatchFile:
     )
     batch.save()
     return batch
+
+
+def parse_frames(body: bytes) -> Dict[int, bytes]:
+    frames = dict()
+    while body:
+        index, size = BATCH_FRAME_HEADER.unpack_from(body)
+        body = body[BATCH_FRAME_HEADER.size :]
+        frames[index] = body[:size]
+        body = body[size:]
+    return frames
@@ -45,7 +45,12 @@ def generate_random_batch_eu(
         for _ in range(num_keys)
     ]
     BatchFileEu(
-        index=index, keys=keys, period_start=period_start, period_end=period_end, origin=origin
+        index=index,
+        keys=keys,
+        period_start=period_start,
+        period_end=period_end,
+        origin=origin,
+        client_content=generate_random_key_data_eu().encode("utf-8"),
     ).save()
 
 
@@ -18,6 +18,7 @@ from mongoengine import get_db
 from pytest import fixture
 from pytest_sanic.utils import TestClient
 from sanic import Sanic
+from sanic.testing import SanicASGITestClient
 
 from immuni_exposure_reporting.core.managers import managers
 
@@ -48,3 +49,10 @@ def client(
     sanic_custom_client: Callable[[Sanic], Awaitable[TestClient]],
 ) -> TestClient:
     return loop.run_until_complete(sanic_custom_client(sanic))
+
+
+@fixture
+def asgi_client(sanic: Sanic) -> SanicASGITestClient:
+    yield sanic.asgi_client
+    # The ASGI test client switches the application to ASGI for good.
+    sanic.asgi = False
@@ -0,0 +1,78 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from unittest.mock import patch
+
+from sanic.testing import SanicASGITestClient
+
+from immuni_common.helpers.tests import mock_config
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers.batch_cache import BatchCache
+from immuni_exposure_reporting.helpers.batch_mirror import BatchMirror
+from tests.fixtures.batch_file import create_random_batches, parse_frames
+
+# The uvicorn workers serve the application through ASGI, where Sanic 19.9 does not frame the
+# streaming responses itself: check that their status, headers and body come out unchanged.
+
+
+async def _check_batch(asgi_client: SanicASGITestClient, batch_file: BatchFile) -> None:
+    _, response = await asgi_client.get("/v1/keys/1")
+    assert response.status == 200
+    assert response.headers["Content-Length"] == str(len(batch_file.client_content))
+    assert response.body == batch_file.client_content
+
+    _, response = await asgi_client.get("/v1/keys/1", headers={"Range": "bytes=10-"})
+    assert response.status == 206
+    assert response.headers["Content-Range"] == "bytes 10-17/18"
+    assert response.headers["Content-Length"] == "8"
+    assert response.body == batch_file.client_content[10:]
+
+
+async def test_batch_asgi(asgi_client: SanicASGITestClient, batch_file: BatchFile) -> None:
+    await _check_batch(asgi_client, batch_file)
+
+
+@mock_config(config, "BATCH_RESPONSE_STREAMING", True)
+@mock_config(config, "STREAM_CHUNK_SIZE_IN_BYTES", 4)
+async def test_batch_streamed_asgi(asgi_client: SanicASGITestClient, batch_file: BatchFile) -> None:
+    await _check_batch(asgi_client, batch_file)
+
+
+@mock_config(config, "STREAM_CHUNK_SIZE_IN_BYTES", 4)
+async def test_batch_mirrored_asgi(
+    asgi_client: SanicASGITestClient, batch_file: BatchFile, tmp_path: Path
+) -> None:
+    with patch.object(managers, "_batch_mirror", BatchMirror(str(tmp_path))):
+        await _check_batch(asgi_client, batch_file)
+        assert managers.batch_mirror.read((None, 1)) == batch_file.client_content
+
+        BatchFile.drop_collection()
+        with patch.object(managers, "_batch_cache", BatchCache(max_size=0)):
+            # Read from the mirror first, then streamed from it once the digest is known.
+            await _check_batch(asgi_client, batch_file)
+            await _check_batch(asgi_client, batch_file)
+
+
+@mock_config(config, "STREAM_CHUNK_SIZE_IN_BYTES", 7)
+async def test_batches_asgi(asgi_client: SanicASGITestClient) -> None:
+    create_random_batches(5)
+
+    _, response = await asgi_client.get("/v1/keys/range", params={"from": 1, "to": 3})
+    assert response.status == 200
+    assert response.content_type == "application/octet-stream"
+    assert response.headers["Content-Length"] == str(len(response.body))
+    frames = parse_frames(response.body)
+    assert frames == {index: BatchFile.from_index(index).client_content for index in (1, 2, 3)}
@@ -0,0 +1,98 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from immuni_exposure_reporting.helpers.batch_cache import BatchCache, DigestCache
+from immuni_exposure_reporting.helpers.chunked_content import ChunkedContent
+
+
+def test_cache_miss() -> None:
+    cache = BatchCache(max_size=10)
+    assert cache.get((None, 1)) is None
+    assert cache.misses == 1
+    assert cache.hits == 0
+
+
+def test_cache_hit() -> None:
+    cache = BatchCache(max_size=10)
+    cache.put((None, 1), b"zip", "digest")
+    cache.put(("DK", 1), b"zip_dk", "digest")
+    assert cache.get((None, 1)) == b"zip"
+    assert cache.get(("DK", 1)) == b"zip_dk"
+    assert cache.hits == 2
+    assert cache.size == 9
+
+
+def test_cache_lru_eviction() -> None:
+    cache = BatchCache(max_size=10)
+    cache.put((None, 1), b"1234", "digest")
+    cache.put((None, 2), b"1234", "digest")
+    cache.get((None, 1))
+    cache.put((None, 3), b"1234", "digest")
+
+    assert cache.get((None, 2)) is None
+    assert cache.get((None, 1)) == b"1234"
+    assert cache.get((None, 3)) == b"1234"
+    assert cache.evictions == 1
+    assert cache.size == 8
+    assert len(cache) == 2
+
+
+def test_cache_replace() -> None:
+    cache = BatchCache(max_size=10)
+    cache.put((None, 1), b"1234", "digest")
+    cache.put((None, 1), b"123456", "digest")
+    assert cache.size == 6
+    assert len(cache) == 1
+
+
+def test_cache_too_large() -> None:
+    cache = BatchCache(max_size=10)
+    cache.put((None, 1), b"12345678901", "digest")
+    assert cache.get((None, 1)) is None
+    assert cache.size == 0
+    assert cache.get_digest((None, 1)) == "digest"
+
+
+def test_cache_digest_survives_eviction() -> None:
+    cache = BatchCache(max_size=4)
+    cache.put((None, 1), b"1234", "first")
+    cache.put((None, 2), b"1234", "second")
+    assert cache.get((None, 1)) is None
+    assert cache.get_digest((None, 1)) == "first"
+    assert cache.get_digest((None, 2)) == "second"
+    assert cache.get_digest((None, 3)) is None
+
+
+def test_digest_cache_bounded() -> None:
+    digests = DigestCache(max_entries=2)
+    digests.put((None, 1), "first")
+    digests.put((None, 2), "second")
+    digests.get((None, 1))
+    digests.put((None, 3), "third")
+
+    assert len(digests) == 2
+    assert digests.get((None, 1)) == "first"
+    assert digests.get((None, 2)) is None
+    assert digests.get((None, 3)) == "third"
+
+
+def test_cache_chunked() -> None:
+    cache = BatchCache(max_size=10)
+    chunked = ChunkedContent(file_id="file", length=100, digest="digest")
+    assert cache.get_chunked((None, 1)) is None
+
+    cache.put_chunked((None, 1), chunked)
+    assert cache.get_chunked((None, 1)) == chunked
+    assert cache.get_digest((None, 1)) == "digest"
+    assert cache.get((None, 1)) is None
+    assert cache.size == 0
@@ -11,7 +11,9 @@
 #    You should have received a copy of the GNU Affero General Public License
 #    along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-from datetime import timedelta
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict
 
 import pytest
 from pytest_sanic.utils import TestClient
@@ -19,7 +21,8 @@ from pytest_sanic.utils import TestClient
 from immuni_common.helpers.tests import mock_config
 from immuni_common.models.mongoengine.batch_file import BatchFile
 from immuni_exposure_reporting.core import config
-from tests.fixtures.batch_file import create_random_batches
+from immuni_exposure_reporting.core.managers import managers
+from tests.fixtures.batch_file import create_random_batches, generate_random_batch, parse_frames
 
 
 async def test_index_no_batches(client: TestClient) -> None:
@@ -48,6 +51,109 @@ async def test_batch(client: TestClient, batch_file: BatchFile) -> None:
     assert response.content_type == "application/zip"
 
 
+async def test_batch_cached(client: TestClient, batch_file: BatchFile) -> None:
+    for _ in range(2):
+        response = await client.get("/v1/keys/1")
+        assert response.status == 200
+        assert await response.read() == batch_file.client_content
+
+    assert managers.batch_cache.misses == 1
+    assert managers.batch_cache.hits == 1
+
+
+async def test_batch_etag(client: TestClient, batch_file: BatchFile) -> None:
+    response = await client.get("/v1/keys/1")
+    assert response.status == 200
+    assert response.headers["ETag"] == f'"{hashlib.sha256(batch_file.client_content).hexdigest()}"'
+
+
+async def test_batch_not_modified(client: TestClient, batch_file: BatchFile) -> None:
+    etag = (await client.get("/v1/keys/1")).headers["ETag"]
+
+    response = await client.get("/v1/keys/1", headers={"If-None-Match": etag})
+    assert response.status == 304
+    assert response.headers["ETag"] == etag
+    assert response.headers["Cache-Control"] == "public, max-age=1296000"
+    assert await response.read() == b""
+
+
+async def test_batch_not_modified_without_loading(
+    client: TestClient, batch_file: BatchFile
+) -> None:
+    etag = (await client.get("/v1/keys/1")).headers["ETag"]
+    hits = managers.batch_cache.hits
+
+    response = await client.get("/v1/keys/1", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status == 304
+    assert managers.batch_cache.hits == hits
+
+
+async def test_batch_modified(client: TestClient, batch_file: BatchFile) -> None:
+    response = await client.get("/v1/keys/1", headers={"If-None-Match": '"other"'})
+    assert response.status == 200
+    assert await response.read() == batch_file.client_content
+
+
+@pytest.mark.parametrize(
+    "byte_range, content_range, expected",
+    (
+        ("bytes=0-3", "bytes 0-3/18", b"this"),
+        ("bytes=15-", "bytes 15-17/18", b"ile"),
+        ("bytes=-3", "bytes 15-17/18", b"ile"),
+        ("bytes=10-100", "bytes 10-17/18", b"zip_file"),
+    ),
+)
+async def test_batch_range(
+    client: TestClient, batch_file: BatchFile, byte_range: str, content_range: str, expected: bytes
+) -> None:
+    response = await client.get("/v1/keys/1", headers={"Range": byte_range})
+    assert response.status == 206
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Range"] == content_range
+    assert await response.read() == expected
+
+
+@mock_config(config, "BATCH_RESPONSE_STREAMING", True)
+@mock_config(config, "STREAM_CHUNK_SIZE_IN_BYTES", 4)
+async def test_batch_streamed(client: TestClient, batch_file: BatchFile) -> None:
+    response = await client.get("/v1/keys/1")
+    assert response.status == 200
+    assert response.content_type == "application/zip"
+    assert response.headers["Content-Length"] == str(len(batch_file.client_content))
+    assert await response.read() == batch_file.client_content
+
+    response = await client.get("/v1/keys/1", headers={"Range": "bytes=3-13"})
+    assert response.status == 206
+    assert response.headers["Content-Range"] == "bytes 3-13/18"
+    assert await response.read() == batch_file.client_content[3:14]
+
+
+async def test_batch_range_not_satisfiable(client: TestClient, batch_file: BatchFile) -> None:
+    response = await client.get("/v1/keys/1", headers={"Range": "bytes=18-"})
+    assert response.status == 416
+    assert response.headers["Content-Range"] == "bytes */18"
+
+
+@pytest.mark.parametrize("byte_range", ("bytes=0-1,4-5", "items=0-3", "bytes=5-1"))
+async def test_batch_range_ignored(
+    client: TestClient, batch_file: BatchFile, byte_range: str
+) -> None:
+    response = await client.get("/v1/keys/1", headers={"Range": byte_range})
+    assert response.status == 200
+    assert await response.read() == batch_file.client_content
+
+
+async def test_batch_range_if_range(client: TestClient, batch_file: BatchFile) -> None:
+    etag = (await client.get("/v1/keys/1")).headers["ETag"]
+
+    response = await client.get("/v1/keys/1", headers={"Range": "bytes=0-3", "If-Range": etag})
+    assert response.status == 206
+
+    response = await client.get("/v1/keys/1", headers={"Range": "bytes=0-3", "If-Range": '"old"'})
+    assert response.status == 200
+    assert await response.read() == batch_file.client_content
+
+
 async def test_batch_not_found(client: TestClient) -> None:
     response = await client.get("/v1/keys/1")
     assert response.status == 404
@@ -67,3 +173,163 @@ async def test_batch_weird_characters(client: TestClient, index: str) -> None:
 
     content = await response.json()
     assert content["message"] == "Request not compliant with the defined schema."
+
+
+async def test_batches(client: TestClient) -> None:
+    create_random_batches(5)
+
+    response = await client.get("/v1/keys/range", params={"from": 1, "to": 3})
+    assert response.status == 200
+    assert response.headers["Cache-Control"] == "public, max-age=1296000"
+    assert response.content_type == "application/octet-stream"
+
+    body = await response.read()
+    assert response.headers["Content-Length"] == str(len(body))
+    frames = parse_frames(body)
+    assert frames == {index: BatchFile.from_index(index).client_content for index in (1, 2, 3)}
+
+
+@mock_config(config, "STREAM_CHUNK_SIZE_IN_BYTES", 7)
+async def test_batches_chunked(client: TestClient) -> None:
+    create_random_batches(3)
+
+    response = await client.get("/v1/keys/range", params={"from": 1, "to": 2})
+    frames = parse_frames(await response.read())
+    assert frames == {index: BatchFile.from_index(index).client_content for index in (1, 2)}
+
+
+async def test_batches_beyond_newest(client: TestClient) -> None:
+    create_random_batches(5)
+
+    response = await client.get("/v1/keys/range", params={"from": 3, "to": 5})
+    assert response.status == 404
+    assert "Cache-Control" not in response.headers
+
+
+async def test_batches_after_newest(client: TestClient) -> None:
+    create_random_batches(5)
+    await managers.manifest_store.refresh()
+    # Created since the snapshot, and possibly already listed by the manifests of other workers.
+    generate_random_batch(
+        index=5, num_keys=1, period_start=datetime.utcnow(), period_end=datetime.utcnow()
+    )
+
+    response = await client.get("/v1/keys/range", params={"from": 3, "to": 5})
+    assert response.status == 200
+    body = await response.read()
+    assert response.headers["Content-Length"] == str(len(body))
+    assert parse_frames(body) == {
+        index: BatchFile.from_index(index).client_content for index in (3, 4, 5)
+    }
+
+
+async def test_batches_missing_batch(client: TestClient) -> None:
+    create_random_batches(5)
+    BatchFile.objects(index=2).delete()
+
+    response = await client.get("/v1/keys/range", params={"from": 1, "to": 3})
+    assert response.status == 404
+    assert "Cache-Control" not in response.headers
+
+
+async def test_batches_no_batches(client: TestClient) -> None:
+    response = await client.get("/v1/keys/range", params={"from": 1, "to": 1})
+    assert response.status == 404
+
+
+@mock_config(config, "MAX_BATCHES_PER_RANGE_REQUEST", 10)
+@pytest.mark.parametrize(
+    "params", ({}, {"from": 1}, {"to": 1}, {"from": 3, "to": 2}, {"from": 1, "to": 11})
+)
+async def test_batches_invalid_range(client: TestClient, params: Dict[str, int]) -> None:
+    response = await client.get("/v1/keys/range", params=params)
+    assert response.status == 400
+
+
+async def test_since(client: TestClient) -> None:
+    create_random_batches(5)
+
+    response = await client.get("/v1/keys/since/2")
+    assert response.status == 200
+    assert response.headers["Cache-Control"] == "public, max-age=1800"
+    content = await response.json()
+    assert content["oldest"] == 0
+    assert content["newest"] == 4
+    assert [batch["index"] for batch in content["batches"]] == [3, 4]
+    for batch in content["batches"]:
+        client_content = BatchFile.from_index(batch["index"]).client_content
+        assert batch["size"] == len(client_content)
+        assert batch["digest"] == hashlib.sha256(client_content).hexdigest()
+        assert "sub_batch_index" in batch
+        assert "sub_batch_count" in batch
+
+
+async def test_since_sub_batches(client: TestClient, batch_file: BatchFile) -> None:
+    response = await client.get("/v1/keys/since/0")
+    assert response.status == 200
+    (batch,) = (await response.json())["batches"]
+    assert batch["sub_batch_index"] == 1
+    assert batch["sub_batch_count"] == 2
+
+
+async def test_since_newest(client: TestClient) -> None:
+    create_random_batches(5)
+    response = await client.get("/v1/keys/since/4")
+    assert response.status == 200
+    assert await response.json() == {"oldest": 0, "newest": 4, "batches": []}
+
+
+async def test_since_new_batches(client: TestClient) -> None:
+    create_random_batches(3)
+    response = await client.get("/v1/keys/since/1")
+    assert [batch["index"] for batch in (await response.json())["batches"]] == [2]
+
+    generate_random_batch(
+        index=3,
+        num_keys=1,
+        period_start=datetime.utcnow() - timedelta(hours=1),
+        period_end=datetime.utcnow(),
+    )
+    await managers.manifest_store.refresh()
+    response = await client.get("/v1/keys/since/1")
+    assert [batch["index"] for batch in (await response.json())["batches"]] == [2, 3]
+
+
+async def test_since_no_batches(client: TestClient) -> None:
+    response = await client.get("/v1/keys/since/0")
+    assert response.status == 404
+
+
+async def test_index_grouped(client: TestClient) -> None:
+    create_random_batches(3)
+    response = await client.get("/v2/keys/index")
+    assert response.status == 200
+    assert response.headers["Cache-Control"] == "public, max-age=1800"
+    content = await response.json()
+    assert content["oldest"] == 0
+    assert content["newest"] == 2
+    assert [(batch["indexes"], batch["complete"]) for batch in content["batches"]] == [
+        ([0], True),
+        ([1], True),
+        ([2], True),
+    ]
+
+
+async def test_index_grouped_sub_batches(client: TestClient, batch_file: BatchFile) -> None:
+    response = await client.get("/v2/keys/index")
+    assert response.status == 200
+    (batch,) = (await response.json())["batches"]
+    assert batch["indexes"] == [1]
+    assert batch["sub_batch_count"] == 2
+    assert batch["complete"] is False
+
+
+async def test_index_grouped_no_batches(client: TestClient) -> None:
+    response = await client.get("/v2/keys/index")
+    assert response.status == 404
+
+
+@pytest.mark.parametrize("index", ("-1", "abc", "1.5"))
+async def test_since_invalid(client: TestClient, index: str) -> None:
+    response = await client.get(f"/v1/keys/since/{index}")
+    assert response.status == 400
@@ -11,6 +11,7 @@
 #    You should have received a copy of the GNU Affero General Public License
 #    along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import hashlib
 from datetime import timedelta
 
 import pytest
@@ -19,6 +20,7 @@ from pytest_sanic.utils import TestClient
 from immuni_common.helpers.tests import mock_config
 from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
 from immuni_exposure_reporting.core import config
+from tests.fixtures.batch_file import parse_frames
 from tests.fixtures.batch_file_eu import create_random_batches_eu
 
 
@@ -43,6 +45,26 @@ async def test_index_eu(
     assert actual == {"oldest": oldest, "newest": newest}
 
 
+async def test_index_eu_all_no_batches(client: TestClient) -> None:
+    response = await client.get("/v1/keys/eu/index")
+    assert response.status == 404
+
+
+@mock_config(config, "MANIFEST_CACHE_TIME_IN_MINUTES", timedelta(minutes=30).total_seconds())
+@pytest.mark.parametrize("num_batches, oldest, newest", ((1, 0, 0), (10, 0, 9), (20, 6, 19)))
+async def test_index_eu_all(client: TestClient, num_batches: int, oldest: int, newest: int) -> None:
+    create_random_batches_eu(num_batches)
+
+    response = await client.get("/v1/keys/eu/index")
+    assert response.status == 200
+    assert response.headers["Cache-Control"] == "public, max-age=1800"
+
+    actual = await response.json()
+    assert actual == {
+        country: {"oldest": oldest, "newest": newest} for country in ("AT", "DE", "DK", "ES")
+    }
+
+
 @pytest.mark.parametrize("country", ("DK", "DE", "AT", "ES"))
 async def test_batch_eu(client: TestClient, batch_file_eu: BatchFileEu, country: str) -> None:
     response = await client.get(f"/v1/keys/eu/{country}/1")
@@ -52,6 +74,25 @@ async def test_batch_eu(client: TestClient, batch_file_eu: BatchFileEu, country:
     assert response.content_type == "application/zip"
 
 
+@pytest.mark.parametrize("country", ("DK", "DE", "AT", "ES"))
+async def test_batch_eu_not_modified(
+    client: TestClient, batch_file_eu: BatchFileEu, country: str
+) -> None:
+    etag = (await client.get(f"/v1/keys/eu/{country}/1")).headers["ETag"]
+
+    response = await client.get(f"/v1/keys/eu/{country}/1", headers={"If-None-Match": etag})
+    assert response.status == 304
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("country", ("DK", "DE", "AT", "ES"))
+async def test_batch_eu_range(client: TestClient, batch_file_eu: BatchFileEu, country: str) -> None:
+    response = await client.get(f"/v1/keys/eu/{country}/1", headers={"Range": "bytes=0-3"})
+    assert response.status == 206
+    assert response.headers["Content-Range"] == "bytes 0-3/18"
+    assert await response.read() == b"this"
+
+
 @pytest.mark.parametrize("country", ("DK", "DE", "AT", "ES"))
 async def test_batch_eu_not_found(client: TestClient, country: str) -> None:
     response = await client.get(f"/v1/keys/eu/{country}/1")
@@ -85,3 +126,61 @@ async def test_batch_eu_country_weird_characters(client: TestClient, country: st
 
     content = await response.json()
     assert content["message"] == "Request not compliant with the defined schema."
+
+
+@pytest.mark.parametrize("country", ("DK", "DE", "AT", "ES"))
+async def test_batches_eu(client: TestClient, country: str) -> None:
+    create_random_batches_eu(5)
+
+    response = await client.get(f"/v1/keys/eu/{country}/range", params={"from": 2, "to": 4})
+    assert response.status == 200
+    assert response.headers["Cache-Control"] == "public, max-age=1296000"
+
+    frames = parse_frames(await response.read())
+    assert frames == {
+        index: BatchFileEu.from_index(country=country, index=index).client_content
+        for index in (2, 3, 4)
+    }
+
+
+@pytest.mark.parametrize("country", ("DK", "DE", "AT", "ES"))
+async def test_since_eu(client: TestClient, country: str) -> None:
+    create_random_batches_eu(5)
+
+    response = await client.get(f"/v1/keys/eu/{country}/since/2")
+    assert response.status == 200
+    content = await response.json()
+    assert (content["oldest"], content["newest"]) == (0, 4)
+    assert [batch["index"] for batch in content["batches"]] == [3, 4]
+    for batch in content["batches"]:
+        client_content = BatchFileEu.from_index(
+            country=country, index=batch["index"]
+        ).client_content
+        assert batch["size"] == len(client_content)
+        assert batch["digest"] == hashlib.sha256(client_content).hexdigest()
+
+
+@pytest.mark.parametrize("country", ("AT", "DE", "DK", "ES"))
+async def test_index_grouped_eu(client: TestClient, country: str) -> None:
+    create_random_batches_eu(3)
+    response = await client.get(f"/v2/keys/eu/{country}/index")
+    assert response.status == 200
+    content = await response.json()
+    assert (content["oldest"], content["newest"]) == (0, 2)
+    assert [batch["indexes"] for batch in content["batches"]] == [[0], [1], [2]]
+
+
+async def test_index_grouped_eu_no_batches(client: TestClient) -> None:
+    response = await client.get("/v2/keys/eu/FR/index")
+    assert response.status == 404
+
+
+async def test_since_eu_no_batches(client: TestClient) -> None:
+    response = await client.get("/v1/keys/eu/FR/since/0")
+    assert response.status == 404
+
+
+@pytest.mark.parametrize("country", ("ITA", "none", "it"))
+async def test_since_eu_invalid_country(client: TestClient, country: str) -> None:
+    response = await client.get(f"/v1/keys/eu/{country}/since/0")
+    assert response.status == 400
@@ -0,0 +1,120 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from pytest_sanic.utils import TestClient
+
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers.batch_cache import BatchCache
+from immuni_exposure_reporting.helpers.batch_mirror import BatchMirror
+
+
+def test_mirror_path(tmp_path: Path) -> None:
+    mirror = BatchMirror(str(tmp_path))
+    assert mirror.path((None, 1)) == str(tmp_path / "national" / "1.zip")
+    assert mirror.path(("DK", 1)) == str(tmp_path / "DK" / "1.zip")
+
+
+def test_mirror_write_read(tmp_path: Path) -> None:
+    mirror = BatchMirror(str(tmp_path))
+    assert mirror.read((None, 1)) is None
+    assert mirror.open((None, 1)) is None
+
+    mirror.write((None, 1), b"zip", period_end=datetime.utcnow())
+    assert mirror.read((None, 1)) == b"zip"
+    assert os.listdir(tmp_path / "national") == ["1.zip"]
+
+
+def test_mirror_cleanup(tmp_path: Path) -> None:
+    mirror = BatchMirror(str(tmp_path))
+    now = datetime.utcnow()
+    # Mirrored just now, but its period ended before the window.
+    mirror.write((None, 1), b"zip", period_end=now - timedelta(days=2))
+    # The oldest TEK Chunk still in the window: its period started before it, but ends within it.
+    mirror.write(("DK", 2), b"zip", period_end=now - timedelta(hours=12))
+
+    assert mirror.cleanup(since=now - timedelta(days=1)) == 1
+    assert mirror.read((None, 1)) is None
+    assert mirror.read(("DK", 2)) == b"zip"
+
+
+def test_mirror_cleanup_skips_temporary_files(tmp_path: Path) -> None:
+    mirror = BatchMirror(str(tmp_path))
+    mirror.write((None, 1), b"zip", period_end=datetime.utcnow() - timedelta(days=2))
+    # A zip file being written by a worker, already stamped with the end of its period.
+    temporary_path = mirror.path((None, 2)) + ".1234.tmp"
+    Path(temporary_path).write_bytes(b"zip")
+    os.utime(temporary_path, (0, 0))
+
+    assert mirror.cleanup(since=datetime.utcnow()) == 1
+    assert os.path.exists(temporary_path)
+
+
+def test_mirror_open_survives_cleanup(tmp_path: Path) -> None:
+    mirror = BatchMirror(str(tmp_path))
+    mirror.write((None, 1), b"zip", period_end=datetime.utcnow() - timedelta(days=2))
+
+    file = mirror.open((None, 1))
+    assert mirror.cleanup(since=datetime.utcnow()) == 1
+    with file:
+        assert file.read() == b"zip"
+
+
+async def test_batch_served_from_mirror(
+    client: TestClient, batch_file: BatchFile, tmp_path: Path
+) -> None:
+    with patch.object(managers, "_batch_mirror", BatchMirror(str(tmp_path))):
+        response = await client.get("/v1/keys/1")
+        assert response.status == 200
+        assert await response.read() == batch_file.client_content
+        assert managers.batch_mirror.read((None, 1)) == batch_file.client_content
+
+        BatchFile.drop_collection()
+        with patch.object(managers, "_batch_cache", BatchCache(max_size=0)):
+            # Neither the zip file nor its digest is in memory: they are read from the mirror.
+            response = await client.get("/v1/keys/1")
+            assert response.status == 200
+            assert await response.read() == batch_file.client_content
+
+            # The digest is now known, so the zip file is streamed from the mirror.
+            response = await client.get("/v1/keys/1")
+            assert response.status == 200
+            assert response.content_type == "application/zip"
+            assert response.headers["Content-Length"] == str(len(batch_file.client_content))
+            assert await response.read() == batch_file.client_content
+
+            response = await client.get("/v1/keys/1", headers={"Range": "bytes=10-"})
+            assert response.status == 206
+            assert response.headers["Content-Range"] == "bytes 10-17/18"
+            assert await response.read() == batch_file.client_content[10:]
+
+
+async def test_batch_removed_from_mirror(
+    client: TestClient, batch_file: BatchFile, tmp_path: Path
+) -> None:
+    with patch.object(managers, "_batch_mirror", BatchMirror(str(tmp_path))):
+        response = await client.get("/v1/keys/1")
+        assert response.status == 200
+        os.remove(managers.batch_mirror.path((None, 1)))
+
+        with patch.object(managers, "_batch_cache", BatchCache(max_size=0)):
+            managers.batch_cache.put_digest((None, 1), response.headers["ETag"].strip('"'))
+            # The digest is known but the zip file is gone: it is fetched from the database.
+            response = await client.get("/v1/keys/1")
+            assert response.status == 200
+            assert await response.read() == batch_file.client_content
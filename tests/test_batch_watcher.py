@@ -0,0 +1,72 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from immuni_common.helpers.tests import mock_config
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers.batch_watcher import BatchWatcher, fetch_newest_indexes
+from immuni_exposure_reporting.helpers.manifest import ManifestStore
+from tests.fixtures.batch_file import create_random_batches, generate_random_batch
+from tests.fixtures.batch_file_eu import create_random_batches_eu, generate_random_batch_eu
+
+
+def test_fetch_newest_indexes() -> None:
+    create_random_batches(5)
+    create_random_batches_eu(3)
+    assert fetch_newest_indexes(["DK", "FR"]) == {None: 4, "DK": 2}
+
+
+def test_fetch_newest_indexes_no_batches() -> None:
+    assert fetch_newest_indexes(["DK"]) == dict()
+
+
+async def _wait_for_newest(store: ManifestStore, country: Optional[str], newest: int) -> None:
+    while True:
+        snapshot = store.get_snapshot(country)
+        if snapshot is not None and snapshot.newest == newest:
+            return
+        await asyncio.sleep(0.01)
+
+
+async def test_watcher_refreshes_on_insert() -> None:
+    create_random_batches(5)
+    create_random_batches_eu(5)
+    store = ManifestStore(executor=managers.mongo_executor)
+    await store.refresh()
+
+    with mock_config(config, "BATCH_WATCH_POLL_INTERVAL_IN_SECONDS", 0):
+        watcher = asyncio.create_task(BatchWatcher(store, managers.mongo_executor).run())
+        try:
+            # Let the watcher start watching (or polling) before inserting.
+            await asyncio.sleep(0.5)
+            now = datetime.utcnow()
+            generate_random_batch(
+                index=5, num_keys=1, period_start=now - timedelta(hours=1), period_end=now
+            )
+            generate_random_batch_eu(
+                index=5,
+                num_keys=1,
+                period_start=now - timedelta(hours=1),
+                period_end=now,
+                origin="DK",
+            )
+            await asyncio.wait_for(_wait_for_newest(store, None, 5), timeout=5)
+            await asyncio.wait_for(_wait_for_newest(store, "DK", 5), timeout=5)
+            assert store.get_snapshot("DE").newest == 4
+        finally:
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
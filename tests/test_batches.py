@@ -0,0 +1,63 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from mongoengine import DoesNotExist
+from pytest import raises
+
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers import batches
+from immuni_exposure_reporting.helpers.batches import fetch_batch_content, get_batch_content
+
+
+def test_fetch_batch_content(batch_file: BatchFile) -> None:
+    assert fetch_batch_content(None, 1) == batch_file.client_content
+
+
+@pytest.mark.parametrize("country", ("DK", "DE", "AT", "ES"))
+def test_fetch_batch_content_eu(batch_file_eu: BatchFileEu, country: str) -> None:
+    assert fetch_batch_content(country, 1) == batch_file_eu.client_content
+
+
+@pytest.mark.parametrize("country", (None, "DK"))
+def test_fetch_batch_content_not_found(country: str) -> None:
+    with raises(DoesNotExist):
+        fetch_batch_content(country, 1)
+
+
+def test_fetch_batch_content_other_country(batch_file: BatchFile) -> None:
+    with raises(DoesNotExist):
+        fetch_batch_content("DK", 1)
+
+
+async def test_get_batch_content_coalesced(batch_file: BatchFile) -> None:
+    with patch.object(
+        batches, "fetch_batch_source", wraps=batches.fetch_batch_source
+    ) as fetch_mock:
+        contents = await asyncio.gather(*(get_batch_content(None, 1) for _ in range(10)))
+
+    assert contents == [batch_file.client_content] * 10
+    assert fetch_mock.call_count == 1
+    assert managers.batch_cache.get((None, 1)) == batch_file.client_content
+
+
+async def test_get_batch_content_coalesced_not_found() -> None:
+    results = await asyncio.gather(
+        *(get_batch_content(None, 1) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, DoesNotExist) for result in results)
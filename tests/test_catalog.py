@@ -0,0 +1,154 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_exposure_reporting.helpers.catalog import (
+    BatchCatalog,
+    BatchEntry,
+    fetch_batch_entries,
+    fetch_eu_batch_entries,
+)
+from tests.fixtures.batch_file import create_random_batches
+from tests.fixtures.batch_file_eu import create_random_batches_eu
+
+_PERIOD_END = datetime(2020, 10, 1)
+
+
+def _entry(
+    index: int,
+    period: int = 0,
+    sub_batch_index: Optional[int] = None,
+    sub_batch_count: Optional[int] = None,
+) -> BatchEntry:
+    return BatchEntry.from_document(
+        dict(
+            index=index,
+            client_content=b"zip",
+            period_start=_PERIOD_END + timedelta(days=period - 1),
+            period_end=_PERIOD_END + timedelta(days=period),
+            sub_batch_index=sub_batch_index,
+            sub_batch_count=sub_batch_count,
+        )
+    )
+
+
+def test_entry_serialized() -> None:
+    entry = _entry(1)
+    assert entry.serialized == (
+        b'{"index":1,"size":3,"digest":"%b","sub_batch_index":null,"sub_batch_count":null}'
+        % entry.digest.encode()
+    )
+
+
+def test_catalog_update() -> None:
+    catalog = BatchCatalog()
+    assert catalog.newest is None
+
+    catalog.update([_entry(index) for index in range(1, 6)], oldest=1)
+    assert catalog.newest == 5
+    catalog.update([_entry(5), _entry(6)], oldest=3)
+    assert len(catalog) == 4
+    assert [entry.index for entry in catalog.since(0)] == [3, 4, 5, 6]
+
+
+def test_catalog_since() -> None:
+    catalog = BatchCatalog()
+    catalog.update([_entry(index) for index in range(1, 6)], oldest=1)
+    assert [entry.index for entry in catalog.since(3)] == [4, 5]
+    assert catalog.since(5) == []
+    assert catalog.serialize_since(5, oldest=1, newest=5) == (
+        b'{"oldest":1,"newest":5,"batches":[]}'
+    )
+
+
+def test_catalog_grouped() -> None:
+    catalog = BatchCatalog()
+    catalog.update(
+        [
+            _entry(1, period=0),
+            _entry(2, period=1, sub_batch_index=1, sub_batch_count=2),
+            _entry(3, period=1, sub_batch_index=2, sub_batch_count=2),
+            _entry(4, period=2, sub_batch_index=1, sub_batch_count=3),
+        ],
+        oldest=1,
+    )
+    grouped = json.loads(catalog.serialize_grouped(oldest=1, newest=4))
+    assert grouped["oldest"] == 1
+    assert grouped["newest"] == 4
+    assert [
+        (group["indexes"], group["sub_batch_count"], group["complete"])
+        for group in grouped["batches"]
+    ] == [([1], 1, True), ([2, 3], 2, True), ([4], 3, False)]
+    assert grouped["batches"][1]["period_start"] == "2020-10-01T00:00:00"
+    assert grouped["batches"][1]["period_end"] == "2020-10-02T00:00:00"
+
+    catalog.update([_entry(5, period=2, sub_batch_index=2, sub_batch_count=3)], oldest=3)
+    grouped = json.loads(catalog.serialize_grouped(oldest=3, newest=5))
+    assert [(group["indexes"], group["complete"]) for group in grouped["batches"]] == [
+        ([3], False),
+        ([4, 5], False),
+    ]
+
+
+def test_catalog_grouped_empty() -> None:
+    assert BatchCatalog().serialize_grouped(oldest=1, newest=1) == (
+        b'{"oldest":1,"newest":1,"batches":[]}'
+    )
+
+
+def test_fetch_batch_entries() -> None:
+    create_random_batches(5)
+    entries = fetch_batch_entries(None, 2)
+    assert [entry.index for entry in entries] == [3, 4]
+    assert entries[0].size == len(BatchFile.from_index(3).client_content)
+    assert fetch_batch_entries("DK", 0) == []
+
+
+def test_fetch_batch_entries_since() -> None:
+    create_random_batches(5)
+    entries = fetch_batch_entries(None, -1, since=datetime.utcnow() - timedelta(days=2))
+    assert [entry.index for entry in entries] == [3, 4]
+
+
+def test_fetch_eu_batch_entries() -> None:
+    create_random_batches_eu(5)
+    entries = fetch_eu_batch_entries(dict(DK=2, DE=4), since=datetime.utcnow() - timedelta(days=14))
+    assert set(entries) == {"AT", "DK", "ES"}
+    assert [entry.index for entry in entries["DK"]] == [3, 4]
+    assert [entry.index for entry in entries["AT"]] == [0, 1, 2, 3, 4]
+
+
+def test_fetch_batch_entries_known() -> None:
+    create_random_batches(5)
+    known = {index: _entry(index) for index in (0, 1)}
+    entries = fetch_batch_entries(None, -1, known=known)
+    assert [entry.index for entry in entries] == [0, 1, 2, 3, 4]
+    # Known entries are reused as they are, while the new ones are computed from their zip file.
+    assert entries[0] is known[0]
+    assert entries[1] is known[1]
+    assert entries[2].size == len(BatchFile.from_index(2).client_content)
+
+
+def test_fetch_eu_batch_entries_known() -> None:
+    create_random_batches_eu(2)
+    known = dict(DK={0: _entry(0)})
+    since = datetime.utcnow() - timedelta(days=14)
+    entries = fetch_eu_batch_entries(dict(), since=since, known=known)
+    assert set(entries) == {"AT", "DE", "DK", "ES"}
+    assert entries["DK"][0] is known["DK"][0]
+    assert [entry.index for entry in entries["DK"]] == [0, 1]
+    assert entries["DE"][0].digest != known["DK"][0].digest
@@ -0,0 +1,99 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+
+from gridfs import GridFSBucket
+from pytest_sanic.utils import TestClient
+
+from immuni_common.helpers.tests import mock_config
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers.batches import fetch_batch_content, get_batch_content
+from immuni_exposure_reporting.helpers.catalog import fetch_batch_entries
+from immuni_exposure_reporting.helpers.chunked_content import CHUNKED_CONTENT_FIELD, ChunkedContent
+
+_BUCKET = "batch_files"
+
+
+def _store_chunked(batch_file: BatchFile, content: bytes) -> None:
+    # pylint: disable=protected-access
+    bucket = GridFSBucket(BatchFile._get_db(), bucket_name=_BUCKET)
+    file_id = bucket.upload_from_stream("batch", content, chunk_size_bytes=1024)
+    BatchFile._get_collection().update_one(
+        {"_id": batch_file.id},
+        {"$set": {CHUNKED_CONTENT_FIELD: file_id}, "$unset": {"client_content": ""}},
+    )
+
+
+@mock_config(config, "BATCH_GRIDFS_BUCKET", _BUCKET)
+def test_fetch_chunked_content(batch_file: BatchFile) -> None:
+    content = os.urandom(10_000)
+    _store_chunked(batch_file, content)
+    assert fetch_batch_content(None, 1) == content
+
+    (entry,) = fetch_batch_entries(None, 0)
+    assert entry.size == len(content)
+    assert entry.digest == hashlib.sha256(content).hexdigest()
+
+
+@mock_config(config, "BATCH_GRIDFS_BUCKET", _BUCKET)
+def test_fetch_embedded_content(batch_file: BatchFile) -> None:
+    assert fetch_batch_content(None, 1) == batch_file.client_content
+
+
+@mock_config(config, "BATCH_GRIDFS_BUCKET", _BUCKET)
+async def test_get_chunked_content_not_cached(batch_file: BatchFile) -> None:
+    content = os.urandom(10_000)
+    _store_chunked(batch_file, content)
+
+    chunked = await get_batch_content(None, 1)
+    assert isinstance(chunked, ChunkedContent)
+    assert chunked.length == len(content)
+    assert managers.batch_cache.get((None, 1)) is None
+    assert managers.batch_cache.get_digest((None, 1)) == hashlib.sha256(content).hexdigest()
+    assert managers.batch_cache.get_chunked((None, 1)) == chunked
+
+    # The description of the GridFS file is cached, so the TEK Chunk is not queried again.
+    BatchFile.drop_collection()
+    assert await get_batch_content(None, 1) == chunked
+
+
+@mock_config(config, "BATCH_GRIDFS_BUCKET", _BUCKET)
+async def test_batch_streamed_from_chunks(client: TestClient, batch_file: BatchFile) -> None:
+    content = os.urandom(100_000)
+    _store_chunked(batch_file, content)
+
+    response = await client.get("/v1/keys/1")
+    assert response.status == 200
+    assert response.headers["Content-Length"] == str(len(content))
+    assert response.headers["ETag"] == f'"{hashlib.sha256(content).hexdigest()}"'
+    assert await response.read() == content
+
+    response = await client.get("/v1/keys/1", headers={"Range": "bytes=5000-70000"})
+    assert response.status == 206
+    assert await response.read() == content[5000:70001]
+
+
+@mock_config(config, "BATCH_GRIDFS_BUCKET", _BUCKET)
+async def test_batches_streamed_from_chunks(client: TestClient, batch_file: BatchFile) -> None:
+    content = os.urandom(100_000)
+    _store_chunked(batch_file, content)
+
+    response = await client.get("/v1/keys/range", params={"from": 1, "to": 1})
+    assert response.status == 200
+    body = await response.read()
+    assert body[12:] == content
+    assert len(body) == 12 + len(content)
@@ -0,0 +1,140 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+from datetime import datetime
+from pathlib import Path
+
+from immuni_common.helpers.tests import mock_config
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.export import HEADERS_SUFFIX, export
+from immuni_exposure_reporting.helpers.batches import BATCH_FRAME_HEADER
+from immuni_exposure_reporting.helpers.http import compute_digest
+from immuni_exposure_reporting.helpers.manifest import ManifestStore
+from tests.fixtures.batch_file import create_random_batches, generate_random_batch
+from tests.fixtures.batch_file_eu import create_random_batches_eu
+
+
+def _headers(path: Path) -> dict:
+    return json.loads(Path(f"{path}{HEADERS_SUFFIX}").read_text())
+
+
+async def test_export_tree(tmp_path: Path) -> None:
+    create_random_batches(20)
+    create_random_batches_eu(3)
+
+    store = ManifestStore(executor=managers.mongo_executor)
+    written = await export(str(tmp_path), store)
+
+    manifest = store.get_snapshot(None)
+    keys = tmp_path / "v1" / "keys"
+    assert (keys / "index").read_bytes() == manifest.body
+    assert _headers(keys / "index") == {
+        "Content-Type": "application/json",
+        "Cache-Control": "public, max-age=1800",
+    }
+    assert written["national"] == manifest.newest - manifest.oldest + 1
+    for index in range(manifest.oldest, manifest.newest + 1):
+        content = BatchFile.objects.get(index=index).client_content
+        assert (keys / str(index)).read_bytes() == content
+        assert _headers(keys / str(index)) == {
+            "Content-Type": "application/zip",
+            "Cache-Control": "public, max-age=1296000",
+            "ETag": f'"{compute_digest(content)}"',
+        }
+    assert not (keys / str(manifest.oldest - 1)).exists()
+
+    assert (tmp_path / "v2" / "keys" / "index").read_bytes() == await store.get_grouped(None)
+    assert (keys / "since" / "0").read_bytes() == await store.get_since(None, 0)
+    assert (keys / "since" / str(manifest.newest)).read_bytes() == await store.get_since(
+        None, manifest.newest
+    )
+    assert not (keys / "since" / str(manifest.oldest - 2)).exists()
+
+    assert json.loads((keys / "eu" / "index").read_bytes())
+    for country in ("AT", "DE", "DK", "ES"):
+        assert (keys / "eu" / country / "index").exists()
+        assert (keys / "eu" / country / "0").exists()
+        assert (tmp_path / "v2" / "keys" / "eu" / country / "index").exists()
+
+
+@mock_config(config, "MAX_BATCHES_PER_RANGE_REQUEST", 4)
+async def test_export_ranges(tmp_path: Path) -> None:
+    create_random_batches(10)
+    store = ManifestStore(executor=managers.mongo_executor)
+    await export(str(tmp_path), store)
+
+    ranges = tmp_path / "v1" / "keys" / "range"
+    body = (ranges / "8-9").read_bytes()
+    for index in (8, 9):
+        content = BatchFile.objects.get(index=index).client_content
+        assert BATCH_FRAME_HEADER.unpack_from(body) == (index, len(content))
+        body = body[BATCH_FRAME_HEADER.size :]
+        assert body[: len(content)] == content
+        body = body[len(content) :]
+    assert not body
+    assert _headers(ranges / "8-9") == {
+        "Content-Type": "application/octet-stream",
+        "Cache-Control": "public, max-age=1296000",
+    }
+
+    # The last block grows with the new TEK Chunks, and the shorter one is removed.
+    generate_random_batch(
+        index=10, num_keys=1, period_start=datetime.utcnow(), period_end=datetime.utcnow()
+    )
+    await export(str(tmp_path), store)
+    assert sorted(path.name for path in ranges.iterdir() if "." not in path.name) == [
+        "0-3",
+        "4-7",
+        "8-10",
+    ]
+
+
+async def test_export_prunes_old_countries(tmp_path: Path) -> None:
+    create_random_batches_eu(3)
+    store = ManifestStore(executor=managers.mongo_executor)
+    await export(str(tmp_path), store)
+    assert (tmp_path / "v1" / "keys" / "eu" / "DK").exists()
+
+    BatchFileEu.drop_collection()
+    await store.refresh()
+    await export(str(tmp_path), store)
+    for version in ("v1", "v2"):
+        assert not (tmp_path / version / "keys" / "eu" / "DK").exists()
+    assert not (tmp_path / "v1" / "keys" / "eu" / "index").exists()
+
+
+async def test_export_incremental(tmp_path: Path) -> None:
+    create_random_batches(3)
+    store = ManifestStore(executor=managers.mongo_executor)
+    assert await export(str(tmp_path), store) == {"national": 3}
+    assert await export(str(tmp_path), store) == {"national": 0}
+
+
+async def test_export_prunes_old_batches(tmp_path: Path) -> None:
+    create_random_batches(20)
+    keys = tmp_path / "v1" / "keys"
+    keys.mkdir(parents=True)
+    (keys / "1").write_bytes(b"zip")
+    (keys / f"1{HEADERS_SUFFIX}").write_text("{}")
+
+    store = ManifestStore(executor=managers.mongo_executor)
+    await export(str(tmp_path), store)
+
+    assert store.get_snapshot(None).oldest > 1
+    assert not (keys / "1").exists()
+    assert not (keys / f"1{HEADERS_SUFFIX}").exists()
+    assert (keys / "index").exists()
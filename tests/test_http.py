@@ -0,0 +1,64 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Optional, Tuple
+
+import pytest
+from pytest import raises
+
+from immuni_exposure_reporting.core.exceptions import RangeNotSatisfiableException
+from immuni_exposure_reporting.helpers.http import etag_matches, parse_range
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    (
+        (None, False),
+        ("", False),
+        ('"abc"', True),
+        ("*", True),
+        ('W/"abc"', True),
+        ('"xyz", "abc"', True),
+        ('"xyz"', False),
+        ("abc", False),
+    ),
+)
+def test_etag_matches(if_none_match: Optional[str], expected: bool) -> None:
+    assert etag_matches(if_none_match, '"abc"') is expected
+
+
+@pytest.mark.parametrize(
+    "range_header, expected",
+    (
+        (None, None),
+        ("bytes=0-4", (0, 4)),
+        ("bytes=5-", (5, 9)),
+        ("bytes=-3", (7, 9)),
+        ("bytes=-30", (0, 9)),
+        ("bytes=3-100", (3, 9)),
+        ("bytes=9-9", (9, 9)),
+        ("bytes=4-2", None),
+        ("bytes=0-1,3-4", None),
+        ("items=0-1", None),
+        ("bytes=-", None),
+        ("bytes=a-b", None),
+    ),
+)
+def test_parse_range(range_header: Optional[str], expected: Optional[Tuple[int, int]]) -> None:
+    assert parse_range(range_header, 10) == expected
+
+
+@pytest.mark.parametrize("range_header", ("bytes=10-", "bytes=20-30", "bytes=-0"))
+def test_parse_range_not_satisfiable(range_header: str) -> None:
+    with raises(RangeNotSatisfiableException):
+        parse_range(range_header, 10)
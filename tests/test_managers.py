@@ -13,10 +13,14 @@
 
 from unittest.mock import PropertyMock, patch
 
+from pymongo.errors import ConfigurationError
+from pymongo.read_preferences import ReadPreference, SecondaryPreferred
 from pytest import raises
 
 from immuni_common.core.exceptions import ImmuniException
-from immuni_exposure_reporting.core.managers import Managers, managers
+from immuni_common.helpers.tests import mock_config
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import Managers, managers, mongo_client_options
 
 
 def test_otp_failure() -> None:
@@ -29,3 +33,37 @@ def test_otp_failure() -> None:
 async def test_teardown_on_uninitialized() -> None:
     uninitialized_managers = Managers()
     await uninitialized_managers.teardown()
+
+
+def test_mongo_executor_failure() -> None:
+    with patch.object(Managers, "_mongo_executor", new_callable=PropertyMock) as mock:
+        mock.return_value = None
+        with raises(ImmuniException):
+            managers.mongo_executor
+
+
+def test_mongo_executor_bounded() -> None:
+    assert managers.mongo_executor._max_workers == config.MONGO_EXECUTOR_MAX_WORKERS
+
+
+def test_mongo_client_options_default() -> None:
+    options = mongo_client_options()
+    assert options["maxPoolSize"] == config.MONGO_MAX_POOL_SIZE
+    assert options["waitQueueTimeoutMS"] is None
+    assert options["read_preference"] == ReadPreference.PRIMARY
+    assert managers.exposure_mongo.read_preference == ReadPreference.PRIMARY
+
+
+def test_mongo_client_options_secondary_preferred() -> None:
+    with mock_config(config, "MONGO_READ_PREFERENCE", "secondaryPreferred"), mock_config(
+        config, "MONGO_MAX_STALENESS_IN_SECONDS", 120
+    ), mock_config(config, "MONGO_WAIT_QUEUE_TIMEOUT_IN_MILLISECONDS", 500):
+        options = mongo_client_options()
+    assert options["read_preference"] == SecondaryPreferred(max_staleness=120)
+    assert options["waitQueueTimeoutMS"] == 500
+
+
+def test_mongo_client_options_invalid_staleness() -> None:
+    with mock_config(config, "MONGO_MAX_STALENESS_IN_SECONDS", 120):
+        with raises(ConfigurationError):
+            mongo_client_options()
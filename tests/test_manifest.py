@@ -0,0 +1,305 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from pytest_sanic.utils import TestClient
+
+from immuni_common.helpers.tests import mock_config
+from immuni_common.models.mongoengine.batch_file import BatchFile
+from immuni_common.models.mongoengine.batch_file_eu import BatchFileEu
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.helpers.batch_index import BatchIndex
+from immuni_exposure_reporting.helpers.catalog import BatchEntry, fetch_batch_entries
+from immuni_exposure_reporting.helpers.manifest import Manifest, ManifestStore
+from tests.fixtures.batch_file import create_random_batches, generate_random_batch
+from tests.fixtures.batch_file_eu import create_random_batches_eu, generate_random_batch_eu
+
+
+def test_manifest_body() -> None:
+    assert Manifest.from_indexes(oldest=3, newest=7).body == b'{"oldest":3,"newest":7}'
+
+
+def _entry(index: int, period_end: datetime) -> BatchEntry:
+    return BatchEntry.from_document(
+        dict(
+            index=index,
+            client_content=b"zip" * index,
+            period_start=period_end - timedelta(days=1),
+            period_end=period_end,
+        )
+    )
+
+
+def test_batch_index() -> None:
+    start = datetime(2020, 10, 1)
+    batch_index = BatchIndex()
+    assert batch_index.newest is None
+    assert batch_index.oldest(start) is None
+
+    batch_index.update([_entry(index, start + timedelta(days=index)) for index in (1, 2, 4)], start)
+    assert batch_index.newest == 4
+    assert batch_index.oldest(start) == 1
+    assert batch_index.oldest(start + timedelta(days=3)) == 4
+    assert batch_index.oldest(start + timedelta(days=5)) is None
+    assert 2 in batch_index
+    assert 3 not in batch_index
+    assert batch_index.between(2, 10) == {2: 6, 4: 12}
+    assert batch_index.between(5, 10) == {}
+
+
+def test_batch_index_update() -> None:
+    start = datetime(2020, 10, 1)
+    batch_index = BatchIndex()
+    batch_index.update(
+        [_entry(index, start + timedelta(days=index)) for index in range(1, 6)], start
+    )
+    batch_index.update(
+        [_entry(5, start), _entry(6, start + timedelta(days=1))], start + timedelta(days=3)
+    )
+    assert len(batch_index) == 4
+    assert list(batch_index.between(0, 10)) == [3, 4, 5, 6]
+    # Periods out of order do not bring older TEK Chunks back within the window.
+    assert batch_index.oldest(start + timedelta(days=4)) == 4
+
+
+async def test_index_window_moves(client: TestClient) -> None:
+    create_random_batches(10)
+    await managers.manifest_store.refresh()
+
+    with mock_config(config, "MANIFEST_LENGTH_IN_DAYS", 5):
+        await managers.manifest_store.refresh()
+        response = await client.get("/v1/keys/index")
+        assert await response.json() == {"oldest": 5, "newest": 9}
+        assert managers.manifest_store.is_missing(None, 4)
+
+    with mock_config(config, "MANIFEST_LENGTH_IN_DAYS", 0):
+        await managers.manifest_store.refresh()
+        response = await client.get("/v1/keys/index")
+        assert response.status == 404
+
+
+async def test_index_served_from_snapshot(client: TestClient) -> None:
+    create_random_batches(10)
+    await managers.manifest_store.refresh()
+    BatchFile.drop_collection()
+
+    response = await client.get("/v1/keys/index")
+    assert response.status == 200
+    assert await response.json() == {"oldest": 0, "newest": 9}
+
+    await managers.manifest_store.refresh()
+    response = await client.get("/v1/keys/index")
+    assert response.status == 404
+
+
+async def test_index_eu_served_from_snapshot(client: TestClient) -> None:
+    create_random_batches_eu(10)
+    await managers.manifest_store.refresh()
+    BatchFileEu.drop_collection()
+
+    response = await client.get("/v1/keys/eu/DK/index")
+    assert response.status == 200
+    assert await response.json() == {"oldest": 0, "newest": 9}
+
+    await managers.manifest_store.refresh()
+    response = await client.get("/v1/keys/eu/DK/index")
+    assert response.status == 404
+
+
+async def test_index_eu_leaving_window_evicted(client: TestClient) -> None:
+    create_random_batches_eu(10)
+    await managers.manifest_store.refresh()
+
+    with mock_config(config, "MANIFEST_LENGTH_IN_DAYS", 0):
+        await managers.manifest_store.refresh(full=False)
+        assert managers.manifest_store.eu_countries == []
+        response = await client.get("/v1/keys/eu/DK/index")
+        assert response.status == 404
+        response = await client.get("/v1/keys/eu/index")
+        assert response.status == 404
+
+
+async def test_incremental_refresh_only_fetches_new_batches(client: TestClient) -> None:
+    now = datetime.utcnow()
+    for index in (0, 1, 3):
+        generate_random_batch(index=index, num_keys=1, period_start=now, period_end=now)
+    await managers.manifest_store.refresh()
+    # A TEK Chunk committed out of index order, e.g., by a slower concurrent insertion.
+    generate_random_batch(index=2, num_keys=1, period_start=now, period_end=now)
+
+    await managers.manifest_store.refresh(full=False)
+    assert managers.manifest_store.is_missing(None, 2)
+
+    await managers.manifest_store.refresh()
+    assert not managers.manifest_store.is_missing(None, 2)
+    response = await client.get("/v1/keys/2")
+    assert response.status == 200
+
+
+async def test_full_refresh_interval() -> None:
+    create_random_batches(3)
+    store = ManifestStore(executor=managers.mongo_executor)
+    with mock_config(config, "MANIFEST_REFRESH_INTERVAL_IN_SECONDS", 0):
+        task = asyncio.create_task(store.run())
+        try:
+            while store.get_snapshot(None) is None:
+                await asyncio.sleep(0.01)
+            BatchFile.drop_collection()
+            await asyncio.sleep(0.1)
+            # Only incremental refreshes happen within the full refresh interval.
+            assert store.get_snapshot(None).newest == 2
+
+            with mock_config(config, "MANIFEST_FULL_REFRESH_INTERVAL_IN_SECONDS", 0):
+                while store.get_snapshot(None) is not None:
+                    await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_full_refresh_only_describes_new_batches() -> None:
+    create_random_batches(3)
+    create_random_batches_eu(3)
+    store = ManifestStore(executor=managers.mongo_executor)
+    await store.refresh()
+    generate_random_batch(
+        index=3, num_keys=1, period_start=datetime.utcnow(), period_end=datetime.utcnow()
+    )
+
+    with patch.object(
+        BatchEntry, "from_document", side_effect=BatchEntry.from_document
+    ) as from_document:
+        await store.refresh()
+    # The zip files of the TEK Chunks already known are neither fetched nor hashed again.
+    assert [call.args[0]["index"] for call in from_document.call_args_list] == [3]
+    assert store.get_snapshot(None).newest == 3
+    assert set(store.eu_countries) == {"AT", "DE", "DK", "ES"}
+
+
+async def test_concurrent_cold_refreshes_coalesced() -> None:
+    create_random_batches(3)
+    store = ManifestStore(executor=managers.mongo_executor)
+    with patch(
+        "immuni_exposure_reporting.helpers.manifest.fetch_batch_entries",
+        side_effect=fetch_batch_entries,
+    ) as fetch:
+        manifests = await asyncio.gather(*(store.get(None) for _ in range(5)))
+    assert fetch.call_count == 1
+    assert all(manifest is manifests[0] for manifest in manifests)
+
+
+async def test_get_sizes() -> None:
+    create_random_batches(5)
+    store = ManifestStore(executor=managers.mongo_executor)
+    assert store.get_sizes(None, 0, 10) == {}
+
+    await store.refresh()
+    assert store.get_sizes(None, 1, 2) == {
+        index: len(BatchFile.from_index(index).client_content) for index in (1, 2)
+    }
+    assert store.get_sizes(None, 5, 10) == {}
+
+
+async def test_eu_manifests() -> None:
+    create_random_batches_eu(20)
+    generate_random_batch_eu(
+        index=1,
+        num_keys=1,
+        period_start=datetime.utcnow() - timedelta(days=1),
+        period_end=datetime.utcnow(),
+        origin="FR",
+    )
+    store = ManifestStore(executor=managers.mongo_executor)
+
+    await store.refresh()
+    assert set(store.eu_countries) == {"AT", "DE", "DK", "ES", "FR"}
+    for country in store.eu_countries:
+        manifest = store.get_snapshot(country)
+        assert BatchFileEu.get_oldest_and_newest_indexes(
+            country=country, days=config.MANIFEST_LENGTH_IN_DAYS
+        ) == {"oldest": manifest.oldest, "newest": manifest.newest}
+
+
+async def test_eu_manifests_exclude_old_countries() -> None:
+    create_random_batches_eu(5, end_date=datetime.utcnow() - timedelta(days=30))
+    store = ManifestStore(executor=managers.mongo_executor)
+    await store.refresh()
+    assert store.eu_countries == []
+
+
+async def test_index_eu_all_served_from_snapshot(client: TestClient) -> None:
+    create_random_batches_eu(10)
+    await managers.manifest_store.refresh()
+    BatchFileEu.drop_collection()
+
+    response = await client.get("/v1/keys/eu/index")
+    assert response.status == 200
+    assert set(await response.json()) == {"AT", "DE", "DK", "ES"}
+
+
+async def test_batch_lookup_short_circuited(client: TestClient) -> None:
+    create_random_batches(5)
+    BatchFile.objects(index=2).delete()
+    await managers.manifest_store.refresh()
+    generate_random_batch(
+        index=2, num_keys=1, period_start=datetime.utcnow(), period_end=datetime.utcnow()
+    )
+
+    assert managers.manifest_store.is_missing(None, 2)
+    response = await client.get("/v1/keys/2")
+    assert response.status == 404
+    assert "Cache-Control" not in response.headers
+
+
+async def test_batch_lookup_after_newest(client: TestClient) -> None:
+    create_random_batches(5)
+    await managers.manifest_store.refresh()
+    # Created since the snapshot, and possibly already listed by the manifests of other workers.
+    generate_random_batch(
+        index=5, num_keys=1, period_start=datetime.utcnow(), period_end=datetime.utcnow()
+    )
+
+    assert not managers.manifest_store.is_missing(None, 5)
+    response = await client.get("/v1/keys/5")
+    assert response.status == 200
+
+
+async def test_batch_lookup_in_range(client: TestClient) -> None:
+    create_random_batches(5)
+    await managers.manifest_store.refresh()
+
+    assert not managers.manifest_store.is_missing(None, 4)
+    response = await client.get("/v1/keys/4")
+    assert response.status == 200
+
+
+async def test_batch_lookup_without_snapshot(client: TestClient) -> None:
+    assert not managers.manifest_store.is_missing(None, 1)
+    assert not managers.manifest_store.is_missing("DK", 1)
+
+
+@mock_config(config, "MANIFEST_REFRESH_INTERVAL_IN_SECONDS", 0)
+async def test_batch_lookup_stale_snapshot(client: TestClient) -> None:
+    create_random_batches(5)
+    await managers.manifest_store.refresh()
+    generate_random_batch(
+        index=5, num_keys=1, period_start=datetime.utcnow(), period_end=datetime.utcnow()
+    )
+
+    assert not managers.manifest_store.is_missing(None, 5)
+    response = await client.get("/v1/keys/5")
+    assert response.status == 200
@@ -0,0 +1,32 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from pytest_sanic.utils import TestClient
+
+from immuni_common.models.mongoengine.batch_file import BatchFile
+
+
+async def test_route_metrics(client: TestClient, batch_file: BatchFile) -> None:
+    response = await client.get("/v1/keys/1")
+    assert response.status == 200
+    response = await client.get("/v1/keys/abc/def")
+    assert response.status == 404
+
+    response = await client.get("/metrics")
+    assert response.status == 200
+    metrics = await response.text()
+    assert '/keys/<batch_index>",status="200"}' in metrics
+    assert 'route="unmatched",status="404"' in metrics
+    assert 'route_response_size_bytes_count{route="' in metrics
+    assert "requests_in_flight" in metrics
+    assert 'mongo_query_latency_seconds_count{operation="fetch_batch_content"}' in metrics
@@ -0,0 +1,39 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from unittest.mock import MagicMock, patch
+
+from immuni_exposure_reporting.monitoring import mongo
+from immuni_exposure_reporting.monitoring.mongo import PoolCheckoutListener
+
+
+def test_checkout_wait_observed() -> None:
+    listener = PoolCheckoutListener()
+    with patch.object(mongo, "MONGO_POOL_CHECKOUT_WAIT") as wait_mock:
+        listener.connection_check_out_started(MagicMock())
+        listener.connection_checked_out(MagicMock())
+        listener.connection_checked_out(MagicMock())
+    wait_mock.observe.assert_called_once()
+    assert wait_mock.observe.call_args[0][0] >= 0
+
+
+def test_checkout_failure_counted() -> None:
+    listener = PoolCheckoutListener()
+    with patch.object(mongo, "MONGO_POOL_CHECKOUT_FAILURES") as failures_mock, patch.object(
+        mongo, "MONGO_POOL_CHECKOUT_WAIT"
+    ) as wait_mock:
+        listener.connection_check_out_started(MagicMock())
+        listener.connection_check_out_failed(MagicMock(reason="timeout"))
+        listener.connection_checked_out(MagicMock())
+    failures_mock.labels.assert_called_once_with(reason="timeout")
+    wait_mock.observe.assert_not_called()
@@ -0,0 +1,59 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+from immuni_exposure_reporting.helpers.profiler import SamplingProfiler, collapse_stack
+
+
+def test_collapse_stack() -> None:
+    stack = collapse_stack("MainThread", sys._getframe())  # pylint: disable=protected-access
+    frames = stack.split(";")
+    assert frames[0] == "MainThread"
+    assert frames[-1].startswith("test_collapse_stack (")
+
+
+def test_profiler_samples_other_threads() -> None:
+    stop = threading.Event()
+
+    def _busy() -> None:
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=_busy, name="busy")
+    thread.start()
+    try:
+        stacks = SamplingProfiler(interval=0.001, duration=0.05, directory="").sample()
+    finally:
+        stop.set()
+        thread.join()
+    assert any(stack.startswith("busy;") and "_busy (" in stack for stack in stacks)
+    assert not any(stack.startswith("profiler;") for stack in stacks)
+
+
+def test_profiler_writes_profile(tmp_path: Path) -> None:
+    profiler = SamplingProfiler(interval=0.001, duration=0.05, directory=str(tmp_path))
+    assert profiler.start()
+    assert not profiler.start()
+    while profiler.running:
+        time.sleep(0.01)
+
+    (profile,) = tmp_path.iterdir()
+    assert profile.name.endswith(".collapsed")
+    for line in profile.read_text().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack
+        assert int(count) > 0
@@ -0,0 +1,137 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Tuple
+
+from immuni_exposure_reporting.helpers.chunked_content import ChunkedContent
+from immuni_exposure_reporting.helpers.shared_batch_store import SharedBatchStore
+
+
+def test_store_shared_across_instances(tmp_path: Path) -> None:
+    path = str(tmp_path / "batches")
+    writer = SharedBatchStore(path=path, max_size=1000)
+    reader = SharedBatchStore(path=path, max_size=1000)
+
+    assert reader.get((None, 1)) is None
+    writer.put((None, 1), b"zip", "a" * 64)
+    writer.put(("DK", 1), b"zip_dk", "b" * 64)
+
+    assert bytes(reader.get((None, 1))) == b"zip"
+    assert bytes(reader.get(("DK", 1))) == b"zip_dk"
+    assert reader.get_digest(("DK", 1)) == "b" * 64
+    assert reader.hits == 2
+    assert reader.misses == 1
+    assert len(reader) == 2
+
+
+def test_store_put_existing(tmp_path: Path) -> None:
+    store = SharedBatchStore(path=str(tmp_path / "batches"), max_size=1000)
+    store.put((None, 1), b"zip", "a" * 64)
+    size = store.size
+    store.put((None, 1), b"zip", "a" * 64)
+    assert store.size == size
+
+
+def test_store_reset_when_full(tmp_path: Path) -> None:
+    path = str(tmp_path / "batches")
+    writer = SharedBatchStore(path=path, max_size=500)
+    reader = SharedBatchStore(path=path, max_size=500)
+    for index in range(5):
+        writer.put((None, index), b"0" * 100, "a" * 64)
+
+    assert reader.get((None, 0)) is None
+    assert bytes(reader.get((None, 4))) == b"0" * 100
+    assert len(reader) == len(writer)
+
+
+def test_store_too_large(tmp_path: Path) -> None:
+    store = SharedBatchStore(path=str(tmp_path / "batches"), max_size=100)
+    store.put((None, 1), b"0" * 100, "a" * 64)
+    assert store.get((None, 1)) is None
+    assert store.get_digest((None, 1)) == "a" * 64
+
+
+def test_store_loaded_once(tmp_path: Path) -> None:
+    path = str(tmp_path / "batches")
+    first = SharedBatchStore(path=path, max_size=1000)
+    second = SharedBatchStore(path=path, max_size=1000)
+
+    assert first.load((None, 1), lambda: (b"zip", "a" * 64)) == b"zip"
+    assert bytes(second.load((None, 1), lambda: (b"other", "b" * 64))) == b"zip"
+    assert second.get_digest((None, 1)) == "a" * 64
+
+
+def test_store_concurrent_loads_coalesced(tmp_path: Path) -> None:
+    path = str(tmp_path / "batches")
+    # Each instance has its own lock file descriptor, as the workers of the same host do.
+    stores = [SharedBatchStore(path=path, max_size=1000) for _ in range(4)]
+    loads = []
+
+    def _load() -> Tuple[bytes, str]:
+        loads.append(None)
+        time.sleep(0.05)
+        return b"zip", "a" * 64
+
+    with ThreadPoolExecutor(max_workers=len(stores)) as executor:
+        contents = list(executor.map(lambda store: store.load((None, 1), _load), stores))
+    assert len(loads) == 1
+    assert [bytes(content) for content in contents] == [b"zip"] * len(stores)
+
+
+def test_store_load_chunked(tmp_path: Path) -> None:
+    store = SharedBatchStore(path=str(tmp_path / "batches"), max_size=1000)
+    chunked = ChunkedContent(file_id=1, length=10_000, digest="a" * 64)
+
+    assert store.load((None, 1), lambda: (chunked, chunked.digest)) == chunked
+    assert store.get((None, 1)) is None
+    assert store.get_chunked((None, 1)) == chunked
+
+
+def test_store_filled_once(tmp_path: Path) -> None:
+    path = str(tmp_path / "batches")
+    first = SharedBatchStore(path=path, max_size=1000)
+    second = SharedBatchStore(path=path, max_size=1000)
+
+    batches = {(None, 1): (b"zip", "a" * 64)}
+    assert first.fill(lambda: batches) == batches
+    assert second.fill(lambda: {(None, 2): (b"zip", "a" * 64)}) == dict()
+    assert bytes(second.get((None, 1))) == b"zip"
+    assert second.get((None, 2)) is None
+
+
+def test_store_fill_larger_than_store(tmp_path: Path) -> None:
+    store = SharedBatchStore(path=str(tmp_path / "batches"), max_size=500)
+    store.put((None, 9), b"0" * 100, "a" * 64)
+    batches = {(None, index): (b"0" * 100, "a" * 64) for index in range(5)}
+
+    assert store.fill(lambda: batches) == batches
+    # The store is emptied once, and the TEK Chunks are stored until it is full.
+    assert store.get((None, 9)) is None
+    assert bytes(store.get((None, 0))) == b"0" * 100
+    assert bytes(store.get((None, 1))) == b"0" * 100
+    assert store.get((None, 4)) is None
+    assert store.get_digest((None, 4)) == "a" * 64
+
+
+def test_store_resized_by_another_worker(tmp_path: Path) -> None:
+    path = str(tmp_path / "batches")
+    first = SharedBatchStore(path=path, max_size=1000)
+    first.put((None, 1), b"zip", "a" * 64)
+    second = SharedBatchStore(path=path, max_size=500)
+    second.put((None, 2), b"zip", "a" * 64)
+
+    assert first.get((None, 1)) is None
+    assert bytes(first.get((None, 2))) == b"zip"
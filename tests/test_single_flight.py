@@ -0,0 +1,87 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+
+from pytest import raises
+
+from immuni_exposure_reporting.helpers.single_flight import SingleFlight
+
+
+async def test_single_flight_coalesces() -> None:
+    calls = []
+
+    async def _function() -> int:
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return 42
+
+    flights: SingleFlight[str, int] = SingleFlight()
+    results = await asyncio.gather(*(flights.run("key", _function) for _ in range(5)))
+
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert flights.coalesced == 4
+    assert flights.peak_fan_in == 5
+
+
+async def test_single_flight_distinct_keys() -> None:
+    async def _function() -> int:
+        await asyncio.sleep(0.01)
+        return 42
+
+    flights: SingleFlight[str, int] = SingleFlight()
+    await asyncio.gather(flights.run("first", _function), flights.run("second", _function))
+    assert flights.coalesced == 0
+    assert flights.peak_fan_in == 1
+
+
+async def test_single_flight_not_coalesced_once_landed() -> None:
+    calls = []
+
+    async def _function() -> int:
+        calls.append(None)
+        return 42
+
+    flights: SingleFlight[str, int] = SingleFlight()
+    await flights.run("key", _function)
+    await flights.run("key", _function)
+    assert len(calls) == 2
+    assert flights.coalesced == 0
+
+
+async def test_single_flight_exception() -> None:
+    async def _function() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError()
+
+    flights: SingleFlight[str, int] = SingleFlight()
+    for result in await asyncio.gather(
+        *(flights.run("key", _function) for _ in range(3)), return_exceptions=True
+    ):
+        assert isinstance(result, ValueError)
+    with raises(ValueError):
+        await flights.run("key", _function)
+
+
+async def test_single_flight_survives_cancellation() -> None:
+    async def _function() -> int:
+        await asyncio.sleep(0.01)
+        return 42
+
+    flights: SingleFlight[str, int] = SingleFlight()
+    first = asyncio.ensure_future(flights.run("key", _function))
+    second = asyncio.ensure_future(flights.run("key", _function))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == 42
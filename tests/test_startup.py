@@ -0,0 +1,59 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sanic import Sanic
+from sanic_openapi import swagger_blueprint
+
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.helpers.openapi import _DisabledDoc, remove_openapi
+
+
+def test_disabled_doc() -> None:
+    def handler() -> None:
+        pass
+
+    doc = _DisabledDoc()
+    assert doc.summary("Summary.")(handler) is handler
+    assert doc.response(200, None, description="Description.")(handler) is handler
+    assert doc.exclude(True)(handler) is handler
+
+
+def test_remove_openapi() -> None:
+    app = Sanic("test_remove_openapi")
+    app.blueprint(swagger_blueprint)
+    assert app.listeners["before_server_start"]
+
+    remove_openapi(app)
+    assert "swagger" not in app.blueprints
+    assert not app.listeners["before_server_start"]
+    assert not [uri for uri in app.router.routes_all if uri.startswith("/swagger")]
+
+
+@pytest.mark.parametrize("openapi_enabled", ("true", "false"))
+def test_startup_within_budget(openapi_enabled: str) -> None:
+    result = subprocess.run(
+        [sys.executable, "-m", "immuni_exposure_reporting.startup"],
+        stdout=subprocess.PIPE,
+        env={**os.environ, "OPENAPI_ENABLED": openapi_enabled},
+        check=False,
+    )
+    report = json.loads(result.stdout.decode().splitlines()[-1])
+    assert set(report) == {"imports", "app_creation", "server_start", "total", "budget"}
+    assert report["total"] <= config.STARTUP_BUDGET_IN_SECONDS
+    assert result.returncode == 0
@@ -0,0 +1,120 @@
+#    Copyright (C) 2020 Presidenza del Consiglio dei Ministri.
+#    Please refer to the AUTHORS file for more information.
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#    GNU Affero General Public License for more details.
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from contextlib import contextmanager
+from typing import Iterator
+from unittest.mock import MagicMock, patch
+
+from immuni_common.helpers.tests import mock_config
+from immuni_exposure_reporting.core import config
+from immuni_exposure_reporting.core.managers import managers
+from immuni_exposure_reporting.gunicorn_config import when_ready
+from immuni_exposure_reporting.helpers import warmup
+from immuni_exposure_reporting.helpers.warmup import (
+    load_batches,
+    release_preloaded_batches,
+    warm_up,
+)
+from immuni_exposure_reporting.models.enums import WarmupMode
+from tests.fixtures.batch_file import create_random_batches
+from tests.fixtures.batch_file_eu import create_random_batches_eu
+
+
+def test_load_batches_within_manifest_window() -> None:
+    create_random_batches(20)
+    create_random_batches_eu(20)
+
+    batches = load_batches()
+    national = sorted(index for country, index in batches if country is None)
+    danish = sorted(index for country, index in batches if country == "DK")
+    assert national == list(range(20 - config.MANIFEST_LENGTH_IN_DAYS, 20))
+    assert danish == list(range(20 - config.MANIFEST_LENGTH_IN_DAYS, 20))
+
+
+async def test_warm_up_disabled() -> None:
+    create_random_batches(5)
+    with mock_config(config, "WARMUP_MODE", WarmupMode.DISABLED):
+        await warm_up(None, None)
+    assert len(managers.batch_cache) == 0
+
+
+async def test_warm_up_worker() -> None:
+    create_random_batches(5)
+    create_random_batches_eu(5)
+    with mock_config(config, "WARMUP_MODE", WarmupMode.WORKER):
+        await warm_up(None, None)
+
+    assert len(managers.batch_cache) == len(load_batches())
+    assert managers.batch_cache.get((None, 4)) is not None
+    assert managers.batch_cache.get(("DK", 4)) is not None
+    assert managers.manifest_store.get_snapshot(None).newest == 4
+
+
+@contextmanager
+def _preloaded(age_in_seconds: float) -> Iterator[MagicMock]:
+    with patch.object(warmup, "_preloaded_batches", {(None, 1): (b"zip", "digest")}):
+        with patch.object(warmup, "_preloaded_at", time.monotonic() - age_in_seconds):
+            with patch.object(warmup, "_log_warmup") as log_mock:
+                yield log_mock
+
+
+@mock_config(config, "WARMUP_MODE", WarmupMode.PRELOAD)
+async def test_warm_up_preloaded() -> None:
+    create_random_batches(5)
+    with _preloaded(age_in_seconds=0) as log_mock:
+        await warm_up(None, None)
+        # Released by the worker once warmed up, while still referenced by the cache.
+        assert not warmup._preloaded_batches  # pylint: disable=protected-access
+
+    assert len(managers.batch_cache) == 1
+    assert managers.batch_cache.get((None, 1)) == b"zip"
+    assert log_mock.call_args[0][0] == WarmupMode.PRELOAD
+
+
+@mock_config(config, "WARMUP_MODE", WarmupMode.PRELOAD)
+async def test_warm_up_preloaded_too_old() -> None:
+    create_random_batches(5)
+    with _preloaded(age_in_seconds=config.WARMUP_PRELOAD_MAX_AGE_IN_SECONDS + 1) as log_mock:
+        await warm_up(None, None)
+
+    # Workers forked long after the preload load the TEK Chunks of the current window instead.
+    assert len(managers.batch_cache) == len(load_batches())
+    assert log_mock.call_args[0][0] == WarmupMode.WORKER
+
+
+@mock_config(config, "WARMUP_MODE", WarmupMode.PRELOAD)
+async def test_warm_up_preloaded_released() -> None:
+    create_random_batches(5)
+    with _preloaded(age_in_seconds=0) as log_mock:
+        release_preloaded_batches()
+        await warm_up(None, None)
+
+    assert len(managers.batch_cache) == len(load_batches())
+    assert log_mock.call_args[0][0] == WarmupMode.WORKER
+
+
+@mock_config(config, "WARMUP_MODE", WarmupMode.PRELOAD)
+@mock_config(config, "WARMUP_PRELOAD_MAX_AGE_IN_SECONDS", 0)
+def test_when_ready_releases_preloaded() -> None:
+    with _preloaded(age_in_seconds=0), patch(
+        "immuni_exposure_reporting.gunicorn_config.preload_batches"
+    ) as preload_mock:
+        preloaded = warmup._preloaded_batches  # pylint: disable=protected-access
+        when_ready(None)
+        deadline = time.monotonic() + 5
+        # The master releases the preloaded TEK Chunks once too old for the workers to use them.
+        while preloaded and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not preloaded
+    preload_mock.assert_called_once_with()